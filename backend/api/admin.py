@@ -2,9 +2,11 @@ from django.contrib import admin
 from .models import (
     BrandGuideline,
     UploadedCampaign,
+    Campaign,
     LinkedInScrape,
     TrustpilotScrape,
     WebsiteScrape,
+    Job,
 )
 
 
@@ -22,6 +24,13 @@ class UploadedCampaignAdmin(admin.ModelAdmin):
     search_fields = ("filename", "user__username")
 
 
+@admin.register(Campaign)
+class CampaignAdmin(admin.ModelAdmin):
+    list_display = ("id", "upload", "position", "title")
+    search_fields = ("title", "content", "upload__filename")
+    raw_id_fields = ("upload",)
+
+
 @admin.register(LinkedInScrape)
 class LinkedInScrapeAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "url", "created_at")
@@ -41,3 +50,10 @@ class WebsiteScrapeAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "url", "created_at")
     search_fields = ("url", "user__username")
     list_filter = ("created_at", "user")
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "status", "user", "created_at", "started_at", "finished_at")
+    list_filter = ("kind", "status", "created_at")
+    search_fields = ("kind", "error", "user__username")
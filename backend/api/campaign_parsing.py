@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import codecs
+import csv
+import io
+import json
+import re
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator
+
+try:  # optional: incremental JSON parsing; without it JSON uploads are parsed in one go
+    import ijson
+except ImportError:  # pragma: no cover
+    ijson = None
+
+
+# Streaming parsers for uploaded campaign exports. Each reads a binary file object
+# incrementally and yields normalized {"title", "content", ["meta"]} records, so
+# memory stays flat regardless of the file size.
+
+_TITLE_KEYS = ("title", "subject", "Subject", "Title")
+_CONTENT_KEYS = ("content", "body", "Body", "Content")
+_TXT_SEPARATOR = re.compile(r"[-=]{3,}")
+# json.JSONDecodeError is a ValueError; ijson's errors (e.g. a truncated file) are not
+_JSON_ERRORS = (ValueError, ijson.JSONError) if ijson is not None else (ValueError,)
+
+
+class CampaignParseError(ValueError):
+    """The upload is not a valid file of its type (e.g. corrupt or truncated JSON)."""
+
+
+def normalize_record(record: dict) -> dict:
+    title = next((record.get(k) for k in _TITLE_KEYS if record.get(k)), None) or "Untitled"
+    content = next((record.get(k) for k in _CONTENT_KEYS if record.get(k)), None) or ""
+    normalized = {"title": str(title).strip(), "content": str(content).strip()}
+    # include other keys as metadata if present
+    extras = {k: v for k, v in record.items() if k not in _TITLE_KEYS + _CONTENT_KEYS}
+    if extras:
+        normalized["meta"] = extras
+    return normalized
+
+
+def campaign_text(item) -> str | None:
+    """Text indexed for one parsed campaign (a single chunk), or None if it is empty."""
+    if not isinstance(item, dict):
+        return None
+    title = str(item.get("title") or "").strip()
+    body = str(item.get("content") or "").strip()
+    if not title and not body:
+        return None
+    return f"{title}\n{body}" if title else body
+
+
+@contextmanager
+def _text(fh: BinaryIO):
+    wrapper = io.TextIOWrapper(fh, encoding="utf-8", errors="replace", newline="")
+    try:
+        yield wrapper
+    finally:
+        wrapper.detach()  # leave the underlying upload open for the caller
+
+
+def iter_csv(fh: BinaryIO) -> Iterator[dict]:
+    with _text(fh) as text:
+        try:
+            for row in csv.DictReader(text):
+                if any(v for v in row.values()):
+                    yield normalize_record(row)
+        except csv.Error:
+            return
+
+
+def _txt_record(lines: list[str]) -> dict:
+    return {"title": lines[0][:120], "content": "\n".join(lines[1:])}
+
+
+def iter_txt(fh: BinaryIO) -> Iterator[dict]:
+    """Blocks separated by blank lines or lines of dashes/equals; first line is the title."""
+    block: list[str] = []
+    with _text(fh) as text:
+        for raw in text:
+            line = raw.strip()
+            if not line or _TXT_SEPARATOR.fullmatch(line):
+                if block:
+                    yield _txt_record(block)
+                    block = []
+                continue
+            block.append(line)
+    if block:
+        yield _txt_record(block)
+
+
+def _first_byte(fh: BinaryIO) -> bytes:
+    """First non-whitespace byte of the document; leaves `fh` positioned after any UTF-8 BOM."""
+    start = fh.tell()
+    if fh.read(3) == codecs.BOM_UTF8:
+        start += 3
+    fh.seek(start)
+    b = fh.read(1)
+    while b and b.isspace():
+        b = fh.read(1)
+    fh.seek(start)
+    return b
+
+
+def _json_records(data) -> list:
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        return data["campaigns"] if isinstance(data.get("campaigns"), list) else [data]
+    return []
+
+
+def iter_json(fh: BinaryIO) -> Iterator[dict]:
+    """A list of records, {"campaigns": [...]}, or a single record."""
+    first = _first_byte(fh)
+    try:
+        if ijson is not None and first == b"[":
+            records = ijson.items(fh, "item", use_float=True)
+        elif ijson is not None and first == b"{":
+            start = fh.tell()
+            streamed = False
+            for record in ijson.items(fh, "campaigns.item", use_float=True):
+                streamed = True
+                if isinstance(record, dict):
+                    yield normalize_record(record)
+            if streamed:
+                return
+            # Not a campaigns wrapper: a single record object
+            fh.seek(start)
+            with _text(fh) as text:
+                records = _json_records(json.load(text))
+        else:
+            with _text(fh) as text:
+                records = _json_records(json.load(text))
+        for record in records:
+            if isinstance(record, dict):
+                yield normalize_record(record)
+    except _JSON_ERRORS as exc:
+        # Records yielded before the error may already be stored; the caller must discard them
+        raise CampaignParseError(f"Invalid JSON file: {exc}") from exc
+
+
+PARSERS = {"csv": iter_csv, "txt": iter_txt, "json": iter_json}
+
+
+def iter_campaigns(fh: BinaryIO, file_type: str) -> Iterator[dict]:
+    return PARSERS[file_type](fh)
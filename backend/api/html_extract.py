@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import re
+from typing import Iterator
+from urllib.parse import urljoin
+
+import lxml.html
+import trafilatura
+from lxml import etree
+
+
+# Single-parse HTML/XML helpers for the scrapers. Each fetched document is parsed
+# once into an lxml tree; link discovery, title lookup and trafilatura's main-content
+# extraction all work on that tree instead of building separate BeautifulSoup trees.
+
+_HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+_XML_PARSER = etree.XMLParser(recover=True, resolve_entities=False, no_network=True)
+_XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>")
+
+
+def parse_html(doc: str | None) -> lxml.html.HtmlElement | None:
+    if not doc or not doc.strip():
+        return None
+    try:
+        # Encode ourselves: lxml rejects str input that carries an encoding declaration
+        return lxml.html.document_fromstring(doc.encode("utf-8", "replace"), parser=_HTML_PARSER)
+    except (etree.ParserError, ValueError):
+        return None
+
+
+def parse_xml(doc: str | None) -> etree._Element | None:
+    """Parse a feed or sitemap leniently (the text is already decoded, so its XML declaration is dropped)."""
+    if not doc or not doc.strip():
+        return None
+    try:
+        return etree.fromstring(_XML_DECLARATION.sub("", doc, count=1).encode("utf-8", "replace"), parser=_XML_PARSER)
+    except (etree.XMLSyntaxError, ValueError):
+        return None
+
+
+def _local(el) -> str:
+    return etree.QName(el).localname if isinstance(el.tag, str) else ""
+
+
+def iter_local(root, *names: str) -> Iterator[etree._Element]:
+    """Elements whose tag, ignoring any XML namespace, is one of `names`."""
+    for el in root.iter():
+        if _local(el) in names:
+            yield el
+
+
+def _text(el) -> str:
+    return " ".join("".join(el.itertext()).split())
+
+
+def page_title(tree) -> str:
+    for path in (".//h1", ".//title"):
+        el = tree.find(path)
+        if el is not None:
+            return _text(el)
+    return "Untitled"
+
+
+def visible_text(tree) -> str:
+    """Whitespace-collapsed text of the page without script/style/noscript (mutates `tree`)."""
+    etree.strip_elements(tree, "script", "style", "noscript", with_tail=False)
+    return " ".join(" ".join(tree.itertext()).split())
+
+
+def anchor_links(root, base_url: str) -> Iterator[str]:
+    for a in root.iter("a"):
+        href = (a.get("href") or "").strip()
+        if href:
+            yield urljoin(base_url, href)
+
+
+def feed_links(tree, base_url: str) -> Iterator[str]:
+    """Entry links of an RSS (<link>text</link>) or Atom (<link href=...>) feed."""
+    for item in iter_local(tree, "item", "entry"):
+        link = next((child for child in item if _local(child) == "link"), None)
+        if link is None:
+            continue
+        href = link.get("href") or (link.text or "")
+        if href.strip():
+            yield urljoin(base_url, href.strip())
+
+
+def sitemap_locs(tree) -> Iterator[str]:
+    for loc in iter_local(tree, "loc"):
+        href = (loc.text or "").strip()
+        if href:
+            yield href
+
+
+def extract_post(html: str, url: str) -> tuple[str, str] | None:
+    """
+    (title, main text) of a post page from one parse. The title is read before
+    trafilatura runs because its cleaning prunes the tree in place; only when
+    trafilatura finds no main content is the page parsed again for plain visible text.
+    """
+    tree = parse_html(html)
+    if tree is None:
+        return None
+    title = page_title(tree) or "Untitled"
+    doc = trafilatura.bare_extraction(
+        tree,
+        url=url,
+        include_comments=False,
+        include_tables=False,
+        favor_recall=True,
+    )
+    text = (doc.get("text") if isinstance(doc, dict) else getattr(doc, "text", None)) or ""
+    if not text.strip():
+        fallback = parse_html(html)
+        text = visible_text(fallback) if fallback is not None else ""
+    return title, text
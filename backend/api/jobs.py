@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+from pathlib import Path
+from typing import Callable
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import Job
+
+
+# DB-backed job queue: endpoints enqueue a Job row, `manage.py run_jobs` workers claim
+# queued rows with a conditional UPDATE (safe with several workers, no broker needed)
+# and run the registered handler.
+#
+# A handler is called as handler(user, payload, progress) and returns the
+# (response body, HTTP status) the synchronous endpoint would have produced;
+# progress(**counters) records counters such as posts_fetched or chunks_embedded.
+# A file named by payload["path"] (a spooled upload) belongs to the job and is
+# removed once it has run, whether it succeeded or failed, or when the job row is
+# deleted before it ran.
+
+JobHandler = Callable[..., tuple[dict, int]]
+JOB_HANDLERS: dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str) -> Callable[[JobHandler], JobHandler]:
+    def register(fn: JobHandler) -> JobHandler:
+        JOB_HANDLERS[kind] = fn
+        return fn
+
+    return register
+
+
+def jobs_enabled() -> bool:
+    return bool(getattr(settings, "BACKGROUND_JOBS_ENABLED", False))
+
+
+def no_progress(**counters) -> None:
+    pass
+
+
+class JobProgress:
+    """progress(**counters) for a running job; writes are throttled to one per `interval` seconds."""
+
+    def __init__(self, job: Job, interval: float = 1.0):
+        self.job = job
+        self.interval = interval
+        self._last = 0.0
+
+    def __call__(self, **counters) -> None:
+        self.job.progress.update(counters)
+        if time.monotonic() - self._last >= self.interval:
+            self.flush()
+
+    def flush(self) -> None:
+        self._last = time.monotonic()
+        Job.objects.filter(id=self.job.id).update(progress=self.job.progress)
+
+
+def remove_spooled(job: Job) -> None:
+    spooled = (job.payload or {}).get("path")
+    if spooled:
+        Path(spooled).unlink(missing_ok=True)
+
+
+def enqueue(user, kind: str, payload: dict) -> Job:
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    return Job.objects.create(user=user, kind=kind, payload=payload)
+
+
+def claim_next(worker: str) -> Job | None:
+    """Mark the oldest queued job as running for `worker` and return it, or None."""
+    while True:
+        job_id = Job.objects.filter(status=Job.QUEUED).order_by("created_at", "id").values_list("id", flat=True).first()
+        if job_id is None:
+            return None
+        claimed = Job.objects.filter(id=job_id, status=Job.QUEUED).update(
+            status=Job.RUNNING, worker=worker, started_at=timezone.now()
+        )
+        if claimed:
+            return Job.objects.select_related("user").get(id=job_id)
+        # Another worker won the race for this row; try the next one
+
+
+def run_job(job: Job) -> Job:
+    from . import views  # noqa: F401  (registers the job handlers)
+
+    progress = JobProgress(job)
+    try:
+        body, status = JOB_HANDLERS[job.kind](job.user, job.payload, progress)
+        job.result, job.result_status = body, status
+        # Endpoints report some failures as 200 + {"error": ...} for the UI; both count as failed
+        job.error = str(body.get("error") or "")
+        job.status = Job.FAILED if status >= 400 or job.error else Job.SUCCEEDED
+    except Exception:
+        job.status = Job.FAILED
+        job.error = traceback.format_exc(limit=5)
+    finally:
+        remove_spooled(job)
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "progress", "result", "result_status", "error", "finished_at"])
+    return job
+
+
+def default_worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"[:64]
+
+
+def run_worker(poll_interval: float = 1.0, max_jobs: int | None = None, once: bool = False, on_job=None) -> int:
+    """Claim and run jobs until `max_jobs` ran or, with `once`, the queue is empty. Returns jobs run."""
+    worker = default_worker_name()
+    done = 0
+    while max_jobs is None or done < max_jobs:
+        close_old_connections()
+        job = claim_next(worker)
+        if job is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+        done += 1
+        if on_job is not None:
+            on_job(job)
+    return done
+
+
+def stale_after() -> float:
+    return float(getattr(settings, "JOB_STALE_SECONDS", 3600))
+
+
+def requeue_running(worker: str | None = None, older_than: float | None = None) -> int:
+    """Put jobs left running by a crashed worker back in the queue.
+
+    With `worker`, every job that worker was running is requeued; otherwise only jobs
+    started more than `older_than` seconds ago (default JOB_STALE_SECONDS), so jobs a
+    live worker is still running are not picked up a second time.
+    """
+    qs = Job.objects.filter(status=Job.RUNNING)
+    if worker:
+        qs = qs.filter(worker=worker)
+    else:
+        cutoff = timezone.now() - timedelta(seconds=stale_after() if older_than is None else older_than)
+        qs = qs.filter(started_at__lt=cutoff)
+    return qs.update(status=Job.QUEUED, worker="", started_at=None)
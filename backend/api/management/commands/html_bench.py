@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import multiprocessing
+import re
+import resource
+import time
+import tracemalloc
+from pathlib import Path
+
+import trafilatura
+from bs4 import BeautifulSoup
+from django.core.management.base import BaseCommand, CommandError
+
+from api.html_extract import extract_post
+from vectorstore.http_client import http_cache_root
+
+
+def _legacy_extract(html: str, url: str) -> tuple[str, str]:
+    # Mirrors the previous website_scrape post pipeline: trafilatura on the raw string,
+    # a BeautifulSoup fallback for text and a second soup for the title
+    extracted = trafilatura.extract(html, include_comments=False, include_tables=False, favor_recall=True, url=url)
+    if not extracted:
+        s = BeautifulSoup(html, "lxml")
+        for tag in s(["script", "style", "noscript"]):
+            tag.decompose()
+        extracted = re.sub(r"\s+", " ", s.get_text("\n")).strip()
+    st = BeautifulSoup(html, "lxml")
+    title_tag = st.find("h1") or st.find("title")
+    return (title_tag.get_text(strip=True) if title_tag else "Untitled"), extracted
+
+
+PIPELINES = {"legacy": _legacy_extract, "single-parse": extract_post}
+
+
+def _run_pipeline(name: str, pages: list[str], queue) -> None:
+    # Runs in a fresh child so ru_maxrss reflects only this pipeline
+    fn = PIPELINES[name]
+    fn(pages[0], "https://example.com/warmup")
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    times, heap_peaks = [], []
+    for i, html in enumerate(pages):
+        tracemalloc.reset_peak()
+        t0 = time.perf_counter()
+        fn(html, f"https://example.com/post-{i}")
+        times.append(time.perf_counter() - t0)
+        heap_peaks.append(tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+    rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline  # KiB on Linux
+    queue.put((times, heap_peaks, rss_growth))
+
+
+class Command(BaseCommand):
+    help = "Parse time and peak memory per page of the website post extraction pipelines over saved HTML files."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", help="Directory of saved pages (*.html, *.htm; defaults to the HTTP page cache)")
+        parser.add_argument("--limit", type=int, default=200, help="Use at most this many pages")
+
+    def handle(self, *args, **options):
+        root = Path(options["dir"]) if options["dir"] else http_cache_root()
+        patterns = ("*.html", "*.htm") if options["dir"] else ("*.body",)
+        files = sorted(p for pattern in patterns for p in root.rglob(pattern))[: options["limit"]]
+        pages = [p.read_bytes().decode("utf-8", "replace") for p in files]
+        pages = [html for html in pages if "<" in html]
+        if not pages:
+            raise CommandError(f"No HTML pages found under {root}")
+        total_kib = sum(len(html.encode("utf-8")) for html in pages) / 1024
+        self.stdout.write(f"{len(pages)} pages, {total_kib / len(pages):.0f} KiB/page on average")
+        self.stdout.write(f"{'pipeline':>13} {'ms/page':>8} {'p95 ms':>8} {'heap peak KiB':>14} {'RSS +MiB':>9}")
+
+        ctx = multiprocessing.get_context("fork")
+        for name in PIPELINES:
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_run_pipeline, args=(name, pages, queue))
+            proc.start()
+            times, heap_peaks, rss_growth = queue.get()
+            proc.join()
+            times.sort()
+            mean_ms = sum(times) / len(times) * 1e3
+            p95_ms = times[min(int(len(times) * 0.95), len(times) - 1)] * 1e3
+            self.stdout.write(
+                f"{name:>13} {mean_ms:8.2f} {p95_ms:8.2f} {max(heap_peaks) / 1024:14.0f} {rss_growth / 1024:9.1f}"
+            )
+        self.stdout.write("heap peak = max Python allocations while parsing one page (lxml's C buffers are not traced);")
+        self.stdout.write("RSS + = growth of the process's peak resident set over the whole run.")
@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from api.jobs import requeue_running, run_worker
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (website/LinkedIn scrapes, campaign uploads)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--poll", type=float, default=1.0, help="Seconds between polls of an empty queue")
+        parser.add_argument("--max-jobs", type=int, help="Exit after running this many jobs")
+        parser.add_argument("--once", action="store_true", help="Exit as soon as the queue is empty")
+        parser.add_argument(
+            "--requeue-running",
+            action="store_true",
+            help="First requeue jobs left running by a crashed worker (started more than JOB_STALE_SECONDS ago)",
+        )
+        parser.add_argument("--requeue-worker", help="First requeue every job running on this (dead) worker")
+
+    def handle(self, *args, **options):
+        if options["requeue_worker"]:
+            self.stdout.write(f"requeued {requeue_running(options['requeue_worker'])} running job(s)")
+        if options["requeue_running"]:
+            self.stdout.write(f"requeued {requeue_running()} stale running job(s)")
+
+        def report(job):
+            seconds = (job.finished_at - job.started_at).total_seconds() if job.started_at else 0.0
+            self.stdout.write(f"job={job.id} kind={job.kind} user={job.user_id} status={job.status} in {seconds:.2f}s")
+
+        done = run_worker(options["poll"], max_jobs=options["max_jobs"], once=options["once"], on_job=report)
+        self.stdout.write(f"ran {done} job(s)")
@@ -0,0 +1,88 @@
+# Generated by Django 5.2 on 2026-10-17
+
+import hashlib
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def _campaign_text(item: dict) -> str:
+    title = str(item.get("title") or "").strip()
+    body = str(item.get("content") or "").strip()
+    return f"{title}\n{body}" if title else body
+
+
+def split_parsed_campaigns(apps, schema_editor):
+    UploadedCampaign = apps.get_model("api", "UploadedCampaign")
+    Campaign = apps.get_model("api", "Campaign")
+    for upload in UploadedCampaign.objects.iterator(chunk_size=100):
+        items = [it for it in (upload.parsed_campaigns or []) if isinstance(it, dict)]
+        rows = []
+        for position, item in enumerate(items):
+            text = _campaign_text(item)
+            rows.append(
+                Campaign(
+                    upload_id=upload.id,
+                    position=position,
+                    title=str(item.get("title") or ""),
+                    content=str(item.get("content") or ""),
+                    meta=item.get("meta"),
+                    content_hash=hashlib.sha1(text.encode("utf-8")).hexdigest() if text else "",
+                )
+            )
+        Campaign.objects.bulk_create(rows, batch_size=1000)
+        if upload.campaign_count != len(rows):
+            UploadedCampaign.objects.filter(id=upload.id).update(campaign_count=len(rows))
+
+
+def join_parsed_campaigns(apps, schema_editor):
+    UploadedCampaign = apps.get_model("api", "UploadedCampaign")
+    Campaign = apps.get_model("api", "Campaign")
+    for upload in UploadedCampaign.objects.iterator(chunk_size=100):
+        items = []
+        for c in Campaign.objects.filter(upload_id=upload.id).order_by("position"):
+            item = {"title": c.title, "content": c.content}
+            if c.meta:
+                item["meta"] = c.meta
+            items.append(item)
+        UploadedCampaign.objects.filter(id=upload.id).update(parsed_campaigns=items)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0010_add_job"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Campaign",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("position", models.PositiveIntegerField()),
+                ("title", models.TextField()),
+                ("content", models.TextField(blank=True, default="")),
+                ("meta", models.JSONField(blank=True, null=True)),
+                ("content_hash", models.CharField(blank=True, default="", max_length=40)),
+                (
+                    "upload",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="campaigns",
+                        to="api.uploadedcampaign",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["upload", "position"],
+                "constraints": [
+                    models.UniqueConstraint(fields=("upload", "position"), name="api_campaign_upload_position_uniq"),
+                ],
+            },
+        ),
+        migrations.RunPython(split_parsed_campaigns, join_parsed_campaigns),
+        migrations.RemoveField(
+            model_name="uploadedcampaign",
+            name="parsed_campaigns",
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0011_campaign_rows"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="brandguideline",
+            name="content_hash",
+            field=models.CharField(blank=True, default="", editable=False, max_length=40),
+        ),
+    ]
@@ -22,6 +22,8 @@ class BrandGuideline(models.Model):
         max_length=20, choices=GUIDELINE_TYPES, default="tone"
     )
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Hash of the indexed text as of the last vectorization (api.signals); "" = never indexed
+    content_hash = models.CharField(max_length=40, blank=True, default="", editable=False)
 
     def __str__(self) -> str:
         username = getattr(self.user, "username", str(self.user))
@@ -47,8 +49,8 @@ class UploadedCampaign(models.Model):
     )
     filename = models.CharField(max_length=255)
     file_type = models.CharField(max_length=10, choices=FILE_TYPES)
+    # The uploaded file (only its head for streamed files above UPLOAD_INLINE_MAX_BYTES)
     raw_content = models.TextField()
-    parsed_campaigns = models.JSONField(default=list, blank=True)
     upload_date = models.DateTimeField(auto_now_add=True)
     campaign_count = models.IntegerField(default=0)
 
@@ -56,6 +58,28 @@ class UploadedCampaign(models.Model):
         ordering = ["-upload_date", "-id"]
 
 
+class Campaign(models.Model):
+    """One parsed campaign of an uploaded file; indexed as a single vector chunk."""
+
+    upload = models.ForeignKey(
+        UploadedCampaign,
+        on_delete=models.CASCADE,
+        related_name="campaigns",
+    )
+    position = models.PositiveIntegerField()  # order within the file
+    title = models.TextField()
+    content = models.TextField(blank=True, default="")
+    meta = models.JSONField(null=True, blank=True)
+    # vectorstore.ingest.chunk_hash of the indexed text; "" when there is nothing to index
+    content_hash = models.CharField(max_length=40, blank=True, default="")
+
+    class Meta:
+        ordering = ["upload", "position"]
+        constraints = [
+            models.UniqueConstraint(fields=["upload", "position"], name="api_campaign_upload_position_uniq"),
+        ]
+
+
 class LinkedInScrape(models.Model):
     """Stores raw scraped LinkedIn page text for a user and URL."""
 
@@ -114,4 +138,44 @@ class WebsiteScrape(models.Model):
         ordering = ["-created_at", "-id"]
         indexes = [
             models.Index(fields=["user", "created_at"]),
-        ]
\ No newline at end of file
+        ]
+
+class Job(models.Model):
+    """Background work item (scrape, upload parsing) executed by `manage.py run_jobs`."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    STATUSES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (SUCCEEDED, "Succeeded"),
+        (FAILED, "Failed"),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="jobs",
+    )
+    kind = models.CharField(max_length=32)  # key of api.jobs.JOB_HANDLERS
+    status = models.CharField(max_length=16, choices=STATUSES, default=QUEUED)
+    payload = models.JSONField(default=dict, blank=True)
+    # Counters reported by the handler while it runs, e.g. {"posts_fetched": 7, "chunks_embedded": 120}
+    progress = models.JSONField(default=dict, blank=True)
+    # Response body and HTTP status the synchronous endpoint would have returned
+    result = models.JSONField(null=True, blank=True)
+    result_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    worker = models.CharField(max_length=64, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at", "-id"]
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="api_job_status_created_idx"),
+            models.Index(fields=["user", "created_at"], name="api_job_user_created_idx"),
+        ]
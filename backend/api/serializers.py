@@ -1,6 +1,6 @@
 from django.contrib.auth.models import User
 from rest_framework import serializers
-from .models import BrandGuideline, UploadedCampaign, LinkedInScrape, TrustpilotScrape, WebsiteScrape
+from .models import BrandGuideline, UploadedCampaign, Campaign, LinkedInScrape, TrustpilotScrape, WebsiteScrape, Job
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -46,14 +46,14 @@ class BrandGuidelineSerializer(serializers.ModelSerializer):
 
 
 class UploadedCampaignSerializer(serializers.ModelSerializer):
+    """Upload metadata only; campaigns are paged through uploaded-campaigns/<id>/campaigns/."""
+
     class Meta:
         model = UploadedCampaign
         fields = [
             "id",
             "filename",
             "file_type",
-            "raw_content",
-            "parsed_campaigns",
             "upload_date",
             "campaign_count",
         ]
@@ -68,6 +68,13 @@ class UploadedCampaignSerializer(serializers.ModelSerializer):
         return UploadedCampaign.objects.create(user=request.user, **validated_data)
 
 
+class CampaignSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Campaign
+        fields = ["id", "position", "title", "content", "meta"]
+        read_only_fields = ["id", "position"]
+
+
 class LinkedInScrapeSerializer(serializers.ModelSerializer):
     class Meta:
         model = LinkedInScrape
@@ -105,3 +112,36 @@ class WebsiteScrapeSerializer(serializers.ModelSerializer):
         if request is None or request.user.is_anonymous:
             raise serializers.ValidationError("Authentication required.")
         return WebsiteScrape.objects.create(user=request.user, **validated_data)
+
+
+class JobSerializer(serializers.ModelSerializer):
+    queued_seconds = serializers.SerializerMethodField()
+    run_seconds = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = [
+            "id",
+            "kind",
+            "status",
+            "progress",
+            "result",
+            "result_status",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+            "queued_seconds",
+            "run_seconds",
+        ]
+        read_only_fields = fields
+
+    def get_queued_seconds(self, obj: Job) -> float | None:
+        if obj.started_at is None:
+            return None
+        return round((obj.started_at - obj.created_at).total_seconds(), 3)
+
+    def get_run_seconds(self, obj: Job) -> float | None:
+        if obj.started_at is None or obj.finished_at is None:
+            return None
+        return round((obj.finished_at - obj.started_at).total_seconds(), 3)
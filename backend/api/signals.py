@@ -1,87 +1,199 @@
 from __future__ import annotations
 
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
-from .models import BrandGuideline, UploadedCampaign
+from .models import BrandGuideline, Job, UploadedCampaign
+from .jobs import job_handler, jobs_enabled, no_progress, remove_spooled
 from vectorstore.models import VectorizedChunk
-from vectorstore.utils import text_to_vector, sentence_split
+from vectorstore.ann import ANN_BUILD_JOB, build_index
+from vectorstore.hooks import chunks_deleted
+from vectorstore.ingest import chunk_hash, split_chunks, sync_chunks, sync_sources
+from .campaign_parsing import campaign_text
 
 
-def _delete_vectors(user_id: int, source_type: str, source_id: int) -> None:
-    VectorizedChunk.objects.filter(
-        user_id=user_id, source_type=source_type, source_id=source_id
-    ).delete()
+# Vectorization triggered by model signals is collected per transaction and run once
+# in transaction.on_commit: many saves/deletes in one transaction (admin bulk edits,
+# loops of saves) become one read, one delete, one embedding pass and one bulk insert.
+# Guidelines whose indexed text hashes to the stored content_hash are skipped.
+# With VECTORIZE_IN_BACKGROUND (and BACKGROUND_JOBS_ENABLED) the batch is handed to
+# the job worker instead of running after the commit in this process.
+
+
+def guideline_text(title: str | None, content: str | None) -> str:
+    content = content or ""
+    title = (title or "").strip()
+    return f"{title}\n{content}" if title else content
+
+
+def guideline_hash(title: str | None, content: str | None) -> str:
+    text = guideline_text(title, content)
+    return chunk_hash(text) if text.strip() else ""
+
+
+class _Batch:
+    def __init__(self, key: tuple | None = None):
+        self.guidelines: dict[int, int] = {}  # guideline id -> user id
+        self.deleted: dict[tuple[str, int], int] = {}  # (source_type, source_id) -> user id
+        # Atomic block and savepoint the batch was registered in; pending until flushed
+        self.key = key
+        self.pending = key is not None
+
+    def flush(self) -> None:
+        self.pending = False
+        if vectorize_in_background():
+            for user_id, payload in self.payloads().items():
+                enqueue_vectorization(user_id, payload)
+        else:
+            process_vectorization(list(self.guidelines), [[t, i, u] for (t, i), u in self.deleted.items()])
+
+    def payloads(self) -> dict[int, dict]:
+        by_user: dict[int, dict] = defaultdict(lambda: {"guidelines": [], "deleted": []})
+        for guideline_id, user_id in self.guidelines.items():
+            by_user[user_id]["guidelines"].append(guideline_id)
+        for (source_type, source_id), user_id in self.deleted.items():
+            by_user[user_id]["deleted"].append([source_type, source_id, user_id])
+        return dict(by_user)
+
+
+_local = threading.local()
+
+
+def _current_batch() -> _Batch:
+    """
+    The batch registered with the current atomic block and savepoint, or a new one.
+
+    Each batch is registered once with transaction.on_commit from the savepoint it
+    collects for, so rolling that savepoint back discards it with its callback; a
+    committed batch is no longer pending and is replaced.
+    """
+    conn = transaction.get_connection()
+    if not conn.in_atomic_block:
+        # on_commit would run right away, before the caller fills the batch
+        return _Batch()
+    key = (conn.atomic_blocks[0], tuple(conn.savepoint_ids))
+    batch = getattr(_local, "batch", None)
+    if batch is None or not batch.pending or batch.key != key:
+        batch = _local.batch = _Batch(key)
+        transaction.on_commit(batch.flush)
+    return batch
+
+
+def _run_now_if_autocommit(batch: _Batch) -> None:
+    if not transaction.get_connection().in_atomic_block:
+        batch.flush()
+
+
+def vectorize_in_background() -> bool:
+    return bool(getattr(settings, "VECTORIZE_IN_BACKGROUND", False)) and jobs_enabled()
+
+
+def enqueue_vectorization(user_id: int, payload: dict) -> None:
+    Job.objects.create(user_id=user_id, kind="vectorize", payload=payload)
+
+
+@job_handler(ANN_BUILD_JOB)
+def _build_ann_index_job(user, payload: dict, progress=no_progress) -> tuple[dict, int]:
+    index = build_index(user.id, payload["source_type"])
+    return {"source_type": payload["source_type"], "chunks": index.size if index is not None else 0}, 200
+
+
+@job_handler("vectorize")
+def _vectorize_job(user, payload: dict, progress=no_progress) -> tuple[dict, int]:
+    return process_vectorization(payload.get("guidelines") or [], payload.get("deleted") or [], progress), 200
+
+
+def process_vectorization(guideline_ids: list[int], deleted: list[list], progress=no_progress) -> dict:
+    """Drop the chunks of deleted sources, then re-index the changed guidelines in one pass."""
+    removed = 0
+    by_type: dict[str, dict[int, int]] = defaultdict(dict)
+    for source_type, source_id, user_id in deleted:
+        by_type[source_type][int(source_id)] = int(user_id)
+    for source_type, owners in by_type.items():
+        qs = VectorizedChunk.objects.filter(source_type=source_type, source_id__in=list(owners))
+        grouped: dict[tuple[int, int], list[int]] = defaultdict(list)
+        for chunk_id, user_id, source_id in qs.values_list("id", "user_id", "source_id"):
+            if owners.get(source_id) == user_id:
+                grouped[(user_id, source_id)].append(chunk_id)
+        ids = [chunk_id for chunk_ids in grouped.values() for chunk_id in chunk_ids]
+        if ids:
+            VectorizedChunk.objects.filter(id__in=ids).delete()
+            for (user_id, source_id), chunk_ids in grouped.items():
+                chunks_deleted(user_id, source_type, chunk_ids, source_id)
+        removed += len(ids)
+
+    sources: dict[tuple[int, int], list[str]] = {}
+    changed: list[BrandGuideline] = []
+    for g in BrandGuideline.objects.filter(id__in=guideline_ids).only("id", "user_id", "title", "content", "content_hash"):
+        new_hash = guideline_hash(g.title, g.content)
+        if new_hash == g.content_hash:
+            continue
+        sources[(g.user_id, g.id)] = split_chunks([guideline_text(g.title, g.content)]) if new_hash else []
+        g.content_hash = new_hash
+        changed.append(g)
+    synced = sync_sources("guideline", sources) if sources else None
+    if changed:
+        BrandGuideline.objects.bulk_update(changed, ["content_hash"])
+    result = {
+        "guidelines_reindexed": len(changed),
+        "guidelines_unchanged": len(set(guideline_ids)) - len(changed),
+        "chunks_added": len(synced.created_ids) if synced else 0,
+        "chunks_deleted": removed + (len(synced.deleted_ids) if synced else 0),
+    }
+    progress(**result)
+    return result
 
 
 @receiver(post_save, sender=BrandGuideline)
-def vectorize_brand_guideline(sender, instance: BrandGuideline, **kwargs) -> None:
-    # Delete previous vectors for this guideline, then re-index
-    _delete_vectors(instance.user_id, "guideline", instance.id)
-
-    content = instance.content or ""
-    title = (instance.title or "").strip()
-    text = f"{title}\n{content}" if title else content
-    if not text.strip():
+def vectorize_brand_guideline(sender, instance: BrandGuideline, created: bool = False, update_fields=None, **kwargs) -> None:
+    if update_fields is not None and not {"title", "content"} & set(update_fields):
         return
-
-    chunks = sentence_split(text)
-    objs = []
-    for chunk in chunks:
-        vec = text_to_vector(chunk)
-        objs.append(
-            VectorizedChunk(
-                user_id=instance.user_id,
-                source_type="guideline",
-                source_id=instance.id,
-                text=chunk,
-                vector=vec,
-            )
-        )
-    if objs:
-        VectorizedChunk.objects.bulk_create(objs)
+    if not created and guideline_hash(instance.title, instance.content) == instance.content_hash:
+        return
+    batch = _current_batch()
+    batch.guidelines[instance.id] = instance.user_id
+    _run_now_if_autocommit(batch)
 
 
 @receiver(post_delete, sender=BrandGuideline)
 def cleanup_brand_guideline_vectors(sender, instance: BrandGuideline, **kwargs) -> None:
-    _delete_vectors(instance.user_id, "guideline", instance.id)
-
-
-@receiver(post_save, sender=UploadedCampaign)
-def vectorize_uploaded_campaign(sender, instance: UploadedCampaign, **kwargs) -> None:
-    # Delete previous vectors for this upload, then index parsed campaigns
-    _delete_vectors(instance.user_id, "upload", instance.id)
-
-    items = instance.parsed_campaigns or []
-    if not isinstance(items, list):
-        return
-
-    objs = []
-    for item in items:
-        if not isinstance(item, dict):
-            continue
-        title = str(item.get("title") or "").strip()
-        body = str(item.get("content") or "").strip()
-        if not title and not body:
-            continue
-        text = f"{title}\n{body}" if title else body
-        # Do not over-chunk uploads: index each parsed campaign as a single chunk
-        vec = text_to_vector(text)
-        objs.append(
-            VectorizedChunk(
-                user_id=instance.user_id,
-                source_type="upload",
-                source_id=instance.id,
-                text=text,
-                vector=vec,
-            )
+    batch = _current_batch()
+    batch.guidelines.pop(instance.id, None)
+    batch.deleted[("guideline", instance.id)] = instance.user_id
+    _run_now_if_autocommit(batch)
+
+
+def reindex_upload_campaigns(upload: UploadedCampaign):
+    """
+    Bring the upload's vector chunks in line with its Campaign rows. Chunks are diffed
+    by content hash, so only campaigns whose text changed are re-embedded.
+    Campaign rows are written in bulk, so this is called explicitly rather than from a signal.
+    """
+    # Do not over-chunk uploads: index each parsed campaign as a single chunk
+    texts = [
+        text
+        for text in (
+            campaign_text({"title": title, "content": content})
+            for title, content in upload.campaigns.order_by("position").values_list("title", "content").iterator(chunk_size=2000)
         )
-    if objs:
-        VectorizedChunk.objects.bulk_create(objs)
+        if text
+    ]
+    return sync_chunks(upload.user_id, "upload", upload.id, texts)
 
 
 @receiver(post_delete, sender=UploadedCampaign)
 def cleanup_uploaded_campaign_vectors(sender, instance: UploadedCampaign, **kwargs) -> None:
-    _delete_vectors(instance.user_id, "upload", instance.id)
+    batch = _current_batch()
+    batch.deleted[("upload", instance.id)] = instance.user_id
+    _run_now_if_autocommit(batch)
 
 
+@receiver(post_delete, sender=Job)
+def cleanup_job_spool(sender, instance: Job, **kwargs) -> None:
+    if instance.status in (Job.QUEUED, Job.RUNNING):
+        remove_spooled(instance)
@@ -0,0 +1,532 @@
+import csv
+import io
+import json
+import re
+import tempfile
+import threading
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import campaign_parsing, signals
+from .campaign_parsing import CampaignParseError, iter_campaigns, normalize_record
+from .jobs import JOB_HANDLERS, claim_next, enqueue, requeue_running, run_job, run_worker
+from .models import BrandGuideline, Campaign, Job, UploadedCampaign, WebsiteScrape
+from .views import _run_website_scrape
+from vectorstore.models import VectorizedChunk
+
+
+def _user(name: str):
+    return get_user_model().objects.create_user(username=name, password="x")
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.user = _user("jobs")
+        self.calls = []
+
+        def ok(user, payload, progress):
+            self.calls.append(payload)
+            progress(items=1)
+            return {"ok": True}, 200
+
+        def soft_error(user, payload, progress):
+            return {"error": "nothing found"}, 200
+
+        def boom(user, payload, progress):
+            raise RuntimeError("boom")
+
+        for kind, fn in {"test_ok": ok, "test_soft_error": soft_error, "test_boom": boom}.items():
+            JOB_HANDLERS[kind] = fn
+            self.addCleanup(JOB_HANDLERS.pop, kind, None)
+
+    def test_enqueue_rejects_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            enqueue(self.user, "no_such_kind", {})
+        self.assertFalse(Job.objects.exists())
+
+    def test_claim_next_takes_oldest_once(self):
+        first = enqueue(self.user, "test_ok", {"n": 1})
+        second = enqueue(self.user, "test_ok", {"n": 2})
+        claimed = claim_next("w1")
+        self.assertEqual(claimed.id, first.id)
+        self.assertEqual((claimed.status, claimed.worker), (Job.RUNNING, "w1"))
+        self.assertIsNotNone(claimed.started_at)
+        self.assertEqual(claim_next("w2").id, second.id)
+        self.assertIsNone(claim_next("w3"))
+
+    def test_run_job_statuses(self):
+        enqueue(self.user, "test_ok", {"n": 1})
+        job = run_job(claim_next("w"))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual((job.result, job.result_status), ({"ok": True}, 200))
+        self.assertEqual(job.progress, {"items": 1})
+        self.assertIsNotNone(job.finished_at)
+
+        enqueue(self.user, "test_soft_error", {})
+        job = run_job(claim_next("w"))
+        self.assertEqual((job.status, job.error), (Job.FAILED, "nothing found"))
+
+        enqueue(self.user, "test_boom", {})
+        job = run_job(claim_next("w"))
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn("RuntimeError: boom", job.error)
+
+    def test_run_worker_once_drains_queue(self):
+        for n in range(3):
+            enqueue(self.user, "test_ok", {"n": n})
+        seen = []
+        self.assertEqual(run_worker(once=True, on_job=seen.append), 3)
+        self.assertEqual([p["n"] for p in self.calls], [0, 1, 2])
+        self.assertTrue(all(job.status == Job.SUCCEEDED for job in seen))
+        self.assertEqual(run_worker(once=True), 0)
+
+    def test_requeue_running_by_worker(self):
+        enqueue(self.user, "test_ok", {})
+        enqueue(self.user, "test_ok", {})
+        crashed, alive = claim_next("crashed"), claim_next("alive")
+        self.assertEqual(requeue_running("crashed"), 1)
+        crashed.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual((crashed.status, crashed.worker, crashed.started_at), (Job.QUEUED, "", None))
+        self.assertEqual(alive.status, Job.RUNNING)
+
+    def test_requeue_running_skips_live_jobs(self):
+        enqueue(self.user, "test_ok", {})
+        enqueue(self.user, "test_ok", {})
+        stale, live = claim_next("a"), claim_next("b")
+        Job.objects.filter(id=stale.id).update(started_at=timezone.now() - timedelta(hours=2))
+        with override_settings(JOB_STALE_SECONDS=3600):
+            self.assertEqual(requeue_running(), 1)
+        stale.refresh_from_db()
+        live.refresh_from_db()
+        self.assertEqual(stale.status, Job.QUEUED)
+        self.assertEqual(live.status, Job.RUNNING)
+        self.assertEqual(requeue_running(older_than=0), 1)
+
+
+class SpooledJobTests(TestCase):
+    def setUp(self):
+        self.user = _user("spool")
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+
+        def boom(user, payload, progress):
+            raise RuntimeError("boom")
+
+        JOB_HANDLERS["test_boom"] = boom
+        self.addCleanup(JOB_HANDLERS.pop, "test_boom", None)
+
+    def _spool(self, name: str, data: bytes = b"x") -> Path:
+        path = self.dir / name
+        path.write_bytes(data)
+        return path
+
+    def test_spool_removed_after_failure(self):
+        path = self._spool("a.csv")
+        enqueue(self.user, "test_boom", {"path": str(path)})
+        job = run_job(claim_next("w"))
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertFalse(path.exists())
+
+    def test_spool_removed_when_queued_job_deleted(self):
+        path = self._spool("b.csv")
+        enqueue(self.user, "test_boom", {"path": str(path)})
+        self.user.delete()
+        self.assertFalse(path.exists())
+
+    def test_upload_job_creates_campaigns_and_removes_spool(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        body = b"title,content\nSpring sale,Twenty percent off\nSummer sale,Free shipping\n"
+        with override_settings(BACKGROUND_JOBS_ENABLED=True, UPLOAD_SPOOL_DIR=str(self.dir)):
+            resp = client.post(
+                "/api/uploaded-campaigns/upload/",
+                {"file": SimpleUploadedFile("campaigns.csv", body, content_type="text/csv")},
+                format="multipart",
+            )
+        self.assertEqual(resp.status_code, 202, resp.content)
+        self.assertEqual(len(list(self.dir.iterdir())), 1)
+
+        job = run_job(claim_next("w"))
+        self.assertEqual((job.status, job.result_status), (Job.SUCCEEDED, 201), job.error)
+        upload = UploadedCampaign.objects.get(user=self.user)
+        self.assertEqual(upload.campaign_count, 2)
+        self.assertEqual(
+            list(Campaign.objects.filter(upload=upload).order_by("position").values_list("title", flat=True)),
+            ["Spring sale", "Summer sale"],
+        )
+        self.assertEqual(list(self.dir.iterdir()), [])
+
+    @override_settings(UPLOAD_SYNC_MAX_BYTES=16, UPLOAD_MAX_BYTES=1024)
+    def test_large_uploads_need_the_job_queue(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        body = b"title,content\nSpring sale,Twenty percent off\n"
+
+        def post():
+            return client.post(
+                "/api/uploaded-campaigns/upload/",
+                {"file": SimpleUploadedFile("campaigns.csv", body, content_type="text/csv")},
+                format="multipart",
+            )
+
+        self.assertEqual(post().status_code, 400)
+        with override_settings(BACKGROUND_JOBS_ENABLED=True, UPLOAD_SPOOL_DIR=str(self.dir)):
+            self.assertEqual(post().status_code, 202)
+
+    def test_truncated_json_job_fails(self):
+        path = self._spool("c.json", b'{"campaigns": [{"title": "Spring sale"}, {"title": ')
+        enqueue(self.user, "upload_campaign_file", {"filename": "c.json", "file_type": "json", "size": 64, "path": str(path)})
+        job = run_job(claim_next("w"))
+        self.assertEqual((job.status, job.result_status), (Job.FAILED, 400))
+        self.assertIn("Invalid JSON", job.error)
+        self.assertFalse(UploadedCampaign.objects.filter(user=self.user).exists())
+
+
+class WebsiteRescrapeTests(TestCase):
+    """Re-scraping the same site diffs posts by page hash and chunks by content hash."""
+
+    SITE = "https://example.com/blog/"
+
+    def setUp(self):
+        self.user = _user("scraper")
+
+    def _scrape(self, posts: dict[str, str], slow: tuple[str, ...] = (), **payload) -> tuple[dict, int]:
+        index = "".join(f'<a href="/blog/{slug}">{slug}</a>' for slug in posts)
+        pages = {self.SITE: f"<html><body>{index}</body></html>"}
+        pages.update({f"https://example.com/blog/{slug}": f"<html>{text}</html>" for slug, text in posts.items()})
+        # Fetches of `slow` posts only return once the scrape is over, i.e. after its deadline
+        done = threading.Event()
+        self.addCleanup(done.set)
+
+        def get(url, **kwargs):
+            if url not in pages:
+                raise ConnectionError(url)
+            if url.rsplit("/", 1)[-1] in slow:
+                done.wait(5)
+            body = pages[url].encode()
+            return SimpleNamespace(content=body, text=pages[url], status_code=200)
+
+        def extract(html, url):
+            return url.rsplit("/", 1)[-1], html.removeprefix("<html>").removesuffix("</html>")
+
+        with mock.patch("api.views.cached_get", side_effect=get), mock.patch("api.views.extract_post", side_effect=extract):
+            body, status = _run_website_scrape(self.user, {"url": self.SITE, **payload})
+        done.set()
+        self.assertNotIn("error", body)
+        return body, status
+
+    def _chunk_texts(self) -> set[str]:
+        return set(VectorizedChunk.objects.filter(user=self.user, source_type="website").values_list("text", flat=True))
+
+    def test_rescrape_reports_and_applies_diff(self):
+        _, status = self._scrape({
+            "first-post": "Spring launch notes.",
+            "second-post": "Summer campaign recap.",
+            "third-post": "Autumn roadmap.",
+        })
+        self.assertEqual(status, 201)
+        first_ids = set(VectorizedChunk.objects.filter(user=self.user, text="Spring launch notes.").values_list("id", flat=True))
+
+        body, status = self._scrape({
+            "first-post": "Spring launch notes.",
+            "second-post": "Summer campaign recap, updated.",
+        })
+        self.assertEqual(status, 200)
+        self.assertEqual(
+            {k: body["changes"][k] for k in ("posts_unchanged", "posts_changed", "posts_removed", "chunks_kept", "chunks_added", "chunks_deleted")},
+            {"posts_unchanged": 1, "posts_changed": 1, "posts_removed": 1, "chunks_kept": 1, "chunks_added": 1, "chunks_deleted": 2},
+        )
+        self.assertEqual(self._chunk_texts(), {"Spring launch notes.", "Summer campaign recap, updated."})
+        # The unchanged post keeps its chunk row (and embedding) instead of being re-inserted
+        self.assertEqual(set(VectorizedChunk.objects.filter(user=self.user, text="Spring launch notes.").values_list("id", flat=True)), first_ids)
+        self.assertEqual(WebsiteScrape.objects.filter(user=self.user).count(), 1)
+
+    def test_rescrape_past_deadline_keeps_unfetched_posts(self):
+        self._scrape({
+            "first-post": "Spring launch notes.",
+            "second-post": "Summer campaign recap.",
+            "third-post": "Autumn roadmap.",
+        })
+        with mock.patch("api.views.WEBSITE_FETCH_DEADLINE", 0.5):
+            body, status = self._scrape({
+                "first-post": "Spring launch notes, updated.",
+                "second-post": "Summer campaign recap, rewritten.",
+                "third-post": "Autumn roadmap.",
+            }, slow=("second-post", "third-post"))
+        self.assertEqual(status, 200)
+        self.assertEqual(body["changes"]["posts_removed"], 0)
+        self.assertEqual(body["changes"]["chunks_deleted"], 1)
+        self.assertEqual(self._chunk_texts(), {"Spring launch notes, updated.", "Summer campaign recap.", "Autumn roadmap."})
+        scrape = WebsiteScrape.objects.get(user=self.user)
+        self.assertEqual(
+            [p["text"] for p in scrape.posts],
+            ["Spring launch notes, updated.", "Summer campaign recap.", "Autumn roadmap."],
+        )
+
+    def test_full_rescrape_replaces_everything(self):
+        self._scrape({"first-post": "Spring launch notes."})
+        body, status = self._scrape({"first-post": "Spring launch notes."}, full=True)
+        self.assertEqual(status, 201)
+        self.assertEqual(body["changes"]["chunks_added"], 1)
+        self.assertEqual(self._chunk_texts(), {"Spring launch notes."})
+        self.assertEqual(WebsiteScrape.objects.filter(user=self.user).count(), 1)
+
+
+def _legacy_parse(text: str, file_type: str) -> list[dict]:
+    """The whole-file parsers the upload view used before they were made incremental."""
+    if file_type == "csv":
+        return [normalize_record(r) for r in csv.DictReader(text.splitlines()) if any(v for v in r.values())]
+    if file_type == "txt":
+        items = []
+        for block in re.split(r"\n\s*[-=]{3,}\s*\n|\n{2,}", text.strip()):
+            lines = [ln.strip() for ln in block.strip().splitlines() if ln.strip()]
+            if lines:
+                items.append({"title": lines[0][:120], "content": "\n".join(lines[1:])})
+        return items
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data["campaigns"] if isinstance(data.get("campaigns"), list) else [data]
+    return [normalize_record(r) for r in data if isinstance(r, dict)]
+
+
+class CampaignParsingTests(TestCase):
+    RECORDS = [
+        {"title": "Spring sale", "content": "Twenty percent off", "channel": "email"},
+        {"Subject": "Summer", "Body": "Free shipping, all week", "open_rate": 0.42},
+        {"content": "No title here"},
+        {"title": "Æblegrød og fløde", "body": "Danish \u2013 with a dash"},
+    ]
+
+    def _parse(self, text: str, file_type: str) -> list[dict]:
+        return list(iter_campaigns(io.BytesIO(text.encode("utf-8")), file_type))
+
+    def assertMatchesLegacy(self, text: str, file_type: str):
+        parsed = self._parse(text, file_type)
+        self.assertTrue(parsed)
+        self.assertEqual(parsed, _legacy_parse(text, file_type))
+
+    def test_csv(self):
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=["title", "content", "channel"])
+        writer.writeheader()
+        writer.writerows([
+            {"title": "Spring sale", "content": "Twenty percent off", "channel": "email"},
+            {"title": "", "content": "", "channel": ""},
+            {"title": "Quoted, comma", "content": 'She said "hi"', "channel": ""},
+        ])
+        self.assertMatchesLegacy(out.getvalue(), "csv")
+
+    def test_csv_keeps_newlines_in_quoted_fields(self):
+        # The old parser split the text into lines first and lost them
+        parsed = self._parse('title,content\r\nMulti-line,"first line\nsecond line"\r\n', "csv")
+        self.assertEqual(parsed, [{"title": "Multi-line", "content": "first line\nsecond line"}])
+
+    def test_txt(self):
+        text = (
+            "Spring sale\nTwenty percent off\nEnds Sunday\n\n"
+            "Summer\nFree shipping\n---\n"
+            "Autumn\n=====\n"
+            "Winter only title\n\n\n\n"
+            + "x" * 200 + "\nlong title is cut\n"
+        )
+        self.assertMatchesLegacy(text, "txt")
+        self.assertEqual(len(self._parse(text, "txt")[-1]["title"]), 120)
+
+    def test_json_shapes_with_and_without_ijson(self):
+        documents = [
+            json.dumps(self.RECORDS),
+            json.dumps({"campaigns": self.RECORDS, "exported_at": "2024-01-01"}),
+            json.dumps(self.RECORDS[0]),
+            json.dumps(self.RECORDS, indent=2),
+            json.dumps([1, "text", *self.RECORDS]),
+        ]
+        for stream_parser in (campaign_parsing.ijson, None):
+            with mock.patch.object(campaign_parsing, "ijson", stream_parser):
+                for document in documents:
+                    with self.subTest(ijson=stream_parser is not None, document=document[:30]):
+                        self.assertMatchesLegacy(document, "json")
+                    # A UTF-8 BOM (as written by Excel and Notepad) is skipped
+                    self.assertEqual(self._parse("\ufeff" + document, "json"), _legacy_parse(document, "json"))
+
+    def test_invalid_json_raises(self):
+        with self.assertRaises(CampaignParseError):
+            self._parse("not json", "json")
+        with self.assertRaises(CampaignParseError):
+            self._parse('[{"title": "ok"}, {"title": ', "json")
+        with self.assertRaises(CampaignParseError):
+            self._parse('{"campaigns": [{"title": "ok"}, {"title": ', "json")
+
+
+class UploadedCampaignViewTests(TestCase):
+    def setUp(self):
+        self.user = _user("uploader")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        rows = "".join(f"Campaign {n},Body {n}\n" for n in range(7))
+        resp = self.client.post(
+            "/api/uploaded-campaigns/upload/",
+            {"file": SimpleUploadedFile("c.csv", f"title,content\n{rows}".encode(), content_type="text/csv")},
+            format="multipart",
+        )
+        self.assertEqual(resp.status_code, 201, resp.content)
+        self.upload_id = resp.json()["id"]
+
+    def test_truncated_json_upload_is_rejected(self):
+        body = b'[{"title": "Spring sale", "content": "Twenty percent off"}, {"title": '
+        resp = self.client.post(
+            "/api/uploaded-campaigns/upload/",
+            {"file": SimpleUploadedFile("c.json", body, content_type="application/json")},
+            format="multipart",
+        )
+        self.assertEqual(resp.status_code, 400, resp.content)
+        self.assertEqual(UploadedCampaign.objects.filter(user=self.user).count(), 1)
+        self.assertFalse(Campaign.objects.filter(title="Spring sale").exists())
+
+    @override_settings(UPLOAD_DETAIL_CAMPAIGNS=3)
+    def test_detail_inlines_first_campaigns(self):
+        data = self.client.get(f"/api/uploaded-campaigns/{self.upload_id}/").json()
+        self.assertEqual(data["campaign_count"], 7)
+        self.assertEqual([c["title"] for c in data["parsed_campaigns"]], ["Campaign 0", "Campaign 1", "Campaign 2"])
+        self.assertNotIn("raw_content", data)
+
+    def test_campaign_pages(self):
+        url = f"/api/uploaded-campaigns/{self.upload_id}/campaigns/"
+        first = self.client.get(url, {"limit": 4}).json()
+        self.assertEqual(([c["position"] for c in first["results"]], first["next_offset"]), ([0, 1, 2, 3], 4))
+        rest = self.client.get(url, {"offset": first["next_offset"], "limit": 4}).json()
+        self.assertEqual(([c["position"] for c in rest["results"]], rest["next_offset"]), ([4, 5, 6], None))
+        self.assertEqual(self.client.get(url, {"offset": "x"}).status_code, 400)
+
+    def test_edit_reembeds_only_that_campaign(self):
+        chunks = VectorizedChunk.objects.filter(user=self.user, source_type="upload", source_id=self.upload_id)
+        before = set(chunks.values_list("id", flat=True))
+        self.assertEqual(len(before), 7)
+        resp = self.client.patch(f"/api/uploaded-campaigns/{self.upload_id}/campaigns/2/", {"content": "New body"}, format="json")
+        self.assertEqual(resp.status_code, 200, resp.content)
+        after = set(chunks.values_list("id", flat=True))
+        self.assertEqual(len(after), 7)
+        self.assertEqual(len(before - after), 1)
+        self.assertTrue(chunks.filter(text="Campaign 2\nNew body").exists())
+
+    def test_other_users_upload_is_hidden(self):
+        other = APIClient()
+        other.force_authenticate(_user("someone-else"))
+        self.assertEqual(other.get(f"/api/uploaded-campaigns/{self.upload_id}/").status_code, 404)
+        self.assertEqual(other.get(f"/api/uploaded-campaigns/{self.upload_id}/campaigns/").status_code, 404)
+
+
+class GuidelineVectorizationTests(TestCase):
+    """Guideline saves and deletes are vectorized once per transaction, on commit."""
+
+    def setUp(self):
+        self.user = _user("guidelines")
+
+    def _chunks(self):
+        return VectorizedChunk.objects.filter(user=self.user, source_type="guideline")
+
+    def _guideline(self, title: str, content: str) -> BrandGuideline:
+        return BrandGuideline.objects.create(user=self.user, title=title, content=content)
+
+    def test_one_pass_per_transaction(self):
+        with mock.patch.object(signals, "process_vectorization", wraps=signals.process_vectorization) as process:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                first = self._guideline("Tone", "Friendly and direct.")
+                self._guideline("Terms", "Say members, not customers.")
+                first.content = "Friendly, direct and brief."
+                first.save()
+                self.assertFalse(self._chunks().exists())  # nothing runs before the commit
+        self.assertEqual(len(callbacks), 1)
+        process.assert_called_once()
+        self.assertEqual(sorted(process.call_args.args[0]), sorted(BrandGuideline.objects.values_list("id", flat=True)))
+        self.assertEqual(
+            set(self._chunks().values_list("text", flat=True)),
+            {"Tone\nFriendly, direct and brief.", "Terms\nSay members, not customers."},
+        )
+        self.assertTrue(all(BrandGuideline.objects.values_list("content_hash", flat=True)))
+
+    @override_settings(VECTORIZE_IN_BACKGROUND=True, BACKGROUND_JOBS_ENABLED=True)
+    def test_background_batches_become_one_job_per_user(self):
+        other = _user("guidelines-2")
+        with self.captureOnCommitCallbacks(execute=True):
+            self._guideline("Tone", "Friendly.")
+            self._guideline("Terms", "Members.")
+            BrandGuideline.objects.create(user=other, title="Style", content="Short.")
+        jobs = Job.objects.filter(kind="vectorize")
+        self.assertEqual(sorted((job.user_id, len(job.payload["guidelines"])) for job in jobs), sorted([(self.user.id, 2), (other.id, 1)]))
+        self.assertFalse(VectorizedChunk.objects.exists())
+        while (job := claim_next("w")) is not None:
+            self.assertEqual(run_job(job).status, Job.SUCCEEDED)
+        self.assertEqual(VectorizedChunk.objects.filter(source_type="guideline").count(), 3)
+
+
+class GuidelineVectorizationCommitTests(TransactionTestCase):
+    """The same signals across real commits, rollbacks and autocommit saves."""
+
+    def setUp(self):
+        self.user = _user("committer")
+
+    def _chunk_texts(self) -> list[str]:
+        return sorted(VectorizedChunk.objects.filter(user=self.user, source_type="guideline").values_list("text", flat=True))
+
+    def test_rollback_then_fresh_batch(self):
+        with mock.patch.object(signals, "process_vectorization", wraps=signals.process_vectorization) as process:
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    BrandGuideline.objects.create(user=self.user, title="Tone", content="Friendly.")
+                    raise RuntimeError("abort")
+            process.assert_not_called()
+            self.assertFalse(BrandGuideline.objects.exists())
+
+            with transaction.atomic():
+                BrandGuideline.objects.create(user=self.user, title="Style", content="Short sentences.")
+                BrandGuideline.objects.create(user=self.user, title="Terms", content="Members.")
+            process.assert_called_once()
+        self.assertEqual(self._chunk_texts(), ["Style\nShort sentences.", "Terms\nMembers."])
+
+    def test_rolled_back_savepoint_keeps_outer_changes(self):
+        with transaction.atomic():
+            BrandGuideline.objects.create(user=self.user, title="Tone", content="Friendly.")
+            try:
+                with transaction.atomic():
+                    BrandGuideline.objects.create(user=self.user, title="Gone", content="Rolled back.")
+                    raise RuntimeError("abort")
+            except RuntimeError:
+                pass
+        self.assertEqual(self._chunk_texts(), ["Tone\nFriendly."])
+
+    def test_delete_in_rolled_back_savepoint_keeps_vectors(self):
+        kept = BrandGuideline.objects.create(user=self.user, title="Tone", content="Friendly.")
+        with transaction.atomic():
+            BrandGuideline.objects.create(user=self.user, title="Terms", content="Members.")
+            try:
+                with transaction.atomic():
+                    kept.delete()
+                    raise RuntimeError("abort")
+            except RuntimeError:
+                pass
+        self.assertTrue(BrandGuideline.objects.filter(title="Tone").exists())
+        self.assertEqual(self._chunk_texts(), ["Terms\nMembers.", "Tone\nFriendly."])
+
+    def test_autocommit_save_unchanged_save_and_delete(self):
+        guideline = BrandGuideline.objects.create(user=self.user, title="Tone", content="Friendly.")
+        self.assertEqual(self._chunk_texts(), ["Tone\nFriendly."])
+        chunk_ids = set(VectorizedChunk.objects.values_list("id", flat=True))
+        guideline.refresh_from_db()
+        with mock.patch.object(signals, "process_vectorization") as process:
+            guideline.save()
+        process.assert_not_called()
+        self.assertEqual(set(VectorizedChunk.objects.values_list("id", flat=True)), chunk_ids)
+        guideline.delete()
+        self.assertEqual(self._chunk_texts(), [])
@@ -7,8 +7,11 @@ from .views import (
     uploaded_campaigns_list,
     upload_campaign_file,
     uploaded_campaign_detail,
+    uploaded_campaign_campaigns,
+    uploaded_campaign_item,
     linkedin_scrape,
     website_scrape,
+    job_status,
 )
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
@@ -46,8 +49,16 @@ urlpatterns = [
     ),
     path("uploaded-campaigns/upload", upload_campaign_file),
     path("uploaded-campaigns/<int:upload_id>/", uploaded_campaign_detail, name="uploaded_campaign_detail"),
+    path("uploaded-campaigns/<int:upload_id>/campaigns/", uploaded_campaign_campaigns, name="uploaded_campaign_campaigns"),
+    path(
+        "uploaded-campaigns/<int:upload_id>/campaigns/<int:position>/",
+        uploaded_campaign_item,
+        name="uploaded_campaign_item",
+    ),
     # LinkedIn scraping
     path("linkedin/scrape/", linkedin_scrape, name="linkedin_scrape"),
     # Website scraping
     path("website/scrape/", website_scrape, name="website_scrape"),
+    # Background jobs
+    path("jobs/<int:job_id>/", job_status, name="job_status"),
 ]
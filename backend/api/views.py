@@ -1,14 +1,20 @@
 from django.contrib.auth.models import User
 from django.conf import settings
+from django.db import transaction
 from .serializers import (
     UserSerializer,
     OAuthUserRegistrationSerializer,
     BrandGuidelineSerializer,
     UploadedCampaignSerializer,
+    CampaignSerializer,
     LinkedInScrapeSerializer,
     WebsiteScrapeSerializer,
+    JobSerializer,
 )
-from .models import BrandGuideline, UploadedCampaign, LinkedInScrape, WebsiteScrape
+from .models import BrandGuideline, UploadedCampaign, Campaign, LinkedInScrape, WebsiteScrape, Job
+from .jobs import enqueue, job_handler, jobs_enabled, no_progress
+from .campaign_parsing import CampaignParseError, campaign_text, iter_campaigns
+from vectorstore.http_client import cached_get
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
@@ -17,18 +23,23 @@ from google.oauth2 import id_token
 from google.auth.transport import requests
 from rest_framework.request import Request
 from rest_framework import status
-import csv as pycsv
 import json
 from typing import Any
-import requests as http_requests
 import re
+import hashlib
 import html as html_lib
+import uuid
+from pathlib import Path
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from typing import Iterator
 from urllib.parse import urljoin, urlparse, urlunparse
 
 # Robust HTML decoding and extraction
 from charset_normalizer import from_bytes as cn_from_bytes
+from .html_extract import anchor_links, extract_post, feed_links, parse_html, parse_xml, sitemap_locs
 from bs4 import BeautifulSoup
-import trafilatura
 import ftfy
 
 
@@ -225,7 +236,9 @@ def uploaded_campaigns_list(request: Request) -> Response:
 @permission_classes([IsAuthenticated])
 def uploaded_campaign_detail(request: Request, upload_id: int) -> Response:
     """
-    Returns or deletes a single upload for the authenticated user.
+    Returns or deletes a single upload for the authenticated user. parsed_campaigns holds
+    the first UPLOAD_DETAIL_CAMPAIGNS campaigns; page through the rest with
+    uploaded-campaigns/<upload_id>/campaigns/.
     Endpoint: uploaded-campaigns/<upload_id>/
     """
     upload = UploadedCampaign.objects.filter(id=upload_id, user=request.user).first()
@@ -234,116 +247,209 @@ def uploaded_campaign_detail(request: Request, upload_id: int) -> Response:
     if request.method == "DELETE":
         upload.delete()
         return Response(status=204)
-    return Response(UploadedCampaignSerializer(upload).data)
+    data = UploadedCampaignSerializer(upload).data
+    head = upload.campaigns.order_by("position")[:_upload_setting("UPLOAD_DETAIL_CAMPAIGNS", 50)]
+    data["parsed_campaigns"] = CampaignSerializer(head, many=True).data
+    if request.query_params.get("raw") in ("1", "true"):
+        data["raw_content"] = upload.raw_content
+    return Response(data)
+
+
+CAMPAIGNS_MAX_PAGE = 200
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def uploaded_campaign_campaigns(request: Request, upload_id: int) -> Response:
+    """
+    Page through the parsed campaigns of an upload in file order.
+    Endpoint: uploaded-campaigns/<upload_id>/campaigns/?offset=0&limit=50
+    """
+    upload = UploadedCampaign.objects.filter(id=upload_id, user=request.user).first()
+    if not upload:
+        return Response({"error": "Not found"}, status=404)
+    try:
+        offset = max(int(request.query_params.get("offset") or 0), 0)
+        limit = min(max(int(request.query_params.get("limit") or 50), 1), CAMPAIGNS_MAX_PAGE)
+    except (TypeError, ValueError):
+        return Response({"error": "offset and limit must be integers"}, status=400)
+    page = list(upload.campaigns.order_by("position")[offset:offset + limit])
+    next_offset = offset + limit if offset + limit < upload.campaign_count else None
+    return Response({
+        "results": CampaignSerializer(page, many=True).data,
+        "count": upload.campaign_count,
+        "offset": offset,
+        "next_offset": next_offset,
+    })
+
+
+@api_view(["GET", "PATCH"])
+@permission_classes([IsAuthenticated])
+def uploaded_campaign_item(request: Request, upload_id: int, position: int) -> Response:
+    """
+    Returns or edits one parsed campaign; an edit re-embeds only that campaign.
+    Endpoint: uploaded-campaigns/<upload_id>/campaigns/<position>/
+    """
+    campaign = Campaign.objects.filter(upload_id=upload_id, upload__user=request.user, position=position).select_related("upload").first()
+    if not campaign:
+        return Response({"error": "Not found"}, status=404)
+    if request.method == "GET":
+        return Response(CampaignSerializer(campaign).data)
+
+    serializer = CampaignSerializer(campaign, data=request.data, partial=True)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=400)
+    from vectorstore.ingest import chunk_hash
+    from .signals import reindex_upload_campaigns
+
+    campaign = serializer.save()
+    text = campaign_text({"title": campaign.title, "content": campaign.content})
+    new_hash = chunk_hash(text) if text else ""
+    data = CampaignSerializer(campaign).data
+    if new_hash != campaign.content_hash:
+        Campaign.objects.filter(id=campaign.id).update(content_hash=new_hash)
+        synced = reindex_upload_campaigns(campaign.upload)
+        data["reindexed"] = {"chunks_added": len(synced.created_ids), "chunks_deleted": len(synced.deleted_ids)}
+    return Response(data)
+
+
+def _job_accepted(job: Job) -> Response:
+    """202 response for an enqueued job; poll jobs/<id>/ for progress and the result."""
+    return Response({"job_id": job.id, "status": job.status, "kind": job.kind}, status=202)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def job_status(request: Request, job_id: int) -> Response:
+    """Status, progress counters, timings and (once finished) the result of one of the user's jobs."""
+    job = Job.objects.filter(user=request.user, id=job_id).first()
+    if not job:
+        return Response({"error": "Not found"}, status=404)
+    return Response(JobSerializer(job).data)
+
+
+def _upload_setting(name: str, default: int) -> int:
+    return int(getattr(settings, name, default))
 
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def upload_campaign_file(request: Request) -> Response:
     """
-    Accepts multipart/form-data with 'file' field, size <= 5MB.
+    Accepts multipart/form-data with 'file' field, size <= UPLOAD_MAX_BYTES with background
+    jobs enabled and <= UPLOAD_SYNC_MAX_BYTES without.
     Auto-detects file_type from extension and stores raw content.
+    Campaigns are parsed and embedded as a stream into Campaign rows.
     Endpoint: uploaded-campaigns/upload/
     """
     if "file" not in request.FILES:
         return Response({"error": "No file provided"}, status=status.HTTP_400_BAD_REQUEST)
 
     upload = request.FILES["file"]
-    max_size = 5 * 1024 * 1024
+    # Files above the synchronous cap are only accepted when a job worker parses them
+    if jobs_enabled():
+        max_size = _upload_setting("UPLOAD_MAX_BYTES", 1024 * 1024 * 1024)
+    else:
+        max_size = _upload_setting("UPLOAD_SYNC_MAX_BYTES", 5 * 1024 * 1024)
     if upload.size > max_size:
-        return Response({"error": "File too large (max 5MB)"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"error": f"File too large (max {max_size // (1024 * 1024)}MB)"}, status=status.HTTP_400_BAD_REQUEST)
 
     filename: str = upload.name
     ext = filename.split(".")[-1].lower() if "." in filename else ""
     if ext not in ["csv", "txt", "json"]:
         return Response({"error": "Unsupported file type"}, status=status.HTTP_400_BAD_REQUEST)
 
+    payload = {"filename": filename, "file_type": ext, "size": upload.size}
+    if jobs_enabled():
+        # Spool the upload to disk (chunk by chunk) for the worker to stream from
+        spool_dir = Path(getattr(settings, "UPLOAD_SPOOL_DIR", Path(settings.BASE_DIR) / "var" / "uploads"))
+        spool_dir.mkdir(parents=True, exist_ok=True)
+        path = spool_dir / f"{uuid.uuid4().hex}.{ext}"
+        try:
+            with open(path, "wb") as out:
+                for part in upload.chunks():
+                    out.write(part)
+        except Exception:
+            path.unlink(missing_ok=True)
+            return Response({"error": "Failed to read file"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            job = enqueue(request.user, "upload_campaign_file", {**payload, "path": str(path)})
+        except Exception:
+            path.unlink(missing_ok=True)
+            raise
+        return _job_accepted(job)
     try:
-        raw_bytes = upload.read()
-        raw_text = raw_bytes.decode("utf-8", errors="replace")
+        upload.seek(0)
     except Exception:
         return Response({"error": "Failed to read file"}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(*_ingest_campaign_file(request.user, payload, upload.file))
 
-    # Parse campaigns based on file type
-    def _normalize_record(record: dict) -> dict:
-        title = (
-            record.get("title")
-            or record.get("subject")
-            or record.get("Subject")
-            or record.get("Title")
-            or "Untitled"
-        )
-        content = (
-            record.get("content")
-            or record.get("body")
-            or record.get("Body")
-            or record.get("Content")
-            or ""
-        )
-        normalized = {"title": str(title).strip(), "content": str(content).strip()}
-        # include other keys as metadata if present
-        extras = {k: v for k, v in record.items() if k not in ["title", "subject", "Subject", "Title", "content", "body", "Body", "Content"]}
-        if extras:
-            normalized["meta"] = extras
-        return normalized
-
-    def parse_csv(text: str) -> list[dict]:
-        try:
-            rows = list(pycsv.DictReader(text.splitlines()))
-            return [_normalize_record(r) for r in rows if any(v for v in r.values())]
-        except Exception:
-            return []
 
-    def parse_txt(text: str) -> list[dict]:
-        # Heuristics: split on lines of dashes/equals or two+ blank lines
-        import re
+@job_handler("upload_campaign_file")
+def _store_campaign_upload(user, payload: dict, progress=no_progress) -> tuple[dict, int]:
+    """Parse a spooled campaign upload and store it; run_job removes the spool file afterwards."""
+    with open(payload["path"], "rb") as fh:
+        return _ingest_campaign_file(user, payload, fh, progress)
 
-        blocks = re.split(r"\n\s*[-=]{3,}\s*\n|\n{2,}", text.strip())
-        items = []
-        for block in blocks:
-            b = block.strip()
-            if not b:
-                continue
-            lines = [ln.strip() for ln in b.splitlines() if ln.strip()]
-            if not lines:
-                continue
-            title = lines[0][:120]
-            content = "\n".join(lines[1:]) if len(lines) > 1 else ""
-            items.append({"title": title, "content": content})
-        return items
 
-    def parse_json(text: str) -> list[dict]:
-        try:
-            data = json.loads(text)
-        except Exception:
-            return []
-        records: list[dict] = []
-        if isinstance(data, list):
-            records = [r for r in data if isinstance(r, dict)]
-        elif isinstance(data, dict):
-            if isinstance(data.get("campaigns"), list):
-                records = [r for r in data.get("campaigns") if isinstance(r, dict)]
-            else:
-                records = [data]
-        return [_normalize_record(r) for r in records]
-
-    parsed: list[dict]
-    if ext == "csv":
-        parsed = parse_csv(raw_text)
-    elif ext == "txt":
-        parsed = parse_txt(raw_text)
+def _ingest_campaign_file(user, payload: dict, fh, progress=no_progress) -> tuple[dict, int]:
+    """
+    Parse the file incrementally and write each batch of campaigns as Campaign rows and
+    vector chunks, so memory stays flat for any file size. raw_content keeps the whole
+    file up to UPLOAD_INLINE_MAX_BYTES and only its head above that.
+    """
+    from vectorstore.ingest import chunk_hash, ingest_batch_size, ingest_chunks, throughput
+
+    filename, ext = payload["filename"], payload["file_type"]
+    if payload["size"] <= _upload_setting("UPLOAD_INLINE_MAX_BYTES", 5 * 1024 * 1024):
+        raw_content = fh.read().decode("utf-8", errors="replace")
     else:
-        parsed = parse_json(raw_text)
-
-    created = UploadedCampaign.objects.create(
-        user=request.user,
-        filename=filename,
-        file_type=ext,
-        raw_content=raw_text,
-        parsed_campaigns=parsed,
-        campaign_count=len(parsed),
-    )
-    return Response(UploadedCampaignSerializer(created).data, status=201)
+        raw_content = fh.read(_upload_setting("UPLOAD_RAW_PREVIEW_BYTES", 256 * 1024)).decode("utf-8", errors="replace")
+    fh.seek(0)
+    created = UploadedCampaign.objects.create(user=user, filename=filename, file_type=ext, raw_content=raw_content)
+    batch_size = ingest_batch_size()
+    rows: list[Campaign] = []
+    texts: list[str] = []
+    count = embedded = 0
+    ingest_seconds = 0.0
+
+    def flush() -> int:
+        nonlocal ingest_seconds
+        Campaign.objects.bulk_create(rows, batch_size=batch_size)
+        result = ingest_chunks(user.id, "upload", created.id, texts)
+        ingest_seconds += result.seconds
+        return result.rows
+
+    try:
+        for item in iter_campaigns(fh, ext):
+            text = campaign_text(item)
+            rows.append(Campaign(
+                upload=created,
+                position=count,
+                title=item["title"],
+                content=item["content"],
+                meta=item.get("meta"),
+                content_hash=chunk_hash(text) if text else "",
+            ))
+            if text:
+                texts.append(text)
+            count += 1
+            if len(rows) >= batch_size:
+                embedded += flush()
+                rows, texts = [], []
+                progress(campaigns_parsed=count, chunks_embedded=embedded)
+        embedded += flush()
+    except Exception as exc:
+        created.delete()  # cascades to the campaigns; post_delete drops the chunks embedded so far
+        if isinstance(exc, CampaignParseError):
+            return {"error": str(exc)}, 400
+        raise
+    progress(campaigns_parsed=count, chunks_embedded=embedded)
+    UploadedCampaign.objects.filter(id=created.id).update(campaign_count=count)
+    created.campaign_count = count
+    data = UploadedCampaignSerializer(created).data
+    data["ingest"] = throughput(embedded, ingest_seconds)
+    return data, 201
 
 
 @api_view(["GET", "POST"])
@@ -369,8 +475,17 @@ def linkedin_scrape(request: Request) -> Response:
     if not (url.startswith("http://") or url.startswith("https://")):
         url = "https://" + url
 
+    if jobs_enabled():
+        return _job_accepted(enqueue(request.user, "linkedin_scrape", {"url": url}))
+    return Response(*_run_linkedin_scrape(request.user, {"url": url}))
+
+
+@job_handler("linkedin_scrape")
+def _run_linkedin_scrape(user, payload: dict, progress=no_progress) -> tuple[dict, int]:
+    """Fetch and store one LinkedIn page for the user."""
+    url = payload["url"]
     try:
-        resp = http_requests.get(
+        resp = cached_get(
             url,
             timeout=10,
             headers={
@@ -378,10 +493,10 @@ def linkedin_scrape(request: Request) -> Response:
             },
         )
         if not resp.ok:
-            return Response({"error": f"Failed to fetch page: {resp.status_code}"}, status=400)
+            return {"error": f"Failed to fetch page: {resp.status_code}"}, 400
         html = resp.text or ""
     except Exception as e:
-        return Response({"error": str(e)}, status=400)
+        return {"error": str(e)}, 400
 
     # Heuristic HTML -> text extraction (no external parsers to keep deps minimal)
     def _extract_visible_text(doc: str) -> str:
@@ -411,7 +526,7 @@ def linkedin_scrape(request: Request) -> Response:
                 idx = parts.index('company')
                 base_path = '/'.join(parts[: idx + 2])  # /company/{slug}
                 fallback_url = f"{parsed.scheme or 'https'}://{parsed.netloc}{base_path}"
-                fresp = http_requests.get(fallback_url, timeout=10, headers={"User-Agent": "Mozilla/5.0"})
+                fresp = cached_get(fallback_url, timeout=10, headers={"User-Agent": "Mozilla/5.0"})
                 if fresp.ok:
                     ftext = _extract_visible_text(fresp.text or "")
                     if ftext:
@@ -420,19 +535,20 @@ def linkedin_scrape(request: Request) -> Response:
             pass
 
     if not text:
-        return Response({
+        return {
             "error": "LinkedIn returned no public content; try a public About page or paste text manually.",
-        }, status=400)
+        }, 400
 
     # Keep a reasonable cap
     if len(text) > 20000:
         text = text[:20000]
 
-    obj = LinkedInScrape.objects.create(user=request.user, url=url, content=text)
+    progress(pages_fetched=1)
+    obj = LinkedInScrape.objects.create(user=user, url=url, content=text)
     data = LinkedInScrapeSerializer(obj).data
     # provide small preview
     data["preview_texts"] = [text[:1000]] if text else []
-    return Response(data, status=201)
+    return data, 201
 
 
 @api_view(["GET", "POST"])
@@ -468,7 +584,7 @@ def trustpilot_scrape(request: Request) -> Response:
     }
 
     def fetch(u: str) -> str:
-        r = http_requests.get(u, headers=headers, timeout=20)
+        r = cached_get(u, headers=headers, timeout=20)
         raw = r.content or b""
         try:
             best = cn_from_bytes(raw).best()
@@ -707,6 +823,45 @@ def trustpilot_scrape(request: Request) -> Response:
     return Response(data_resp, status=201)
 
 
+# Concurrent page fetching for website_scrape: bounded pool, per-host limit, overall deadline
+WEBSITE_FETCH_WORKERS = int(getattr(settings, "WEBSITE_FETCH_WORKERS", 8))
+WEBSITE_FETCH_PER_HOST = int(getattr(settings, "WEBSITE_FETCH_PER_HOST", 4))
+WEBSITE_FETCH_DEADLINE = float(getattr(settings, "WEBSITE_FETCH_DEADLINE", 60))
+
+
+def _fetch_concurrently(fetch, urls: list[str], deadline: float) -> Iterator[tuple[int, str, str | None]]:
+    """
+    Run fetch(url) for every url on a thread pool, at most WEBSITE_FETCH_PER_HOST at a
+    time per host, and yield (index, url, result or None) in completion order until the
+    time.monotonic() `deadline`. Fetches still running at the deadline are abandoned.
+    """
+    if not urls:
+        return
+    host_limits: dict[str, threading.BoundedSemaphore] = {}
+    for u in urls:
+        host_limits.setdefault(urlparse(u).netloc.lower(), threading.BoundedSemaphore(WEBSITE_FETCH_PER_HOST))
+
+    def run(u: str) -> str | None:
+        with host_limits[urlparse(u).netloc.lower()]:
+            if time.monotonic() >= deadline:
+                return None
+            try:
+                return fetch(u)
+            except Exception:
+                return None
+
+    pool = ThreadPoolExecutor(max_workers=min(WEBSITE_FETCH_WORKERS, len(urls)), thread_name_prefix="website-fetch")
+    futures = {pool.submit(run, u): i for i, u in enumerate(urls)}
+    try:
+        for fut in as_completed(futures, timeout=max(deadline - time.monotonic(), 0)):
+            i = futures[fut]
+            yield i, urls[i], fut.result()
+    except FuturesTimeout:
+        pass
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
 @api_view(["GET", "POST"])
 @permission_classes([IsAuthenticated])
 def website_scrape(request: Request) -> Response:
@@ -758,6 +913,20 @@ def website_scrape(request: Request) -> Response:
     except Exception:
         pass
 
+    # "full": true drops the previous scrape and rebuilds; otherwise re-scraping the
+    # same URL only touches posts and chunks that changed
+    job_payload = {"url": url, "full": bool(data.get("full"))}
+    if jobs_enabled():
+        return _job_accepted(enqueue(request.user, "website_scrape", job_payload))
+    return Response(*_run_website_scrape(request.user, job_payload))
+
+
+@job_handler("website_scrape")
+def _run_website_scrape(user, payload: dict, progress=no_progress) -> tuple[dict, int]:
+    """Discover, fetch and extract the posts of a blog and index them for the user."""
+    url = payload["url"]
+    deadline = time.monotonic() + WEBSITE_FETCH_DEADLINE
+
     def fetch_html(u: str) -> str:
         # Try a few strategies: https verify on, https verify off, http
         headers = {
@@ -774,8 +943,11 @@ def website_scrape(request: Request) -> Response:
             attempts.append((u, False))
         last_exc = None
         for target, verify in attempts:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
             try:
-                r = http_requests.get(target, timeout=25, headers=headers, verify=verify)
+                r = cached_get(target, timeout=min(25, remaining), headers=headers, verify=verify)
                 # proceed even if status is non-2xx
                 raw = r.content or b""
                 best = None
@@ -829,23 +1001,22 @@ def website_scrape(request: Request) -> Response:
             ]
         except Exception:
             pass
-        found: list[str] = []
-        for sm in sitemap_urls:
+        found: list[list[str]] = [[] for _ in sitemap_urls]
+        for i, sm, xml_text in _fetch_concurrently(fetch_html, sitemap_urls, deadline):
             try:
-                xml_text = fetch_html(sm)
                 if not xml_text:
                     continue
-                sx = BeautifulSoup(xml_text, "xml")
-                for loc in sx.find_all("loc"):
-                    href = (loc.text or "").strip()
-                    if not href:
-                        continue
+                sx = parse_xml(xml_text)
+                if sx is None:
+                    continue
+                for href in sitemap_locs(sx):
                     low = href.lower()
                     if any(seg in low for seg in ["blog", "post", "article", "news"]):
-                        found.append(href)
+                        found[i].append(href)
             except Exception:
                 continue
-        return found
+        # Keep the sitemap order regardless of which one answered first
+        return [href for hrefs in found for href in hrefs]
 
     try:
         index_html = fetch_html(url)
@@ -853,15 +1024,13 @@ def website_scrape(request: Request) -> Response:
         # Try sitemap discovery as fallback
         sitemap_found = fetch_sitemap_candidates(url)
         if not sitemap_found:
-            return Response({"error": f"Could not fetch page and no sitemap found for {url}. {e}"}, status=200)
+            return {"error": f"Could not fetch page and no sitemap found for {url}. {e}"}, 200
         index_html = ""
 
-    # Discover post links using DOM signals
-    soup = BeautifulSoup(index_html, "lxml")
+    # Discover post links using DOM signals (one lxml tree for the whole index page)
+    index_tree = parse_html(index_html)
     candidates: list[str] = []
-    for a in soup.find_all("a", href=True):
-        href = a["href"].strip()
-        full = urljoin(url, href)
+    for full in (anchor_links(index_tree, url) if index_tree is not None else []):
         path = urlparse(full).path.lower()
         if any(seg in path for seg in [
             "blog", "post", "article", "news",
@@ -871,11 +1040,9 @@ def website_scrape(request: Request) -> Response:
             candidates.append(full)
 
     # Fallback: links inside <article>, headings, or pagination blocks
-    if not candidates:
-        for art in soup.find_all(["main", "article", "section"]):
-            for a in art.find_all("a", href=True):
-                href = a["href"].strip()
-                full = urljoin(url, href)
+    if not candidates and index_tree is not None:
+        for art in index_tree.iter("main", "article", "section"):
+            for full in anchor_links(art, url):
                 path = urlparse(full).path.lower()
                 if any(seg in path for seg in [
                     "blog", "post", "article", "news",
@@ -884,24 +1051,16 @@ def website_scrape(request: Request) -> Response:
                     candidates.append(full)
 
     # Fallback 2: RSS/Atom feeds advertised in <link rel="alternate"> if no obvious post links
-    if not candidates:
-        for l in soup.find_all("link", rel=True, href=True):
-            rels = " ".join(l.get("rel") or [])
+    if not candidates and index_tree is not None:
+        for l in index_tree.iter("link"):
+            rels = l.get("rel") or ""
             typ = (l.get("type") or "").lower()
-            if "alternate" in rels.lower() and any(x in typ for x in ("rss", "atom", "xml")):
-                feed_url = urljoin(url, l["href"])
+            if l.get("href") and "alternate" in rels.lower() and any(x in typ for x in ("rss", "atom", "xml")):
+                feed_url = urljoin(url, l.get("href"))
                 try:
-                    feed_html = fetch_html(feed_url)
-                    feed_soup = BeautifulSoup(feed_html, "xml")
-                    for item in feed_soup.find_all(["item", "entry"]):
-                        link_tag = item.find("link")
-                        href = None
-                        if link_tag and link_tag.has_attr("href"):
-                            href = link_tag["href"]
-                        elif link_tag and link_tag.text:
-                            href = link_tag.text
-                        if href:
-                            candidates.append(urljoin(url, href.strip()))
+                    feed_tree = parse_xml(fetch_html(feed_url))
+                    if feed_tree is not None:
+                        candidates.extend(feed_links(feed_tree, url))
                 except Exception:
                     pass
 
@@ -939,85 +1098,124 @@ def website_scrape(request: Request) -> Response:
 
     if not candidates:
         # Return gracefully with message so UI can show it
-        return Response({"url": url, "error": "No blog-like links were discovered on this page or its sitemaps."}, status=200)
+        return {"url": url, "error": "No blog-like links were discovered on this page or its sitemaps."}, 200
 
-    # Before ingesting new site, delete previous website scrapes and their vectors for this user
     from vectorstore.models import VectorizedChunk
-    WebsiteScrape.objects.filter(user=request.user).delete()
-    VectorizedChunk.objects.filter(user=request.user, source_type="website").delete()
+    from vectorstore.hooks import chunks_deleted, collection_dropped
+    from vectorstore.ingest import ingest_chunks, split_chunks, sync_chunks
+
+    previous = None
+    if not payload.get("full"):
+        previous = WebsiteScrape.objects.filter(user=user, url=url).order_by("-created_at", "-id").first()
+    if previous is None:
+        # Before ingesting new site, delete previous website scrapes and their vectors for this user
+        WebsiteScrape.objects.filter(user=user).delete()
+        VectorizedChunk.objects.filter(user=user, source_type="website").delete()
+        collection_dropped(user.id, "website")
+    else:
+        # Incremental re-scrape of the same site: only scrapes of other sites are dropped
+        others = list(WebsiteScrape.objects.filter(user=user).exclude(id=previous.id).values_list("id", flat=True))
+        for other_id in others:
+            stale = VectorizedChunk.objects.filter(user=user, source_type="website", source_id=other_id)
+            stale_ids = list(stale.values_list("id", flat=True))
+            stale.delete()
+            chunks_deleted(user.id, "website", stale_ids, other_id)
+        if others:
+            WebsiteScrape.objects.filter(id__in=others).delete()
+    previous_posts = {p.get("url"): p for p in (previous.posts if previous and isinstance(previous.posts, list) else [])}
 
     # fetch each post, extract main content and index via vectorstore ingest
-    from vectorstore.utils import sentence_split, text_to_vector
-    from vectorstore.models import VectorizedChunk
-
-    full_posts: list[dict] = []
-    preview_texts: list[str] = []
+    posts_by_index: dict[int, tuple[dict, list[str]]] = {}
+    unchanged_pages = 0
+    progress(posts_total=len(post_urls), posts_fetched=0)
 
-    for purl in post_urls:
+    # Posts are extracted as their downloads complete; the pool keeps fetching meanwhile
+    for fetched, (i, purl, phtml) in enumerate(_fetch_concurrently(fetch_html, post_urls, deadline), 1):
+        progress(posts_fetched=fetched)
         try:
-            phtml = fetch_html(purl)
-            # Prefer trafilatura's robust main-content extraction
-            extracted = trafilatura.extract(
-                phtml,
-                include_comments=False,
-                include_tables=False,
-                favor_recall=True,
-                url=purl,
-            )
-            if not extracted:
-                # fallback to visible-text via BeautifulSoup
-                s = BeautifulSoup(phtml, "lxml")
-                for tag in s(["script", "style", "noscript"]):
-                    tag.decompose()
-                text_nodes = s.get_text("\n")
-                extracted = re.sub(r"\s+", " ", text_nodes).strip()
+            old_post = previous_posts.get(purl)
+            if not phtml:
+                # Not fetched this time; the stored copy is kept below
+                continue
+            page_hash = hashlib.sha256(phtml.encode("utf-8", "replace")).hexdigest()
+            if old_post and old_post.get("page_hash") == page_hash:
+                unchanged_pages += 1
+                posts_by_index[i] = (old_post, split_chunks([old_post.get("text") or ""]))
+                continue
+            # One parse per post: title lookup and trafilatura's main-content extraction
+            # share the tree (plain visible text is the fallback)
+            extracted = extract_post(phtml, purl)
+            if extracted is None:
+                continue
+            title, main_text = extracted
 
             # Normalize/fix text and cap to a reasonable size
-            ptext = ftfy.fix_text(extracted).strip()
+            ptext = ftfy.fix_text(main_text).strip()
             if not ptext:
                 continue
 
-            # Derive a reasonable title
-            st = BeautifulSoup(phtml, "lxml")
-            title_tag = st.find("h1") or st.find("title")
-            title = title_tag.get_text(strip=True) if title_tag else "Untitled"
-
-            # Collect post for auditing UI
-            full_posts.append({"url": purl, "title": title, "text": ptext})
-
-            # Ingest: treat each full post as multiple chunks
-            chunks = sentence_split(ptext)
-            for ch in chunks:
-                if not ch.strip():
-                    continue
-                VectorizedChunk.objects.create(
-                    user=request.user,
-                    source_type="website",
-                    source_id=0,  # temporary; reassigned after obj exists
-                    text=ch,
-                    vector=text_to_vector(ch),
-                )
-                if len(preview_texts) < 20:
-                    preview_texts.append(ch)
+            # Collect post for auditing UI; ingest each full post as multiple chunks
+            post = {"url": purl, "title": title, "text": ptext, "page_hash": page_hash}
+            posts_by_index[i] = (post, split_chunks([ptext]))
         except Exception:
             continue
 
-    # Create WebsiteScrape record and backfill source_id on chunks belonging to this scrape
-    obj = WebsiteScrape.objects.create(user=request.user, url=url, post_urls=post_urls, posts=full_posts)
-
-    # Update chunks created above to reference the new obj.id
-    VectorizedChunk.objects.filter(user=request.user, source_type="website", source_id=0).update(source_id=obj.id)
+    # Posts that were not fetched (failure, fetch deadline) or extracted this time keep
+    # their stored copy, so a partial re-scrape never drops indexed posts
+    for i, purl in enumerate(post_urls):
+        old_post = previous_posts.get(purl)
+        if i not in posts_by_index and old_post:
+            posts_by_index[i] = (old_post, split_chunks([old_post.get("text") or ""]))
+
+    # Back to discovery order, independent of which fetch finished first
+    ordered = [posts_by_index[i] for i in sorted(posts_by_index)]
+    full_posts = [post for post, _ in ordered]
+    post_chunks = [chunk for _, chunks in ordered for chunk in chunks]
+
+    if previous is None:
+        # Create the WebsiteScrape record first so every chunk gets its source_id up front,
+        # then embed and insert all chunks of the scrape in one batch
+        with transaction.atomic():
+            obj = WebsiteScrape.objects.create(user=user, url=url, post_urls=post_urls, posts=full_posts)
+            ingested = ingest_chunks(user.id, "website", obj.id, post_chunks)
+        changes = {"chunks_added": ingested.rows, "ingest": ingested.summary()}
+        status_code = 201
+    else:
+        obj = previous
+        changed_posts = [
+            p["url"] for p in full_posts
+            if (previous_posts.get(p["url"]) or {}).get("text") != p["text"]
+        ]
+        # Chunks are diffed by content hash, so identical chunks are never re-embedded
+        with transaction.atomic():
+            synced = sync_chunks(user.id, "website", obj.id, post_chunks)
+            if obj.post_urls != post_urls or obj.posts != full_posts:
+                obj.post_urls, obj.posts = post_urls, full_posts
+                obj.save(update_fields=["post_urls", "posts"])
+        changes = {
+            "posts_unchanged": unchanged_pages,
+            "posts_changed": len(changed_posts),
+            "posts_removed": len(set(previous_posts) - {p["url"] for p in full_posts}),
+            "chunks_kept": synced.kept,
+            "chunks_added": len(synced.created_ids),
+            "chunks_deleted": len(synced.deleted_ids),
+            "ingest": synced.summary(),
+        }
+        status_code = 200
+    progress(posts_extracted=len(full_posts), chunks_embedded=changes["chunks_added"])
+    preview_texts = post_chunks[:20]
 
-    payload = WebsiteScrapeSerializer(obj).data
-    payload["preview_texts"] = preview_texts
+    data_resp = WebsiteScrapeSerializer(obj).data
+    data_resp["preview_texts"] = preview_texts
     # lightweight previews of posts for UI auditing
-    payload["preview_posts"] = [
+    data_resp["preview_posts"] = [
         {"url": p["url"], "title": p["title"], "sample": p["text"][:800]}
         for p in (full_posts[:10] if full_posts else [])
     ]
     # include a small number of full posts to inspect complete content
-    payload["preview_posts_full"] = [
+    data_resp["preview_posts_full"] = [
         {"url": p["url"], "title": p["title"], "text": p["text"]}
         for p in (full_posts[:5] if full_posts else [])
     ]
-    return Response(payload, status=201)
+    data_resp["changes"] = changes
+    return data_resp, status_code
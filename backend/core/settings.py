@@ -32,6 +32,101 @@ REST_FRAMEWORK = {
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# e.g. http://127.0.0.1:8765/v1 for `python manage.py fake_openai`
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+# Total/read timeouts (seconds) of streamed generations (vectorstore generate/stream/)
+OPENAI_STREAM_TIMEOUT = float(os.getenv("OPENAI_STREAM_TIMEOUT", "120"))
+OPENAI_STREAM_READ_TIMEOUT = float(os.getenv("OPENAI_STREAM_READ_TIMEOUT", "30"))
+# LLM result cache (vectorstore.llm_cache): "memory" (per process), "django"
+# (settings.CACHES[LLM_CACHE_DJANGO_ALIAS]), "sqlite" (local file) or "" to disable.
+# Requests pick "prefer" or "bypass" with their `cache` field; bypass still stores.
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory")
+LLM_CACHE_DEFAULT_MODE = os.getenv("LLM_CACHE_DEFAULT_MODE", "bypass")
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+LLM_CACHE_DJANGO_ALIAS = os.getenv("LLM_CACHE_DJANGO_ALIAS", "default")
+LLM_CACHE_SQLITE_PATH = Path(os.getenv("LLM_CACHE_SQLITE_PATH", str(BASE_DIR / "var" / "llm_cache.sqlite3")))
+# Async LLM client (vectorstore.utils): the Chat Completions fallback runs once the
+# Responses call failed. LLM_HEDGE_DELAY (unset = off) also fires it when the Responses
+# call has not succeeded after that many seconds; the fallback model may then answer and
+# both calls are billed, and reasoning models are never hedged. Per-model in-flight
+# limit; circuit breaker after consecutive upstream errors
+LLM_HEDGE_DELAY = float(os.environ["LLM_HEDGE_DELAY"]) if os.getenv("LLM_HEDGE_DELAY", "").strip() else None
+LLM_MODEL_CONCURRENCY = int(os.getenv("LLM_MODEL_CONCURRENCY", "8"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "32"))
+# Input token budget of generation prompts (vectorstore.prompt_template); 0 = unbounded.
+# PROMPT_TOKEN_BUDGETS overrides it per model name prefix, e.g. {"gpt-4o-mini": 8000}
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "12000"))
+PROMPT_TOKEN_BUDGETS: dict[str, int] = {}
+# Section order of generation prompts: "classic", or "prefix" to put the per-channel and
+# per-brand content first so the provider's prompt cache can reuse it across requests
+PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "classic")
+
+# Per-worker in-memory cache of users' vector matrices (vectorstore.cache)
+VECTOR_CACHE_MAX_BYTES = int(os.getenv("VECTOR_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Vector search backend: "auto" uses pgvector when migration 0005 could enable it,
+# "numpy" always searches in-process
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "auto")
+
+# Approximate nearest-neighbour (IVF) indexes for large collections (vectorstore.ann),
+# built by build_ann_index jobs or, without background jobs, `manage.py build_ann_indexes`
+VECTOR_ANN_ENABLED = os.getenv("VECTOR_ANN_ENABLED", "1") == "1"
+VECTOR_ANN_MIN_CHUNKS = int(os.getenv("VECTOR_ANN_MIN_CHUNKS", "20000"))
+VECTOR_INDEX_DIR = Path(os.getenv("VECTOR_INDEX_DIR", str(BASE_DIR / "var" / "vector_index")))
+
+# Memory-mapped per-user vector segments shared across workers (vectorstore.segments);
+# replaces the per-worker matrix cache for exact scans when enabled
+VECTOR_SEGMENTS_ENABLED = os.getenv("VECTOR_SEGMENTS_ENABLED", "0") == "1"
+VECTOR_SEGMENT_DIR = Path(os.getenv("VECTOR_SEGMENT_DIR", str(BASE_DIR / "var" / "vector_segments")))
+VECTOR_SEGMENT_DELTA_MAX_ROWS = int(os.getenv("VECTOR_SEGMENT_DELTA_MAX_ROWS", "5000"))
+
+# Quantized exact-scan mode (vectorstore.quantize): "none", "int8" or "binary";
+# the best VECTOR_QUANT_RERANK candidates are re-scored with float32 vectors
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+VECTOR_QUANT_RERANK = int(os.getenv("VECTOR_QUANT_RERANK", "200"))
+
+# Rows per INSERT statement when vectorstore.ingest bulk-creates chunks
+VECTOR_INGEST_BATCH_SIZE = int(os.getenv("VECTOR_INGEST_BATCH_SIZE", "1000"))
+
+# website_scrape page fetching: pool size, concurrent requests per host, and the
+# overall deadline (seconds) after which unfinished fetches are abandoned
+WEBSITE_FETCH_WORKERS = int(os.getenv("WEBSITE_FETCH_WORKERS", "8"))
+WEBSITE_FETCH_PER_HOST = int(os.getenv("WEBSITE_FETCH_PER_HOST", "4"))
+WEBSITE_FETCH_DEADLINE = float(os.getenv("WEBSITE_FETCH_DEADLINE", "60"))
+
+# Shared HTTP session (vectorstore.http_client): keep-alive pools, retries with backoff,
+# and an on-disk conditional-GET page cache for scraped pages
+HTTP_POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", "32"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.5"))
+HTTP_CACHE_ENABLED = os.getenv("HTTP_CACHE_ENABLED", "1") == "1"
+HTTP_CACHE_DIR = Path(os.getenv("HTTP_CACHE_DIR", str(BASE_DIR / "var" / "http_cache")))
+HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Campaign uploads: hard size cap with background jobs (parsed by the worker) and
+# without (parsed in the request), size up to which raw_content keeps the whole file
+# (above it only UPLOAD_RAW_PREVIEW_BYTES of the head). Spooled files wait for the job worker.
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(1024 * 1024 * 1024)))
+UPLOAD_SYNC_MAX_BYTES = int(os.getenv("UPLOAD_SYNC_MAX_BYTES", str(5 * 1024 * 1024)))
+UPLOAD_INLINE_MAX_BYTES = int(os.getenv("UPLOAD_INLINE_MAX_BYTES", str(5 * 1024 * 1024)))
+UPLOAD_RAW_PREVIEW_BYTES = int(os.getenv("UPLOAD_RAW_PREVIEW_BYTES", str(256 * 1024)))
+UPLOAD_SPOOL_DIR = Path(os.getenv("UPLOAD_SPOOL_DIR", str(BASE_DIR / "var" / "uploads")))
+# Campaigns inlined as parsed_campaigns in the upload detail response (the rest are paged)
+UPLOAD_DETAIL_CAMPAIGNS = int(os.getenv("UPLOAD_DETAIL_CAMPAIGNS", "50"))
+
+# Enqueue scrapes and uploads as api.Job rows (202 + job id) instead of running them
+# in the request; requires a `python manage.py run_jobs` worker
+BACKGROUND_JOBS_ENABLED = os.getenv("BACKGROUND_JOBS_ENABLED", "0") == "1"
+# `run_jobs --requeue-running` only requeues running jobs started longer ago than this
+# (their worker is presumed dead); keep it above the longest job you expect
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "3600"))
+# Hand guideline/upload vectorization batches (api.signals) to the job worker instead
+# of running them after the commit; only used when BACKGROUND_JOBS_ENABLED is on
+VECTORIZE_IN_BACKGROUND = os.getenv("VECTORIZE_IN_BACKGROUND", "0") == "1"
 
 # Application definition
 
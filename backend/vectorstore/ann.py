@@ -0,0 +1,361 @@
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .utils import EMBEDDING_DIM
+
+
+# Approximate nearest-neighbour search: a pure NumPy IVF index (spherical k-means
+# coarse quantizer + inverted lists) per (user, source_type), persisted as .npy files
+# so every worker can np.load(mmap_mode="r") the same pages.
+#
+# On-disk layout under VECTOR_INDEX_DIR/<user_id>/<source_type>/:
+#   manifest.json                 {"generation": g, "delta": d, "nlist": ...}
+#   base-<g>-<name>.npy           vectors/ids/source_ids sorted by list + centroids/offsets
+#   delta-<g>-<d>-<name>.npy      chunks added since the build + deleted chunk ids
+# Writers take an flock on .lock, write new files, then os.replace the manifest.
+#
+# Write hooks only append to the delta. Full builds (k-means) never run on the write
+# path: once the delta outgrows 25% of the base, or a collection without an index
+# reaches VECTOR_ANN_MIN_CHUNKS, a build_ann_index job is queued (with
+# BACKGROUND_JOBS_ENABLED); otherwise `manage.py build_ann_indexes` does the builds.
+
+BASE_ARRAYS = ("centroids", "offsets", "vectors", "ids", "source_ids")
+DELTA_ARRAYS = ("delta_vectors", "delta_ids", "delta_source_ids", "delta_lists", "deleted")
+
+
+def index_root() -> Path:
+    return Path(getattr(settings, "VECTOR_INDEX_DIR", Path(settings.BASE_DIR) / "var" / "vector_index"))
+
+
+def ann_min_chunks() -> int:
+    return int(getattr(settings, "VECTOR_ANN_MIN_CHUNKS", 20000))
+
+
+def _index_dir(user_id: int, source_type: str) -> Path:
+    return index_root() / str(int(user_id)) / source_type
+
+
+def default_nlist(n: int) -> int:
+    return int(np.clip(round(2 * np.sqrt(max(n, 1))), 8, 4096))
+
+
+def default_nprobe(nlist: int) -> int:
+    configured = getattr(settings, "VECTOR_ANN_NPROBE", None)
+    if configured:
+        return int(configured)
+    return int(np.clip(nlist // 32, 8, 128))
+
+
+def assign_lists(data: np.ndarray, centroids: np.ndarray, batch_size: int = 8192) -> np.ndarray:
+    """Nearest centroid (max dot product) for each row, in batches to bound memory."""
+    out = np.empty(data.shape[0], dtype=np.int32)
+    for start in range(0, data.shape[0], batch_size):
+        block = np.asarray(data[start:start + batch_size], dtype=np.float32)
+        out[start:start + batch_size] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+def train_centroids(matrix: np.ndarray, nlist: int, iterations: int = 12, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of at most 64 points per list."""
+    rng = np.random.default_rng(seed)
+    n = matrix.shape[0]
+    nlist = max(1, min(nlist, n))
+    sample = np.sort(rng.choice(n, size=min(n, nlist * 64), replace=False))
+    data = np.asarray(matrix[sample], dtype=np.float32)
+    centroids = data[rng.choice(data.shape[0], size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = assign_lists(data, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        nonempty = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[nonempty]
+        sums[nonempty] = np.add.reduceat(data[order], starts, axis=0)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty lists from random points so no list stays dead
+            sums[empty] = data[rng.choice(data.shape[0], size=int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+class IVFIndex:
+    """Immutable snapshot of an inverted-file index; mutations return a new snapshot."""
+
+    def __init__(self, arrays: dict[str, np.ndarray], generation: int = 0, delta: int = 0) -> None:
+        self.arrays = arrays
+        self.generation = generation
+        self.delta = delta
+        self.centroids = arrays["centroids"]
+        self.offsets = arrays["offsets"]
+        self.nlist = int(self.centroids.shape[0])
+        self._deleted = arrays["deleted"]
+
+    @classmethod
+    def build(cls, ids: np.ndarray, source_ids: np.ndarray, matrix: np.ndarray, nlist: int | None = None) -> "IVFIndex":
+        n = int(matrix.shape[0])
+        centroids = train_centroids(matrix, nlist or default_nlist(n))
+        assign = assign_lists(matrix, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=centroids.shape[0])
+        arrays = {
+            "centroids": centroids,
+            "offsets": np.concatenate(([0], np.cumsum(counts))).astype(np.int64),
+            "vectors": np.ascontiguousarray(matrix[order], dtype=np.float32),
+            "ids": np.asarray(ids, dtype=np.int64)[order],
+            "source_ids": np.asarray(source_ids, dtype=np.int64)[order],
+        }
+        arrays.update(_empty_delta())
+        return cls(arrays)
+
+    @property
+    def size(self) -> int:
+        return int(self.arrays["ids"].shape[0] + self.arrays["delta_ids"].shape[0] - self._deleted.shape[0])
+
+    @property
+    def delta_fraction(self) -> float:
+        base = max(1, int(self.arrays["ids"].shape[0]))
+        return (self.arrays["delta_ids"].shape[0] + self._deleted.shape[0]) / base
+
+    def with_added(self, ids: np.ndarray, source_ids: np.ndarray, matrix: np.ndarray) -> "IVFIndex":
+        arrays = dict(self.arrays)
+        matrix = np.asarray(matrix, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        arrays["delta_vectors"] = np.concatenate([self.arrays["delta_vectors"], matrix])
+        arrays["delta_ids"] = np.concatenate([self.arrays["delta_ids"], np.asarray(ids, dtype=np.int64)])
+        arrays["delta_source_ids"] = np.concatenate([self.arrays["delta_source_ids"], np.asarray(source_ids, dtype=np.int64)])
+        arrays["delta_lists"] = np.concatenate([self.arrays["delta_lists"], assign_lists(matrix, self.centroids)])
+        return IVFIndex(arrays, self.generation, self.delta + 1)
+
+    def with_removed(self, ids: np.ndarray) -> "IVFIndex":
+        arrays = dict(self.arrays)
+        arrays["deleted"] = np.union1d(self._deleted, np.asarray(ids, dtype=np.int64))
+        return IVFIndex(arrays, self.generation, self.delta + 1)
+
+    def search(self, query: np.ndarray, top_k: int = 5, nprobe: int | None = None, source_id: int | None = None) -> list[tuple[int, float]]:
+        """
+        Approximate top-k by dot product over the `nprobe` nearest lists. The `source_id`
+        filter applies after probing, so a filtered search that comes back short is
+        repeated over every list (exact for that source).
+        """
+        q = np.asarray(query, dtype=np.float32).reshape(-1)
+        nprobe = min(self.nlist, nprobe or default_nprobe(self.nlist))
+        probe = np.argpartition(-(self.centroids @ q), nprobe - 1)[:nprobe]
+
+        # Lists are contiguous row ranges: score each slice in place instead of gathering vectors
+        vectors = self.arrays["vectors"]
+        score_parts: list[np.ndarray] = [np.empty(0, dtype=np.float32)]
+        row_parts: list[np.ndarray] = [np.empty(0, dtype=np.int64)]
+        for i in probe:
+            a, b = int(self.offsets[i]), int(self.offsets[i + 1])
+            if b > a:
+                score_parts.append(vectors[a:b] @ q)
+                row_parts.append(np.arange(a, b))
+        rows = np.concatenate(row_parts)
+        id_parts = [self.arrays["ids"][rows]]
+        source_parts = [self.arrays["source_ids"][rows]]
+        if self.arrays["delta_ids"].shape[0]:
+            in_probe = np.isin(self.arrays["delta_lists"], probe)
+            score_parts.append(self.arrays["delta_vectors"][in_probe] @ q)
+            id_parts.append(self.arrays["delta_ids"][in_probe])
+            source_parts.append(self.arrays["delta_source_ids"][in_probe])
+        scores = np.concatenate(score_parts)
+        ids = np.concatenate(id_parts)
+        keep = np.ones(ids.shape[0], dtype=bool)
+        if self._deleted.shape[0]:
+            keep &= ~np.isin(ids, self._deleted)
+        if source_id is not None:
+            keep &= np.concatenate(source_parts) == source_id
+        scores, ids = scores[keep], ids[keep]
+
+        if source_id is not None and ids.shape[0] < top_k and nprobe < self.nlist:
+            return self.search(q, top_k, nprobe=self.nlist, source_id=source_id)
+        k = min(int(top_k), ids.shape[0])
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return list(zip(ids[top].tolist(), scores[top].astype(float).tolist()))
+
+    # ---- persistence ----
+
+    def save(self, directory: Path, new_base: bool) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        if new_base:
+            self.generation += 1
+            self.delta = 0
+            for name in BASE_ARRAYS:
+                np.save(directory / f"base-{self.generation}-{name}.npy", self.arrays[name])
+        for name in DELTA_ARRAYS:
+            np.save(directory / f"delta-{self.generation}-{self.delta}-{name}.npy", self.arrays[name])
+        manifest = {"generation": self.generation, "delta": self.delta, "nlist": self.nlist, "size": self.size}
+        tmp = directory / "manifest.json.tmp"
+        tmp.write_text(json.dumps(manifest))
+        os.replace(tmp, directory / "manifest.json")
+        _remove_stale_files(directory, self.generation, self.delta)
+
+    @classmethod
+    def load(cls, directory: Path) -> "IVFIndex | None":
+        try:
+            manifest = json.loads((directory / "manifest.json").read_text())
+            g, d = int(manifest["generation"]), int(manifest["delta"])
+            arrays = {name: np.load(directory / f"base-{g}-{name}.npy", mmap_mode="r") for name in BASE_ARRAYS}
+            arrays.update({name: np.load(directory / f"delta-{g}-{d}-{name}.npy") for name in DELTA_ARRAYS})
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(arrays, g, d)
+
+
+def _empty_delta() -> dict[str, np.ndarray]:
+    return {
+        "delta_vectors": np.empty((0, EMBEDDING_DIM), dtype=np.float32),
+        "delta_ids": np.empty(0, dtype=np.int64),
+        "delta_source_ids": np.empty(0, dtype=np.int64),
+        "delta_lists": np.empty(0, dtype=np.int32),
+        "deleted": np.empty(0, dtype=np.int64),
+    }
+
+
+def _remove_stale_files(directory: Path, generation: int, delta: int) -> None:
+    # Readers that already mapped an old generation keep their (unlinked) pages
+    keep_base, keep_delta = f"base-{generation}-", f"delta-{generation}-{delta}-"
+    for path in directory.glob("*.npy"):
+        if not (path.name.startswith(keep_base) or path.name.startswith(keep_delta)):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+@contextmanager
+def _locked(directory: Path):
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / ".lock", "w") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+class AnnIndexRegistry:
+    """Per-process view of the on-disk indexes, reloaded when the manifest changes."""
+
+    def __init__(self) -> None:
+        self._indexes: dict[tuple[int, str], tuple[int, IVFIndex]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, source_type: str) -> IVFIndex | None:
+        key = (int(user_id), source_type)
+        directory = _index_dir(user_id, source_type)
+        try:
+            mtime = (directory / "manifest.json").stat().st_mtime_ns
+        except OSError:
+            with self._lock:
+                self._indexes.pop(key, None)
+            return None
+        with self._lock:
+            cached = self._indexes.get(key)
+            if cached and cached[0] == mtime:
+                return cached[1]
+        index = IVFIndex.load(directory)
+        if index is not None:
+            with self._lock:
+                self._indexes[key] = (mtime, index)
+        return index
+
+    def forget(self, user_id: int, source_type: str) -> None:
+        with self._lock:
+            self._indexes.pop((int(user_id), source_type), None)
+
+
+ann_indexes = AnnIndexRegistry()
+
+
+def build_index(user_id: int, source_type: str) -> IVFIndex | None:
+    """(Re)build a user's index for one source type from the database."""
+    from .cache import vector_cache
+
+    entry = vector_cache.get(user_id, source_type)
+    if len(entry) < ann_min_chunks():
+        drop_index(user_id, source_type)
+        return None
+    directory = _index_dir(user_id, source_type)
+    with _locked(directory):
+        index = IVFIndex.build(entry.ids, entry.source_ids, entry.matrix)
+        previous = IVFIndex.load(directory)
+        index.generation = previous.generation if previous else 0
+        index.save(directory, new_base=True)
+    ann_indexes.forget(user_id, source_type)
+    return index
+
+
+def drop_index(user_id: int, source_type: str) -> None:
+    directory = _index_dir(user_id, source_type)
+    for path in list(directory.glob("*.npy")) + [directory / "manifest.json"]:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+    ann_indexes.forget(user_id, source_type)
+
+
+ANN_BUILD_JOB = "build_ann_index"
+
+
+def schedule_build(user_id: int, source_type: str) -> None:
+    """Queue a (re)build of the index for the job worker, unless one is already queued."""
+    from api.jobs import jobs_enabled
+    from api.models import Job
+
+    if not jobs_enabled():
+        return
+    queued = Job.objects.filter(user_id=user_id, kind=ANN_BUILD_JOB, status=Job.QUEUED, payload__source_type=source_type)
+    if not queued.exists():
+        Job.objects.create(user_id=user_id, kind=ANN_BUILD_JOB, payload={"source_type": source_type})
+
+
+def index_chunks_added(user_id: int, source_type: str, ids, source_ids, matrix) -> None:
+    """Write hook: append new chunks to an existing index; builds are scheduled, not run here."""
+    from .cache import collection_size
+
+    directory = _index_dir(user_id, source_type)
+    if (directory / "manifest.json").exists():
+        with _locked(directory):
+            index = IVFIndex.load(directory)
+            if index is not None and len(ids):
+                index = index.with_added(ids, source_ids, matrix)
+                index.save(directory, new_base=False)
+                ann_indexes.forget(user_id, source_type)
+        if index is not None:
+            if index.delta_fraction > 0.25:
+                schedule_build(user_id, source_type)
+            return
+    if collection_size(user_id, source_type) >= ann_min_chunks():
+        schedule_build(user_id, source_type)
+
+
+def index_chunks_removed(user_id: int, source_type: str, ids) -> None:
+    """Write hook: tombstone deleted chunk ids in an existing index."""
+    directory = _index_dir(user_id, source_type)
+    if not (directory / "manifest.json").exists():
+        return
+    with _locked(directory):
+        index = IVFIndex.load(directory)
+        if index is None or not len(ids):
+            return
+        index = index.with_removed(ids)
+        index.save(directory, new_base=False)
+        ann_indexes.forget(user_id, source_type)
+    if index.delta_fraction > 0.25:
+        schedule_build(user_id, source_type)
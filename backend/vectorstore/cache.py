@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, F, Max
+
+from .models import VectorCollectionVersion, VectorizedChunk
+from .utils import EMBEDDING_DIM, EMBEDDING_VERSION, embed_texts, unpack_vector
+
+
+# (user_id, source_type, source_id); None acts as a wildcard for that component
+CacheKey = tuple[int, str | None, int | None]
+
+
+@dataclass
+class CachedMatrix:
+    """Contiguous float32 matrix of a user's chunk vectors plus row-aligned metadata."""
+
+    matrix: np.ndarray  # (n, EMBEDDING_DIM) float32
+    ids: np.ndarray  # (n,) int64 chunk ids
+    source_types: np.ndarray  # (n,) str
+    source_ids: np.ndarray  # (n,) int64
+    fingerprint: tuple[int, int, int]
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.matrix.nbytes + self.ids.nbytes + self.source_types.nbytes + self.source_ids.nbytes)
+
+    def __len__(self) -> int:
+        return int(self.ids.shape[0])
+
+
+def _queryset(key: CacheKey):
+    user_id, source_type, source_id = key
+    qs = VectorizedChunk.objects.filter(user_id=user_id)
+    if source_type is not None:
+        qs = qs.filter(source_type=source_type)
+    if source_id is not None:
+        qs = qs.filter(source_id=source_id)
+    return qs.order_by()
+
+
+def _fingerprint(key: CacheKey) -> tuple[int, int, int]:
+    # Row count + max id change on every insert/delete, and the user's collection
+    # version on every write through the hooks (including vectors rewritten in place),
+    # so entries built by another worker process (whose writes we never see) are
+    # detected as stale cheaply.
+    agg = _queryset(key).aggregate(n=Count("id"), max_id=Max("id"))
+    return int(agg["n"] or 0), int(agg["max_id"] or 0), collection_version(key[0])
+
+
+def collection_version(user_id: int) -> int:
+    version = VectorCollectionVersion.objects.filter(user_id=user_id).values_list("version", flat=True).first()
+    return int(version or 0)
+
+
+def bump_version(user_id: int) -> None:
+    """Mark the user's vectors as changed for every process; call with each vector write."""
+    if not VectorCollectionVersion.objects.filter(user_id=user_id).update(version=F("version") + 1):
+        _, created = VectorCollectionVersion.objects.get_or_create(user_id=user_id, defaults={"version": 1})
+        if not created:
+            VectorCollectionVersion.objects.filter(user_id=user_id).update(version=F("version") + 1)
+
+
+def collection_size(user_id: int, source_type: str | None = None, source_id: int | None = None) -> int:
+    return _fingerprint((int(user_id), source_type, source_id))[0]
+
+
+def _decode(rows: list[tuple]) -> np.ndarray:
+    """(id, vector_bin, vector, embedding_version) rows -> (n, EMBEDDING_DIM) float32 matrix."""
+    n = len(rows)
+    row_bytes = EMBEDDING_DIM * 4
+    bins = [r[1] for r in rows]
+    if all(b is not None and len(b) == row_bytes for b in bins):
+        # Fast path: every row is already binary, decode the whole matrix in one go
+        matrix = unpack_vector(b"".join(bins)).reshape(n, EMBEDDING_DIM).astype(np.float32)
+    else:
+        # Dual-read while the JSON -> binary migration is in progress
+        matrix = np.zeros((n, EMBEDDING_DIM), dtype=np.float32)
+        for i, (_, buf, vec, _) in enumerate(rows):
+            if buf is not None and len(buf) == row_bytes:
+                matrix[i] = unpack_vector(buf)
+            elif isinstance(vec, list) and len(vec) == EMBEDDING_DIM:
+                matrix[i] = vec
+    # Rows embedded by an older text_to_vector are not comparable with fresh query
+    # vectors; re-embed them from their text in memory until reembed_vectors runs.
+    stale = [i for i, r in enumerate(rows) if r[3] != EMBEDDING_VERSION]
+    if stale:
+        texts = dict(VectorizedChunk.objects.filter(id__in=[rows[i][0] for i in stale]).values_list("id", "text"))
+        matrix[stale] = embed_texts(texts.get(rows[i][0], "") for i in stale)
+    return matrix
+
+
+def load_vectors(ids) -> np.ndarray:
+    """Float32 vectors for specific chunk ids, row-aligned with `ids` (zeros for missing ids)."""
+    ids = [int(i) for i in ids]
+    rows = {
+        r[0]: r
+        for r in VectorizedChunk.objects.filter(id__in=ids).values_list("id", "vector_bin", "vector", "embedding_version")
+    }
+    return _decode([rows.get(i, (i, None, None, EMBEDDING_VERSION)) for i in ids])
+
+
+def _load(key: CacheKey, fingerprint: tuple[int, int, int]) -> CachedMatrix:
+    rows = list(
+        _queryset(key)
+        .order_by("id")
+        .values_list("id", "vector_bin", "vector", "embedding_version", "source_type", "source_id")
+    )
+    n = len(rows)
+    return CachedMatrix(
+        matrix=_decode([r[:4] for r in rows]),
+        ids=np.fromiter((r[0] for r in rows), dtype=np.int64, count=n),
+        source_types=np.array([r[4] for r in rows], dtype=str),
+        source_ids=np.fromiter((r[5] for r in rows), dtype=np.int64, count=n),
+        fingerprint=fingerprint,
+    )
+
+
+class VectorMatrixCache:
+    """
+    Process-local LRU cache of per-(user, source_type, source_id) vector matrices.
+    - Bounded by total bytes (VECTOR_CACHE_MAX_BYTES), least recently used evicted first.
+    - Invalidated explicitly on writes, and validated against a cheap DB fingerprint on read.
+    """
+
+    def __init__(self, max_bytes: int | None = None) -> None:
+        self._max_bytes = max_bytes
+        self._entries: OrderedDict[CacheKey, CachedMatrix] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def max_bytes(self) -> int:
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return int(getattr(settings, "VECTOR_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+    def get(self, user_id: int, source_type: str | None = None, source_id: int | None = None) -> CachedMatrix:
+        key: CacheKey = (int(user_id), source_type, source_id)
+        fingerprint = _fingerprint(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.fingerprint == fingerprint:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        entry = self._build(key, fingerprint)
+        with self._lock:
+            self._pop(key)
+            if entry.nbytes <= self.max_bytes:
+                self._entries[key] = entry
+                self._bytes += entry.nbytes
+                self._evict()
+        return entry
+
+    def _build(self, key: CacheKey, fingerprint: tuple[int, int, int]):
+        return _load(key, fingerprint)
+
+    def invalidate(self, user_id: int, source_type: str | None = None, source_id: int | None = None) -> None:
+        """Drop every entry for the user that could contain rows of (source_type, source_id)."""
+        with self._lock:
+            for key in list(self._entries):
+                k_user, k_type, k_id = key
+                if k_user != user_id:
+                    continue
+                if source_type is not None and k_type is not None and k_type != source_type:
+                    continue
+                if source_id is not None and k_id is not None and k_id != source_id:
+                    continue
+                self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _pop(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.nbytes
+            self.evictions += 1
+
+
+vector_cache = VectorMatrixCache()
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from .ann import ann_indexes, build_index, drop_index, index_chunks_added, index_chunks_removed
+from .cache import bump_version, vector_cache
+from .pgvector import store_embeddings
+from .quantize import quantized_cache
+from .segments import segment_changed, segment_chunks_added, segment_chunks_removed, segment_source_dropped
+
+
+# Write hooks that keep the derived search structures (matrix caches, IVF index,
+# pgvector column, mmap segments) in step with VectorizedChunk rows. Call after the rows are written.
+
+
+def _invalidate(user_id: int, source_type: str, source_id: int | None = None) -> None:
+    bump_version(user_id)
+    vector_cache.invalidate(user_id, source_type, source_id)
+    quantized_cache.invalidate(user_id, source_type, source_id)
+
+
+def chunks_created(user_id: int, source_type: str, ids, source_ids, matrix) -> None:
+    _invalidate(user_id, source_type)
+    store_embeddings(ids, matrix)
+    index_chunks_added(user_id, source_type, ids, source_ids, matrix)
+    segment_chunks_added(user_id, source_type, ids, source_ids, matrix)
+
+
+def chunks_deleted(user_id: int, source_type: str, ids, source_id: int | None = None) -> None:
+    _invalidate(user_id, source_type, source_id)
+    index_chunks_removed(user_id, source_type, ids)
+    segment_chunks_removed(user_id, ids)
+
+
+def collection_dropped(user_id: int, source_type: str) -> None:
+    _invalidate(user_id, source_type)
+    drop_index(user_id, source_type)
+    segment_source_dropped(user_id, source_type)
+
+
+def collection_changed(user_id: int, source_type: str) -> None:
+    """Vectors were rewritten in place (re-embedding): rebuild rather than patch."""
+    _invalidate(user_id, source_type)
+    if ann_indexes.get(user_id, source_type) is not None:
+        build_index(user_id, source_type)
+    segment_changed(user_id)
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+
+
+# Process-wide HTTP layer for scrapers and API calls.
+#
+# - One requests.Session per process (re-created after fork) with keep-alive pools per
+#   host, so repeated requests to a blog or to api.openai.com reuse TCP+TLS connections.
+# - Retries with exponential backoff on connection errors, and on 429/5xx for GET/HEAD
+#   only; POSTs are never re-sent once the server may have seen them.
+# - cached_get(): on-disk page cache keyed by URL. Responses carrying ETag or
+#   Last-Modified are stored, and the next fetch of the URL is a conditional GET;
+#   a 304 is answered from disk, so a re-scrape only transfers pages that changed.
+
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_lock = threading.Lock()
+_session: requests.Session | None = None
+_session_pid: int | None = None
+_writes_since_prune = 0
+
+
+def _build_session() -> requests.Session:
+    retry = Retry(
+        total=int(getattr(settings, "HTTP_RETRIES", 2)),
+        backoff_factor=float(getattr(settings, "HTTP_RETRY_BACKOFF", 0.5)),
+        status_forcelist=_RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        raise_on_status=False,
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=int(getattr(settings, "HTTP_POOL_HOSTS", 32)),
+        pool_maxsize=int(getattr(settings, "HTTP_POOL_MAXSIZE", 16)),
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """The shared Session of this process (pools are not shared across fork)."""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _lock:
+            if _session is None or _session_pid != pid:
+                _session, _session_pid = _build_session(), pid
+    return _session
+
+
+def http_cache_root() -> Path:
+    return Path(getattr(settings, "HTTP_CACHE_DIR", Path(settings.BASE_DIR) / "var" / "http_cache"))
+
+
+def http_cache_enabled() -> bool:
+    return bool(getattr(settings, "HTTP_CACHE_ENABLED", True))
+
+
+def _cache_paths(url: str) -> tuple[Path, Path]:
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    base = http_cache_root() / key[:2] / key
+    return base.with_suffix(".json"), base.with_suffix(".body")
+
+
+def _read_entry(url: str) -> tuple[dict, bytes] | None:
+    meta_path, body_path = _cache_paths(url)
+    try:
+        meta = json.loads(meta_path.read_text("utf-8"))
+        body = body_path.read_bytes()
+    except (OSError, ValueError):
+        return None
+    if meta.get("url") != url or len(body) != meta.get("size"):
+        return None
+    return meta, body
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _store_entry(url: str, resp: requests.Response) -> None:
+    global _writes_since_prune
+    meta_path, body_path = _cache_paths(url)
+    meta = {
+        "url": url,
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+        "content_type": resp.headers.get("Content-Type"),
+        "encoding": resp.encoding,
+        "size": len(resp.content),
+    }
+    try:
+        meta_path.parent.mkdir(parents=True, exist_ok=True)
+        # Body first: a reader only trusts it once the matching metadata exists
+        _atomic_write(body_path, resp.content)
+        _atomic_write(meta_path, json.dumps(meta).encode("utf-8"))
+    except OSError:
+        return
+    with _lock:
+        _writes_since_prune += 1
+        prune = _writes_since_prune >= 200
+        if prune:
+            _writes_since_prune = 0
+    if prune:
+        prune_http_cache()
+
+
+def prune_http_cache(max_bytes: int | None = None) -> int:
+    """Delete least recently written entries until the cache fits HTTP_CACHE_MAX_BYTES. Returns entries removed."""
+    limit = int(max_bytes if max_bytes is not None else getattr(settings, "HTTP_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+    entries = []
+    for body in http_cache_root().glob("*/*.body"):
+        try:
+            st = body.stat()
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, body))
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, body in sorted(entries):
+        if total <= limit:
+            break
+        for path in (body.with_suffix(".json"), body):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def _from_cache(url: str, meta: dict, body: bytes, fresh: requests.Response) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.url = url
+    resp._content = body
+    resp.encoding = meta.get("encoding")
+    resp.headers = CaseInsensitiveDict(fresh.headers)
+    if meta.get("content_type"):
+        resp.headers["Content-Type"] = meta["content_type"]
+    resp.request = fresh.request
+    resp.from_cache = True
+    return resp
+
+
+def cached_get(url: str, *, headers: dict | None = None, timeout: float = 20, verify: bool = True) -> requests.Response:
+    """
+    GET through the shared session and the on-disk page cache. The returned response
+    has `from_cache` set when the server answered 304 and the body came from disk.
+    """
+    session = get_session()
+    if not http_cache_enabled():
+        resp = session.get(url, headers=headers, timeout=timeout, verify=verify)
+        resp.from_cache = False
+        return resp
+    cached = _read_entry(url)
+    request_headers = dict(headers or {})
+    if cached is not None:
+        meta = cached[0]
+        if meta.get("etag"):
+            request_headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            request_headers["If-Modified-Since"] = meta["last_modified"]
+    resp = session.get(url, headers=request_headers, timeout=timeout, verify=verify)
+    if resp.status_code == 304 and cached is not None:
+        return _from_cache(url, cached[0], cached[1], resp)
+    resp.from_cache = False
+    cacheable = (
+        resp.status_code == 200
+        and (resp.headers.get("ETag") or resp.headers.get("Last-Modified"))
+        and "no-store" not in (resp.headers.get("Cache-Control") or "").lower()
+    )
+    if cacheable:
+        _store_entry(url, resp)
+    return resp
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import hashlib
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Iterable
+
+from django.conf import settings
+from django.db import transaction
+
+from .hooks import chunks_created, chunks_deleted
+from .models import VectorizedChunk
+from .utils import embed_texts, pack_vector, sentence_split
+
+
+# Shared write path for new chunks: embed the whole batch as one matrix, insert it
+# with bulk_create inside a single transaction, then run the write hooks once.
+
+
+def ingest_batch_size() -> int:
+    return max(int(getattr(settings, "VECTOR_INGEST_BATCH_SIZE", 1000)), 1)
+
+
+def throughput(rows: int, seconds: float) -> dict:
+    """Ingest throughput as reported by the API: rows written, seconds spent, rows per second."""
+    return {"rows": rows, "seconds": round(seconds, 3), "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else 0.0}
+
+
+@dataclass
+class IngestResult:
+    ids: list[int]
+    seconds: float
+
+    @property
+    def rows(self) -> int:
+        return len(self.ids)
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    def summary(self) -> dict:
+        return throughput(self.rows, self.seconds)
+
+
+def split_chunks(texts: Iterable[str]) -> list[str]:
+    """sentence_split every text and drop empty pieces, preserving order."""
+    return [chunk for text in texts for chunk in sentence_split(text or "") if chunk.strip()]
+
+
+def _insert_rows(source_type: str, rows: list[tuple[int, int, str]], batch_size: int | None = None) -> list[int]:
+    """Embed (user_id, source_id, text) rows as one matrix, bulk insert them, run the hooks per user."""
+    if not rows:
+        return []
+    matrix = embed_texts(text for _, _, text in rows)
+    objs = [
+        VectorizedChunk(user_id=user_id, source_type=source_type, source_id=source_id, text=text, vector_bin=pack_vector(vec))
+        for (user_id, source_id, text), vec in zip(rows, matrix)
+    ]
+    with transaction.atomic():
+        VectorizedChunk.objects.bulk_create(objs, batch_size=batch_size or ingest_batch_size())
+    by_user: dict[int, list[int]] = defaultdict(list)
+    for i, (user_id, _, _) in enumerate(rows):
+        by_user[user_id].append(i)
+    for user_id, idx in by_user.items():
+        chunks_created(user_id, source_type, [objs[i].id for i in idx], [rows[i][1] for i in idx], matrix[idx])
+    return [o.id for o in objs]
+
+
+def ingest_chunks(
+    user_id: int,
+    source_type: str,
+    source_id: int,
+    chunks: list[str],
+    batch_size: int | None = None,
+) -> IngestResult:
+    """
+    Embed and store `chunks` as VectorizedChunk rows of (source_type, source_id).
+    Rows are inserted in bulk_create batches of `batch_size` (VECTOR_INGEST_BATCH_SIZE)
+    within one transaction; the derived search structures are updated once they are written.
+    """
+    t0 = time.perf_counter()
+    rows = [(user_id, source_id, c) for c in chunks if c and c.strip()]
+    return IngestResult(_insert_rows(source_type, rows, batch_size), time.perf_counter() - t0)
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class SyncResult:
+    kept: int
+    created_ids: list[int]
+    deleted_ids: list[int]
+    seconds: float = 0.0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.created_ids or self.deleted_ids)
+
+    def summary(self) -> dict:
+        """Throughput of the rows actually embedded and inserted."""
+        return throughput(len(self.created_ids), self.seconds)
+
+
+def sync_sources(source_type: str, sources: dict[tuple[int, int], list[str]]) -> SyncResult:
+    """
+    Make the stored chunks of every (user_id, source_id) in `sources` equal to its chunk
+    list (as a multiset) by content hash: identical chunks are kept with their vectors,
+    missing ones are embedded together in one pass and inserted, the rest deleted.
+    No writes at all when nothing changed.
+    """
+    t0 = time.perf_counter()
+    stored: dict[tuple[int, int, str], list[int]] = defaultdict(list)
+    source_ids = sorted({source_id for _, source_id in sources})
+    for chunk_id, user_id, source_id, text in (
+        VectorizedChunk.objects.filter(source_type=source_type, source_id__in=source_ids)
+        .order_by("id")
+        .values_list("id", "user_id", "source_id", "text")
+    ):
+        if (user_id, source_id) in sources:
+            stored[(user_id, source_id, chunk_hash(text))].append(chunk_id)
+    missing: list[tuple[int, int, str]] = []
+    kept = 0
+    for (user_id, source_id), chunks in sources.items():
+        for chunk in chunks:
+            if not chunk or not chunk.strip():
+                continue
+            ids = stored.get((user_id, source_id, chunk_hash(chunk)))
+            if ids:
+                ids.pop()
+                kept += 1
+            else:
+                missing.append((user_id, source_id, chunk))
+    deleted: dict[tuple[int, int], list[int]] = defaultdict(list)
+    for (user_id, source_id, _), ids in stored.items():
+        deleted[(user_id, source_id)].extend(ids)
+    deleted_ids = [chunk_id for ids in deleted.values() for chunk_id in ids]
+    with transaction.atomic():
+        if deleted_ids:
+            VectorizedChunk.objects.filter(id__in=deleted_ids).delete()
+            for (user_id, source_id), ids in deleted.items():
+                if ids:
+                    chunks_deleted(user_id, source_type, ids, source_id)
+        created_ids = _insert_rows(source_type, missing)
+    return SyncResult(kept, created_ids, deleted_ids, time.perf_counter() - t0)
+
+
+def sync_chunks(user_id: int, source_type: str, source_id: int, chunks: list[str]) -> SyncResult:
+    """sync_sources for a single (source_type, source_id)."""
+    return sync_sources(source_type, {(user_id, source_id): chunks})
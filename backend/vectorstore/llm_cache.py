@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable
+
+from django.conf import settings
+
+
+# Result cache for LLM calls. The key is a hash of the canonical JSON of the request
+# payload (model, messages, temperature, max tokens, reasoning effort, ...), so only
+# byte-for-byte identical requests share an entry; only successful replies are stored.
+#
+# Per call, `mode` decides how the cache is used:
+#   "prefer": answer from the cache when possible, otherwise call and store
+#   "bypass": always call the model, then store (refreshes the entry)
+# The default mode is LLM_CACHE_DEFAULT_MODE; LLM_CACHE_BACKEND = "" disables caching.
+
+MODES = ("prefer", "bypass")
+_KEY_VERSION = 1
+
+
+def llm_cache_key(kind: str, payload: dict) -> str:
+    """Fingerprint of a request to endpoint `kind` ("responses" / "chat"); the stream flag is ignored."""
+    body = {k: v for k, v in payload.items() if k != "stream"}
+    canonical = json.dumps([_KEY_VERSION, kind, body], sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def cache_mode(requested) -> str:
+    mode = str(requested or "").strip().lower()
+    if mode in MODES:
+        return mode
+    default = str(getattr(settings, "LLM_CACHE_DEFAULT_MODE", "bypass")).strip().lower()
+    return default if default in MODES else "bypass"
+
+
+def cache_ttl() -> int:
+    return int(getattr(settings, "LLM_CACHE_TTL", 24 * 3600))
+
+
+class MemoryLLMCache:
+    """Per-process LRU with expiry."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max(int(max_entries), 1)
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: dict, ttl: int) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class DjangoLLMCache:
+    """One of settings.CACHES (shared between workers when that cache is)."""
+
+    def __init__(self, alias: str):
+        from django.core.cache import caches
+
+        self.cache = caches[alias]
+
+    def get(self, key: str) -> dict | None:
+        return self.cache.get(f"llm:{key}")
+
+    def set(self, key: str, value: dict, ttl: int) -> None:
+        self.cache.set(f"llm:{key}", value, timeout=ttl)
+
+
+class SQLiteLLMCache:
+    """Entries in a local SQLite file, shared by the processes of one host and kept across restarts."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._writes = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> dict | None:
+        try:
+            row = self._conn().execute("SELECT value, expires FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None or row[1] < time.time():
+            return None
+        try:
+            return json.loads(row[0])
+        except ValueError:
+            return None
+
+    def set(self, key: str, value: dict, ttl: int) -> None:
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now + ttl),
+            )
+            self._writes += 1
+            if self._writes % 200 == 0:
+                conn.execute("DELETE FROM llm_cache WHERE expires < ?", (now,))
+        except sqlite3.Error:
+            pass
+
+
+_lock = threading.Lock()
+_backend = None
+_backend_config: tuple | None = None
+
+
+def get_llm_cache():
+    """The configured backend (created once per process), or None when caching is disabled."""
+    global _backend, _backend_config
+    name = str(getattr(settings, "LLM_CACHE_BACKEND", "memory") or "").strip().lower()
+    config = (
+        name,
+        getattr(settings, "LLM_CACHE_MAX_ENTRIES", 1024),
+        getattr(settings, "LLM_CACHE_DJANGO_ALIAS", "default"),
+        str(getattr(settings, "LLM_CACHE_SQLITE_PATH", Path(settings.BASE_DIR) / "var" / "llm_cache.sqlite3")),
+    )
+    with _lock:
+        if config != _backend_config:
+            if name == "memory":
+                _backend = MemoryLLMCache(config[1])
+            elif name == "django":
+                _backend = DjangoLLMCache(config[2])
+            elif name == "sqlite":
+                _backend = SQLiteLLMCache(Path(config[3]))
+            else:
+                _backend = None
+            _backend_config = config
+        return _backend
+
+
+def cache_lookup(kind: str, payload: dict, mode: str) -> tuple[str, dict | None]:
+    """(key, cached result or None); only "prefer" reads the cache."""
+    key = llm_cache_key(kind, payload)
+    backend = get_llm_cache()
+    if backend is None or mode != "prefer":
+        return key, None
+    hit = backend.get(key)
+    return key, ({**hit, "cached": True} if isinstance(hit, dict) and hit.get("ok") else None)
+
+
+def cache_store(key: str, result: dict) -> None:
+    backend = get_llm_cache()
+    if backend is None or not result.get("ok"):
+        return
+    backend.set(key, {"ok": True, "text": result.get("text") or "", "raw": result.get("raw") or {}, "error": None}, cache_ttl())
+
+
+def cached_call(kind: str, payload: dict, mode: str | None, call: Callable[[], dict]) -> dict:
+    """Run call() (which sends `payload`) through the cache; the result gains a `cached` flag."""
+    key, hit = cache_lookup(kind, payload, cache_mode(mode))
+    if hit is not None:
+        return hit
+    result = call()
+    result["cached"] = False
+    cache_store(key, result)
+    return result
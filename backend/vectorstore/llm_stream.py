@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import AsyncIterator
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .llm_cache import cache_lookup, cache_mode, cache_store
+from .utils import _get_openai_api_key, chat_completions_payload, openai_base_url, prompt_cache_usage, responses_payload
+
+
+# Streaming OpenAI calls for async views. Tokens are read from the Server-Sent Events
+# stream with httpx on the event loop, so an open generation holds no thread. Each
+# call yields events as dicts:
+#   {"type": "delta", "text": str}   a piece of output text
+#   {"type": "done", "text": str, "cached": bool, "usage": dict | None}  the full reply,
+#        once the model finished; `usage` is prompt_cache_usage of the stream's usage fields
+#   {"type": "error", "error": str}  the request or the stream failed (terminal)
+# Completed replies go through llm_cache like the blocking calls; a cache hit is
+# sent as a single delta.
+
+
+def _timeouts() -> tuple[float, httpx.Timeout]:
+    total = float(getattr(settings, "OPENAI_STREAM_TIMEOUT", 120))
+    read = float(getattr(settings, "OPENAI_STREAM_READ_TIMEOUT", 30))
+    return total, httpx.Timeout(10.0, read=read)
+
+
+async def _sse_data(resp: httpx.Response) -> AsyncIterator[str]:
+    """`data` payloads of an SSE response, one per event (multi-line data joined by newlines)."""
+    data: list[str] = []
+    async for line in resp.aiter_lines():
+        if not line:
+            if data:
+                yield "\n".join(data)
+                data = []
+            continue
+        if line.startswith("data:"):
+            data.append(line[5:].lstrip(" "))
+    if data:
+        yield "\n".join(data)
+
+
+async def _stream(url: str, kind: str, payload: dict, parse, cache: str | None) -> AsyncIterator[dict]:
+    api_key = _get_openai_api_key()
+    if not api_key:
+        yield {"type": "error", "error": "Missing OPENAI_API_KEY"}
+        return
+    key, hit = await sync_to_async(cache_lookup)(kind, payload, cache_mode(cache))
+    if hit is not None:
+        yield {"type": "delta", "text": hit["text"]}
+        yield {"type": "done", "text": hit["text"], "cached": True, "usage": None}
+        return
+    total, timeout = _timeouts()
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream",
+    }
+    body = {**payload, "stream": True}
+    if kind == "chat":
+        body["stream_options"] = {"include_usage": True}  # usage arrives in a last, choice-less chunk
+    parts: list[str] = []
+    usage = None
+    try:
+        async with asyncio.timeout(total):
+            async with httpx.AsyncClient(timeout=timeout) as client:
+                async with client.stream("POST", url, headers=headers, json=body) as resp:
+                    if resp.status_code >= 400:
+                        detail = (await resp.aread()).decode("utf-8", "replace")
+                        yield {"type": "error", "error": detail or f"HTTP {resp.status_code}"}
+                        return
+                    async for data in _sse_data(resp):
+                        if data == "[DONE]":
+                            break
+                        try:
+                            event = json.loads(data)
+                        except ValueError:
+                            continue
+                        usage = prompt_cache_usage(event.get("response") if isinstance(event.get("response"), dict) else event) or usage
+                        event_kind, value = parse(event)
+                        if event_kind == "delta" and value:
+                            parts.append(value)
+                            yield {"type": "delta", "text": value}
+                        elif event_kind == "error":
+                            yield {"type": "error", "error": value or "stream failed"}
+                            return
+                        elif event_kind == "done":
+                            break
+    except (httpx.HTTPError, TimeoutError) as e:
+        yield {"type": "error", "error": str(e) or type(e).__name__}
+        return
+    text = "".join(parts)
+    if not text.strip():
+        yield {"type": "error", "error": "No text in streamed response"}
+        return
+    await sync_to_async(cache_store)(key, {"ok": True, "text": text})
+    yield {"type": "done", "text": text, "cached": False, "usage": usage}
+
+
+def _parse_responses_event(event: dict) -> tuple[str | None, str | None]:
+    kind = event.get("type")
+    if kind == "response.output_text.delta":
+        return "delta", event.get("delta")
+    if kind == "response.completed":
+        return "done", None
+    if kind in {"response.failed", "response.incomplete", "error"}:
+        error = event.get("message") or ((event.get("response") or {}).get("error") or {}).get("message")
+        return "error", error or kind
+    return None, None
+
+
+def _parse_chat_event(event: dict) -> tuple[str | None, str | None]:
+    if isinstance(event.get("error"), dict):
+        return "error", event["error"].get("message")
+    choices = event.get("choices") or []
+    if not choices or not isinstance(choices[0], dict):
+        return None, None
+    delta = choices[0].get("delta") or {}
+    return "delta", delta.get("content") if isinstance(delta, dict) else None
+
+
+def stream_openai_responses(
+    *,
+    model: str,
+    system_text: str,
+    user_text: str,
+    max_output_tokens: int = 512,
+    temperature: float = 0.7,
+    reasoning_effort: str | None = None,
+    cache: str | None = None,
+) -> AsyncIterator[dict]:
+    """call_openai_responses with `stream: true`, yielding delta/done/error events."""
+    payload = responses_payload(
+        model=model,
+        system_text=system_text,
+        user_text=user_text,
+        max_output_tokens=max_output_tokens,
+        temperature=temperature,
+        reasoning_effort=reasoning_effort,
+    )
+    return _stream(f"{openai_base_url()}/responses", "responses", payload, _parse_responses_event, cache)
+
+
+def stream_openai_chat_completions(
+    *, model: str, messages: list[dict], max_tokens: int = 512, temperature: float = 0.7, cache: str | None = None
+) -> AsyncIterator[dict]:
+    """Streaming Chat Completions, the fallback for non-reasoning models."""
+    payload = chat_completions_payload(model=model, messages=messages, max_tokens=max_tokens, temperature=temperature)
+    return _stream(f"{openai_base_url()}/chat/completions", "chat", payload, _parse_chat_event, cache)
+
+
+def sse_event(event: str, data) -> bytes:
+    """One Server-Sent Events frame; `data` is JSON encoded on a single line."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
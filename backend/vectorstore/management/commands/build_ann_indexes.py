@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from vectorstore.ann import ann_min_chunks, build_index
+from vectorstore.models import VectorizedChunk
+
+
+class Command(BaseCommand):
+    help = "Build (or rebuild) IVF indexes for every (user, source_type) collection above VECTOR_ANN_MIN_CHUNKS."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, help="Only build indexes for this user id")
+        parser.add_argument("--source-type", help="Only build indexes for this source type")
+
+    def handle(self, *args, **options):
+        qs = VectorizedChunk.objects.order_by()
+        if options["user"]:
+            qs = qs.filter(user_id=options["user"])
+        if options["source_type"]:
+            qs = qs.filter(source_type=options["source_type"])
+        groups = qs.values("user_id", "source_type").annotate(n=Count("id")).filter(n__gte=ann_min_chunks())
+        for group in groups:
+            started = time.perf_counter()
+            index = build_index(group["user_id"], group["source_type"])
+            if index is None:
+                continue
+            self.stdout.write(
+                f"user={group['user_id']} source_type={group['source_type']} chunks={index.size} "
+                f"nlist={index.nlist} in {time.perf_counter() - started:.1f}s"
+            )
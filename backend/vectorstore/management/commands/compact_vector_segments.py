@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from vectorstore.models import VectorizedChunk
+from vectorstore.segments import build_segment, compact_segment, segment_root
+
+
+class Command(BaseCommand):
+    help = "Fold delta segments into new mmap base segments, or rebuild them from the database with --rebuild."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, help="Only this user id")
+        parser.add_argument("--rebuild", action="store_true", help="Rebuild from the database (creates missing segments)")
+
+    def handle(self, *args, **options):
+        if options["user"]:
+            user_ids = [options["user"]]
+        elif options["rebuild"]:
+            user_ids = list(VectorizedChunk.objects.order_by().values_list("user_id", flat=True).distinct())
+        else:
+            user_ids = sorted(int(p.name) for p in segment_root().glob("*") if p.name.isdigit())
+        for user_id in user_ids:
+            started = time.perf_counter()
+            segment = build_segment(user_id) if options["rebuild"] else compact_segment(user_id)
+            if segment is None:
+                continue
+            self.stdout.write(
+                f"user={user_id} chunks={segment.size} generation={segment.generation} "
+                f"in {time.perf_counter() - started:.2f}s"
+            )
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+# Local stand-in for the OpenAI Responses and Chat Completions endpoints, for trying the
+# generate endpoints without an account: point OPENAI_BASE_URL at http://127.0.0.1:<port>/v1
+# and set any OPENAI_API_KEY. Replies are a canned text, streamed word by word when the
+# request asks for `stream: true`.
+
+DEFAULT_REPLY = "This is a streamed reply from the local fake OpenAI server, one word at a time."
+
+
+def _handler(reply: str, delay: float, fail_responses: bool):
+    words = reply.split(" ")
+    pieces = [w if i == 0 else f" {w}" for i, w in enumerate(words)]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _json(self, status: int, body: dict) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _sse(self, frames) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            for frame in frames:
+                self.wfile.write(frame.encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(delay)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                return self._json(400, {"error": {"message": "invalid JSON"}})
+            stream = bool(body.get("stream"))
+            if self.path.endswith("/responses"):
+                if fail_responses:
+                    return self._json(500, {"error": {"message": "fake Responses API failure"}})
+                if not stream:
+                    return self._json(200, {"output_text": reply})
+                frames = [
+                    f"event: response.output_text.delta\ndata: {json.dumps({'type': 'response.output_text.delta', 'delta': p})}\n\n"
+                    for p in pieces
+                ]
+                frames.append(f"event: response.completed\ndata: {json.dumps({'type': 'response.completed', 'response': {'output_text': reply}})}\n\n")
+                return self._sse(frames)
+            if self.path.endswith("/chat/completions"):
+                if not stream:
+                    return self._json(200, {"choices": [{"message": {"role": "assistant", "content": reply}}]})
+                frames = [f"data: {json.dumps({'choices': [{'delta': {'content': p}}]})}\n\n" for p in pieces]
+                frames.append("data: [DONE]\n\n")
+                return self._sse(frames)
+            return self._json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    return Handler
+
+
+class Command(BaseCommand):
+    help = "Serve a fake OpenAI API (Responses + Chat Completions, streaming or not) on localhost."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--delay", type=float, default=0.05, help="Seconds between streamed tokens")
+        parser.add_argument("--reply", default=DEFAULT_REPLY)
+        parser.add_argument("--fail-responses", action="store_true", help="Answer /responses with 500 to exercise the fallback")
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(("127.0.0.1", options["port"]), _handler(options["reply"], options["delay"], options["fail_responses"]))
+        self.stdout.write(f"Fake OpenAI API on http://127.0.0.1:{options['port']}/v1 (Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
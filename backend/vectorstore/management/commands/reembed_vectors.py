@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from vectorstore.cache import bump_version
+from vectorstore.hooks import collection_changed
+from vectorstore.pgvector import store_embeddings
+from vectorstore.models import VectorizedChunk
+from vectorstore.utils import EMBEDDING_VERSION, embed_texts, pack_vector
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-embed chunks whose embedding_version differs from the current text_to_vector "
+        "version. Works incrementally in id order, so it can be interrupted and re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, help="Only re-embed chunks of this user id")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--limit", type=int, default=0, help="Stop after this many chunks (0 = all)")
+
+    def handle(self, *args, **options):
+        qs = VectorizedChunk.objects.exclude(embedding_version=EMBEDDING_VERSION)
+        if options["user"]:
+            qs = qs.filter(user_id=options["user"])
+        batch_size = max(1, options["batch_size"])
+        limit = options["limit"]
+
+        done = 0
+        collections: set[tuple[int, str]] = set()
+        started = time.perf_counter()
+        last_id = 0
+        while not limit or done < limit:
+            size = batch_size if not limit else min(batch_size, limit - done)
+            batch = list(qs.filter(id__gt=last_id).order_by("id").only("id", "user_id", "source_type", "text")[:size])
+            if not batch:
+                break
+            matrix = embed_texts(obj.text for obj in batch)
+            for obj, vec in zip(batch, matrix):
+                obj.vector_bin = pack_vector(vec)
+                obj.vector = []
+                obj.embedding_version = EMBEDDING_VERSION
+                collections.add((obj.user_id, obj.source_type))
+            with transaction.atomic():
+                VectorizedChunk.objects.bulk_update(batch, ["vector_bin", "vector", "embedding_version"])
+                store_embeddings([obj.id for obj in batch], matrix)
+                # Rows change in place: count and max(id) stay the same, so other
+                # workers only notice through the collection version
+                for user_id in {obj.user_id for obj in batch}:
+                    bump_version(user_id)
+            done += len(batch)
+            last_id = batch[-1].id
+
+        for user_id, source_type in collections:
+            collection_changed(user_id, source_type)
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        self.stdout.write(f"Re-embedded {done} chunks to version {EMBEDDING_VERSION} in {elapsed:.1f}s ({rate:.0f}/s)")
@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.campaign_parsing import campaign_text
+from api.models import BrandGuideline, Campaign, WebsiteScrape
+from api.signals import guideline_hash, guideline_text
+from vectorstore.hooks import collection_changed
+from vectorstore.ingest import split_chunks
+from vectorstore.models import VectorizedChunk
+from vectorstore.pgvector import store_embeddings
+from vectorstore.utils import embed_texts, pack_vector
+
+
+# Rebuilds VectorizedChunk rows from their sources (guideline text, Campaign rows,
+# scraped website posts), re-chunking and re-embedding everything; use after changing
+# sentence_split, text_to_vector or the vector format. Sources are streamed in id order
+# with server-side cursors, embedded in a process pool and written batch by batch:
+# each batch replaces the chunks of its sources in one transaction, after which the
+# last written source id is checkpointed, so an interrupted run resumes where it stopped.
+
+Source = tuple[int, int, list[str]]  # (user_id, source_id, chunks)
+
+SOURCE_TYPES = ("guideline", "upload", "website")
+CURSOR_CHUNK = 2000
+
+
+def _guideline_sources(user_id: int | None, after: int) -> Iterator[Source]:
+    qs = BrandGuideline.objects.filter(id__gt=after).order_by("id")
+    if user_id:
+        qs = qs.filter(user_id=user_id)
+    for gid, uid, title, content in qs.values_list("id", "user_id", "title", "content").iterator(chunk_size=CURSOR_CHUNK):
+        yield uid, gid, split_chunks([guideline_text(title, content)])
+
+
+def _upload_sources(user_id: int | None, after: int) -> Iterator[Source]:
+    # One cursor over all Campaign rows; consecutive rows of an upload form one source
+    qs = Campaign.objects.filter(upload_id__gt=after).order_by("upload_id", "position")
+    if user_id:
+        qs = qs.filter(upload__user_id=user_id)
+    current: Source | None = None
+    for upload_id, uid, title, content in qs.values_list("upload_id", "upload__user_id", "title", "content").iterator(
+        chunk_size=CURSOR_CHUNK
+    ):
+        if current is None or current[1] != upload_id:
+            if current is not None:
+                yield current
+            current = (uid, upload_id, [])
+        text = campaign_text({"title": title, "content": content})
+        if text:
+            current[2].append(text)
+    if current is not None:
+        yield current
+
+
+def _website_sources(user_id: int | None, after: int) -> Iterator[Source]:
+    qs = WebsiteScrape.objects.filter(id__gt=after).order_by("id")
+    if user_id:
+        qs = qs.filter(user_id=user_id)
+    for sid, uid, posts in qs.values_list("id", "user_id", "posts").iterator(chunk_size=100):
+        texts = [p.get("text") or "" for p in (posts if isinstance(posts, list) else []) if isinstance(p, dict)]
+        yield uid, sid, split_chunks(texts)
+
+
+SOURCES = {"guideline": _guideline_sources, "upload": _upload_sources, "website": _website_sources}
+
+
+def _count_sources(source_type: str, user_id: int | None, after: int) -> int:
+    if source_type == "guideline":
+        qs = BrandGuideline.objects.filter(id__gt=after)
+        return (qs.filter(user_id=user_id) if user_id else qs).count()
+    if source_type == "upload":
+        qs = Campaign.objects.filter(upload_id__gt=after)
+        return (qs.filter(upload__user_id=user_id) if user_id else qs).values("upload_id").distinct().count()
+    qs = WebsiteScrape.objects.filter(id__gt=after)
+    return (qs.filter(user_id=user_id) if user_id else qs).count()
+
+
+def _batches(sources: Iterator[Source], batch_size: int) -> Iterator[list[Source]]:
+    batch: list[Source] = []
+    size = 0
+    for source in sources:
+        batch.append(source)
+        size += len(source[2])
+        if size >= batch_size:
+            yield batch
+            batch, size = [], 0
+    if batch:
+        yield batch
+
+
+class Checkpoint:
+    """Progress of a run in a JSON file: last written source id per type and the touched collections."""
+
+    def __init__(self, path: Path, filters: dict):
+        self.path = path
+        self.filters = filters
+        self.done: dict[str, int] = {}
+        self.touched: set[tuple[int, str]] = set()
+        self.chunks = 0
+
+    def load(self) -> bool:
+        try:
+            data = json.loads(self.path.read_text("utf-8"))
+        except (OSError, ValueError):
+            return False
+        if data.get("filters") != self.filters:
+            return False
+        self.done = {k: int(v) for k, v in (data.get("done") or {}).items()}
+        self.touched = {(int(u), str(t)) for u, t in data.get("touched") or []}
+        self.chunks = int(data.get("chunks") or 0)
+        return True
+
+    def save(self) -> None:
+        data = {
+            "filters": self.filters,
+            "done": self.done,
+            "touched": sorted(self.touched),
+            "chunks": self.chunks,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(data), "utf-8")
+        os.replace(tmp, self.path)
+
+    def clear(self) -> None:
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild vector chunks from their sources (guidelines, uploads, website posts): "
+        "re-chunk, re-embed in a process pool and replace them in bulk. Resumable."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, help="Only rebuild sources of this user id")
+        parser.add_argument(
+            "--source-type", action="append", choices=SOURCE_TYPES, help="Only rebuild these source types (repeatable)"
+        )
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Embedding processes (1 = in process)")
+        parser.add_argument("--batch-size", type=int, default=2000, help="Chunks per embed/write batch")
+        parser.add_argument("--checkpoint", help="Checkpoint file (default: var/reindex_vectors.json)")
+        parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint and start over")
+
+    def handle(self, *args, **options):
+        source_types = [t for t in SOURCE_TYPES if t in (options["source_type"] or SOURCE_TYPES)]
+        user_id = options["user"]
+        batch_size = max(1, options["batch_size"])
+        workers = max(1, options["workers"])
+        path = Path(options["checkpoint"] or Path(settings.BASE_DIR) / "var" / "reindex_vectors.json")
+
+        checkpoint = Checkpoint(path, {"user": user_id, "source_types": source_types})
+        if not options["restart"] and checkpoint.load():
+            self.stdout.write(f"Resuming from {path}: {checkpoint.done}")
+        elif path.exists() and not options["restart"]:
+            raise CommandError(f"{path} belongs to a run with other filters; use --restart or --checkpoint")
+
+        total = sum(_count_sources(t, user_id, checkpoint.done.get(t, 0)) for t in source_types)
+        self.stdout.write(f"{total} source(s) to rebuild with {workers} worker(s)")
+
+        pool = None
+        if workers > 1:
+            # spawn: the children only embed, they never share the parent's DB connection
+            pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"), initializer=django.setup)
+        self._started = time.perf_counter()
+        self._last_report = 0.0
+        self._sources_done = 0
+        self._chunks_done = 0
+        try:
+            for source_type in source_types:
+                sources = SOURCES[source_type](user_id, checkpoint.done.get(source_type, 0))
+                self._run(source_type, _batches(sources, batch_size), pool, workers, checkpoint, total)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        # Search structures are rebuilt once per collection rather than patched per batch
+        for uid, source_type in sorted(checkpoint.touched):
+            collection_changed(uid, source_type)
+        checkpoint.clear()
+        elapsed = time.perf_counter() - self._started
+        rate = self._chunks_done / elapsed if elapsed > 0 else 0.0
+        self.stdout.write(
+            f"Rebuilt {self._sources_done} source(s), {self._chunks_done} chunk(s) in {elapsed:.1f}s ({rate:.0f} chunks/s)"
+        )
+
+    def _run(self, source_type: str, batches: Iterator[list[Source]], pool, workers: int, checkpoint, total: int) -> None:
+        if pool is None:
+            for batch in batches:
+                self._write(source_type, batch, embed_texts([c for _, _, chunks in batch for c in chunks]), checkpoint, total)
+            return
+        # Keep a few batches in flight; results are written in submission order so the
+        # checkpoint only ever moves past fully written sources
+        pending: deque = deque()
+        for batch in batches:
+            pending.append((batch, pool.submit(embed_texts, [c for _, _, chunks in batch for c in chunks])))
+            if len(pending) >= workers * 2:
+                done_batch, future = pending.popleft()
+                self._write(source_type, done_batch, future.result(), checkpoint, total)
+        while pending:
+            done_batch, future = pending.popleft()
+            self._write(source_type, done_batch, future.result(), checkpoint, total)
+
+    def _write(self, source_type: str, batch: list[Source], matrix, checkpoint: Checkpoint, total: int) -> None:
+        owners = {source_id: uid for uid, source_id, _ in batch}
+        stale = [
+            chunk_id
+            for chunk_id, uid, source_id in VectorizedChunk.objects.filter(
+                source_type=source_type, source_id__in=list(owners)
+            ).values_list("id", "user_id", "source_id")
+            if owners.get(source_id) == uid
+        ]
+        objs = [
+            VectorizedChunk(user_id=uid, source_type=source_type, source_id=source_id, text=text)
+            for uid, source_id, chunks in batch
+            for text in chunks
+        ]
+        for obj, vec in zip(objs, matrix):
+            obj.vector_bin = pack_vector(vec)
+        with transaction.atomic():
+            if stale:
+                VectorizedChunk.objects.filter(id__in=stale).delete()
+            VectorizedChunk.objects.bulk_create(objs, batch_size=1000)
+            store_embeddings([obj.id for obj in objs], matrix)
+            if source_type == "guideline":
+                self._mark_guidelines(owners)
+        checkpoint.done[source_type] = max(owners)
+        checkpoint.touched.update((uid, source_type) for uid in owners.values())
+        checkpoint.chunks += len(objs)
+        checkpoint.save()
+        self._sources_done += len(batch)
+        self._chunks_done += len(objs)
+        self._report(total)
+
+    def _mark_guidelines(self, owners: dict[int, int]) -> None:
+        # Keep api.signals' change detection in step with the rebuilt chunks
+        rows = BrandGuideline.objects.filter(id__in=list(owners)).only("id", "title", "content", "content_hash")
+        changed = []
+        for g in rows:
+            new_hash = guideline_hash(g.title, g.content)
+            if g.content_hash != new_hash:
+                g.content_hash = new_hash
+                changed.append(g)
+        if changed:
+            BrandGuideline.objects.bulk_update(changed, ["content_hash"])
+
+    def _report(self, total: int) -> None:
+        now = time.perf_counter()
+        if now - self._last_report < 2.0 and self._sources_done < total:
+            return
+        self._last_report = now
+        elapsed = now - self._started
+        rate = self._chunks_done / elapsed if elapsed > 0 else 0.0
+        source_rate = self._sources_done / elapsed if elapsed > 0 else 0.0
+        remaining = max(total - self._sources_done, 0)
+        eta = f"{remaining / source_rate:.0f}s" if source_rate > 0 else "?"
+        self.stdout.write(
+            f"{self._sources_done}/{total} sources, {self._chunks_done} chunks, {rate:.0f} chunks/s, ETA {eta}"
+        )
@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import time
+import uuid
+from functools import partial
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+
+from vectorstore.ann import IVFIndex, default_nprobe
+from vectorstore.cache import CachedMatrix, vector_cache
+from vectorstore.ingest import ingest_chunks
+from vectorstore.models import VectorizedChunk
+from vectorstore.pgvector import pgvector_available, store_embeddings
+from vectorstore.quantize import QuantizedMatrix
+from vectorstore.retrieval import rank_collection
+from vectorstore.utils import cosine_similarity, pack_vector, text_to_vector, top_k_from_scores, top_k_similar
+
+
+def _synthetic_matrix(n: int, dim: int = 256, nnz: int = 24, seed: int = 0) -> np.ndarray:
+    """Sparse, L2-normalized rows resembling hashed bag-of-words vectors."""
+    rng = np.random.default_rng(seed)
+    matrix = np.zeros((n, dim), dtype=np.float32)
+    rows = np.repeat(np.arange(n), nnz)
+    cols = rng.integers(0, dim, size=n * nnz)
+    np.add.at(matrix, (rows, cols), 1.0)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def _synthetic_corpus(n: int, dim: int = 256, topics: int = 64, nnz: int = 24, seed: int = 0) -> np.ndarray:
+    """Topic-mixture bag-of-words rows: documents cluster like real text, unlike uniform noise."""
+    rng = np.random.default_rng(seed)
+    topic_words = rng.dirichlet(np.full(dim, 0.05), size=topics)
+    doc_topics = rng.integers(0, topics, size=n)
+    matrix = np.zeros((n, dim), dtype=np.float32)
+    for t in range(topics):
+        rows = np.flatnonzero(doc_topics == t)
+        if not rows.size:
+            continue
+        cols = rng.choice(dim, size=(rows.size, nnz), p=topic_words[t])
+        np.add.at(matrix, (np.repeat(rows, nnz), cols.ravel()), 1.0)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix
+
+
+def _legacy_rank(q: np.ndarray, matrix: np.ndarray, ids: np.ndarray, top_k: int) -> list[int]:
+    # Mirrors the previous per-row rank_by_similarity loop
+    sims: list[tuple[int, float]] = []
+    for idx, vec in zip(ids.tolist(), matrix):
+        v = np.array(vec, dtype=np.float32)
+        sims.append((idx, cosine_similarity(q, v)))
+    sims.sort(key=lambda x: x[1], reverse=True)
+    return [idx for idx, _ in sims[:top_k]]
+
+
+def _rows_by_id(matrix: np.ndarray, chunk_ids) -> np.ndarray:
+    """Rows of a synthetic matrix whose ids are 1..n."""
+    return matrix[np.asarray(chunk_ids, dtype=np.int64) - 1]
+
+
+def _best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+DEFAULT_SIZES = {
+    "ranking": "1000,10000,100000,1000000",
+    "ann": "20000,100000,500000",
+    "pgvector": "100000",
+    "quant": "20000,100000,500000",
+    "ingest": "200,2000,20000",
+}
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmarks for the vectorstore search paths on synthetic data."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--suite", default="ranking", choices=sorted(DEFAULT_SIZES))
+        parser.add_argument("--sizes", help="Comma-separated chunk counts (defaults depend on the suite)")
+        parser.add_argument("--top-k", type=int, default=5)
+        parser.add_argument("--queries", type=int, default=16, help="Batch size for the batched-query run")
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--legacy-max", type=int, default=1_000_000, help="Skip the slow per-row baseline above this size")
+        parser.add_argument("--nprobe", type=int, help="IVF lists probed per query (ann suite)")
+        parser.add_argument("--rerank", type=int, default=200, help="Candidates re-scored in float32 (quant suite)")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(s) for s in str(options["sizes"] or DEFAULT_SIZES[options["suite"]]).split(",") if s.strip()]
+        except ValueError as e:
+            raise CommandError(f"Invalid --sizes: {e}")
+        getattr(self, f"_bench_{options['suite']}")(sizes, options)
+
+    def _bench_ranking(self, sizes: list[int], options: dict) -> None:
+        top_k, repeat, n_queries = options["top_k"], options["repeat"], options["queries"]
+        self.stdout.write(f"{'chunks':>9} {'legacy ms':>11} {'matrix ms':>11} {'speedup':>9} {'batch ms/q':>11}")
+        for n in sizes:
+            matrix = _synthetic_matrix(n)
+            ids = np.arange(1, n + 1, dtype=np.int64)
+            queries = _synthetic_matrix(n_queries, seed=1)
+            q = queries[0]
+
+            fast = _best_of(partial(top_k_similar, q, matrix, ids, top_k=top_k), repeat)
+            batch = _best_of(partial(top_k_similar, queries, matrix, ids, top_k=top_k), repeat) / n_queries
+            if n <= options["legacy_max"]:
+                legacy = _best_of(partial(_legacy_rank, q, matrix, ids, top_k), 1)
+                legacy_ms, speedup = f"{legacy * 1e3:11.2f}", f"{legacy / fast:8.1f}x"
+            else:
+                legacy_ms, speedup = f"{'-':>11}", f"{'-':>9}"
+            self.stdout.write(f"{n:>9} {legacy_ms} {fast * 1e3:11.2f} {speedup} {batch * 1e3:11.3f}")
+
+    def _bench_ann(self, sizes: list[int], options: dict) -> None:
+        top_k, n_queries = max(options["top_k"], 10), options["queries"]
+        self.stdout.write(
+            f"{'chunks':>9} {'nlist':>6} {'nprobe':>6} {'build s':>8} {'exact ms':>9} {'ivf ms':>8} {'speedup':>8} {'recall@' + str(top_k):>10}"
+        )
+        for n in sizes:
+            corpus = _synthetic_corpus(n + n_queries)
+            matrix, queries = corpus[:n], corpus[n:]
+            ids = np.arange(1, n + 1, dtype=np.int64)
+
+            t0 = time.perf_counter()
+            index = IVFIndex.build(ids, np.zeros(n, dtype=np.int64), matrix)
+            build = time.perf_counter() - t0
+            nprobe = options["nprobe"] or default_nprobe(index.nlist)
+
+            exact_total = ivf_total = 0.0
+            hits = 0
+            for q in queries:
+                t0 = time.perf_counter()
+                exact = top_k_similar(q, matrix, ids, top_k=top_k)
+                exact_total += time.perf_counter() - t0
+                t0 = time.perf_counter()
+                approx = index.search(q, top_k, nprobe=nprobe)
+                ivf_total += time.perf_counter() - t0
+                hits += len({i for i, _ in exact} & {i for i, _ in approx})
+            exact_ms, ivf_ms = exact_total / n_queries * 1e3, ivf_total / n_queries * 1e3
+            recall = hits / (top_k * n_queries)
+            self.stdout.write(
+                f"{n:>9} {index.nlist:>6} {nprobe:>6} {build:8.2f} {exact_ms:9.2f} {ivf_ms:8.2f} {exact_ms / ivf_ms:7.1f}x {recall:10.3f}"
+            )
+
+    def _bench_quant(self, sizes: list[int], options: dict) -> None:
+        top_k, n_queries, rerank = max(options["top_k"], 10), options["queries"], options["rerank"]
+        self.stdout.write(
+            f"{'chunks':>9} {'mode':>7} {'MiB':>8} {'saving':>7} {'ms/q':>8} {'recall@' + str(top_k):>10} {'no rerank':>10}"
+        )
+        for n in sizes:
+            corpus = _synthetic_corpus(n + n_queries)
+            matrix, queries = corpus[:n], corpus[n:]
+            ids = np.arange(1, n + 1, dtype=np.int64)
+            entry = CachedMatrix(matrix, ids, np.full(n, "upload"), np.zeros(n, dtype=np.int64), (n, n))
+            # Re-ranking reads float32 rows from the in-memory matrix instead of the database
+            fetch = partial(_rows_by_id, matrix)
+
+            exact = [{i for i, _ in top_k_similar(q, matrix, ids, top_k=top_k)} for q in queries]
+            t0 = time.perf_counter()
+            for q in queries:
+                top_k_similar(q, matrix, ids, top_k=top_k)
+            float_ms = (time.perf_counter() - t0) / n_queries * 1e3
+            self.stdout.write(f"{n:>9} {'float32':>7} {entry.nbytes / 2**20:8.1f} {'1.0x':>7} {float_ms:8.2f} {1.0:10.3f} {'-':>10}")
+
+            for mode in ("int8", "binary"):
+                quant = QuantizedMatrix.from_matrix(entry, mode)
+                t0 = time.perf_counter()
+                approx = [quant.search(q, top_k, rerank=rerank, fetch=fetch) for q in queries]
+                quant_ms = (time.perf_counter() - t0) / n_queries * 1e3
+                raw = [top_k_from_scores(quant.approx_scores(q), ids, top_k) for q in queries]
+                recall = sum(len(e & {i for i, _ in a}) for e, a in zip(exact, approx)) / (top_k * n_queries)
+                raw_recall = sum(len(e & {i for i, _ in a}) for e, a in zip(exact, raw)) / (top_k * n_queries)
+                self.stdout.write(
+                    f"{n:>9} {mode:>7} {quant.nbytes / 2**20:8.1f} {entry.nbytes / quant.nbytes:6.1f}x "
+                    f"{quant_ms:8.2f} {recall:10.3f} {raw_recall:10.3f}"
+                )
+
+    def _bench_ingest(self, sizes: list[int], options: dict) -> None:
+        self.stdout.write(f"{'chunks':>9} {'per-row rows/s':>15} {'bulk rows/s':>12} {'speedup':>8}")
+        rng = np.random.default_rng(0)
+        words = [f"w{i}" for i in range(5000)]
+        for n in sizes:
+            texts = [" ".join(rng.choice(words, size=40)) for _ in range(n)]
+            # Both runs write inside one transaction that is rolled back at the end
+            with transaction.atomic():
+                user = User.objects.create(username=f"vector-bench-{uuid.uuid4().hex[:12]}")
+                t0 = time.perf_counter()
+                for text in texts:
+                    # Previous path: one embedding and one INSERT per chunk
+                    VectorizedChunk.objects.create(
+                        user=user, source_type="upload", source_id=0, text=text, vector_bin=pack_vector(text_to_vector(text))
+                    )
+                legacy = time.perf_counter() - t0
+                result = ingest_chunks(user.id, "upload", 1, texts)
+                vector_cache.clear()
+                transaction.set_rollback(True)
+            self.stdout.write(
+                f"{n:>9} {n / legacy:15.0f} {result.rows_per_sec:12.0f} {legacy / result.seconds:7.1f}x"
+            )
+
+    def _bench_pgvector(self, sizes: list[int], options: dict) -> None:
+        if not pgvector_available():
+            raise CommandError("pgvector is not available on this database (see migration vectorstore 0005)")
+        top_k, n_queries = max(options["top_k"], 10), options["queries"]
+        self.stdout.write(
+            f"{'chunks':>9} {'numpy cold ms':>14} {'numpy warm ms':>14} {'pgvector ms':>12} {'recall@' + str(top_k):>10}"
+        )
+        for n in sizes:
+            corpus = _synthetic_corpus(n + n_queries)
+            matrix, queries = corpus[:n], corpus[n:]
+            # Everything happens in one transaction that is rolled back at the end
+            with transaction.atomic():
+                user = User.objects.create(username=f"vector-bench-{uuid.uuid4().hex[:12]}")
+                for start in range(0, n, 2000):
+                    block = matrix[start:start + 2000]
+                    objs = VectorizedChunk.objects.bulk_create([
+                        VectorizedChunk(user=user, source_type="upload", source_id=0, text="", vector_bin=pack_vector(vec))
+                        for vec in block
+                    ])
+                    store_embeddings([o.id for o in objs], block)
+
+                with override_settings(VECTOR_BACKEND="numpy", VECTOR_ANN_ENABLED=False):
+                    vector_cache.clear()
+                    t0 = time.perf_counter()
+                    rank_collection(user.id, queries[0], top_k, source_type="upload")
+                    cold = time.perf_counter() - t0
+                    t0 = time.perf_counter()
+                    exact = [rank_collection(user.id, q, top_k, source_type="upload") for q in queries]
+                    warm = (time.perf_counter() - t0) / n_queries
+                t0 = time.perf_counter()
+                approx = [rank_collection(user.id, q, top_k, source_type="upload") for q in queries]
+                pg = (time.perf_counter() - t0) / n_queries
+
+                hits = sum(len({i for i, _ in e} & {i for i, _ in a}) for e, a in zip(exact, approx))
+                vector_cache.clear()
+                transaction.set_rollback(True)
+            self.stdout.write(
+                f"{n:>9} {cold * 1e3:14.1f} {warm * 1e3:14.2f} {pg * 1e3:12.2f} {hits / (top_k * n_queries):10.3f}"
+            )
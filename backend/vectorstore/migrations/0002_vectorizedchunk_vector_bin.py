@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vectorstore', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vectorizedchunk',
+            name='vector_bin',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='vectorizedchunk',
+            name='vector',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Converts legacy JSON vectors into the float32 vector_bin column in batches.
+# Non-atomic so each batch commits on its own; readers fall back to the JSON
+# column for rows that have not been converted yet.
+
+from django.db import migrations, transaction
+import numpy as np
+
+
+BATCH_SIZE = 2000
+
+
+def _forward(apps, schema_editor):
+    VectorizedChunk = apps.get_model('vectorstore', 'VectorizedChunk')
+    last_id = 0
+    while True:
+        batch = list(
+            VectorizedChunk.objects.filter(id__gt=last_id, vector_bin__isnull=True)
+            .order_by('id')
+            .only('id', 'vector')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for obj in batch:
+            obj.vector_bin = np.asarray(obj.vector or [], dtype='<f4').tobytes()
+            obj.vector = []
+        with transaction.atomic():
+            VectorizedChunk.objects.bulk_update(batch, ['vector_bin', 'vector'])
+        last_id = batch[-1].id
+
+
+def _backward(apps, schema_editor):
+    VectorizedChunk = apps.get_model('vectorstore', 'VectorizedChunk')
+    last_id = 0
+    while True:
+        batch = list(
+            VectorizedChunk.objects.filter(id__gt=last_id, vector_bin__isnull=False)
+            .order_by('id')
+            .only('id', 'vector_bin')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for obj in batch:
+            obj.vector = np.frombuffer(obj.vector_bin, dtype='<f4').astype(float).tolist()
+            obj.vector_bin = None
+        with transaction.atomic():
+            VectorizedChunk.objects.bulk_update(batch, ['vector_bin', 'vector'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('vectorstore', '0002_vectorizedchunk_vector_bin'),
+    ]
+
+    operations = [
+        migrations.RunPython(_forward, _backward),
+    ]
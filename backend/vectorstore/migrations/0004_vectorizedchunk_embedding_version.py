@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-17
+
+from django.db import migrations, models
+import vectorstore.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vectorstore', '0003_convert_vectors_to_binary'),
+    ]
+
+    operations = [
+        # Existing rows were embedded with the salted builtin hash(): mark them as version 0
+        migrations.AddField(
+            model_name='vectorizedchunk',
+            name='embedding_version',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='vectorizedchunk',
+            name='embedding_version',
+            field=models.PositiveSmallIntegerField(default=vectorstore.utils.current_embedding_version),
+        ),
+    ]
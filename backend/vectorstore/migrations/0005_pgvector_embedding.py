@@ -0,0 +1,89 @@
+# Optional pgvector column + HNSW index for SQL-side similarity search.
+# A no-op on other databases or when the `vector` extension is not installed
+# on the server; vectorstore.pgvector then reports the backend as unavailable.
+
+from django.db import migrations, transaction
+import numpy as np
+
+
+TABLE = 'vectorstore_vectorizedchunk'
+BATCH_SIZE = 2000
+# vectorstore.utils.EMBEDDING_VERSION when this migration was written; frozen so the
+# migration does not depend on the embedder that is current when it runs
+EMBEDDING_VERSION = 1
+
+
+def _extension_available(cursor) -> bool:
+    cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'vector'")
+    return cursor.fetchone() is not None
+
+
+def _literal(buf) -> str:
+    return '[' + ','.join(f'{x:.7g}' for x in np.frombuffer(buf, dtype='<f4').tolist()) + ']'
+
+
+def _forward(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cur:
+        if not _extension_available(cur):
+            return
+        try:
+            with transaction.atomic():
+                cur.execute('CREATE EXTENSION IF NOT EXISTS vector')
+        except Exception:
+            # Installing an extension may need privileges the app role lacks
+            return
+        cur.execute(f'ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS embedding vector(256)')
+        cur.execute(
+            f'CREATE INDEX IF NOT EXISTS vectorstore_chunk_embedding_hnsw '
+            f'ON {TABLE} USING hnsw (embedding vector_cosine_ops)'
+        )
+
+        # Only stored vectors of the current embedding version are copied; stale rows stay
+        # NULL (pgvector search skips them) until `manage.py reembed_vectors` re-embeds
+        # them and fills the column
+        VectorizedChunk = apps.get_model('vectorstore', 'VectorizedChunk')
+        last_id = 0
+        while True:
+            batch = list(
+                VectorizedChunk.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'vector_bin', 'embedding_version')[:BATCH_SIZE]
+            )
+            if not batch:
+                break
+            current = [
+                (pk, buf) for pk, buf, version in batch
+                if version == EMBEDDING_VERSION and buf is not None and len(buf) == 256 * 4
+            ]
+            if current:
+                cur.execute(
+                    f'UPDATE {TABLE} AS t SET embedding = v.e::vector '
+                    f'FROM unnest(%s::bigint[], %s::text[]) AS v(id, e) WHERE t.id = v.id',
+                    [[pk for pk, _ in current], [_literal(bytes(buf)) for _, buf in current]],
+                )
+            last_id = batch[-1][0]
+
+
+def _backward(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cur:
+        cur.execute('DROP INDEX IF EXISTS vectorstore_chunk_embedding_hnsw')
+        cur.execute(f'ALTER TABLE {TABLE} DROP COLUMN IF EXISTS embedding')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('vectorstore', '0004_vectorizedchunk_embedding_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(_forward, _backward),
+    ]
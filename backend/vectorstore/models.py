@@ -1,5 +1,8 @@
 from django.conf import settings
 from django.db import models
+import numpy as np
+
+from .utils import current_embedding_version, unpack_vector
 
 
 class VectorizedChunk(models.Model):
@@ -13,8 +16,12 @@ class VectorizedChunk(models.Model):
     source_type = models.CharField(max_length=32)  # 'guideline' | 'upload'
     source_id = models.IntegerField()
     text = models.TextField()
-    # Store vector as JSON array of floats for simplicity; can switch to pgvector later
-    vector = models.JSONField(default=list)
+    # Legacy JSON array of floats; only read for rows not yet converted to vector_bin
+    vector = models.JSONField(default=list, blank=True)
+    # Raw little-endian float32 bytes (256 * 4); can switch to pgvector later
+    vector_bin = models.BinaryField(null=True, blank=True)
+    # utils.EMBEDDING_VERSION the vector was computed with; 0 = legacy salted hash()
+    embedding_version = models.PositiveSmallIntegerField(default=current_embedding_version)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -24,4 +31,20 @@ class VectorizedChunk(models.Model):
         ]
         ordering = ["-created_at", "-id"]
 
+    def as_array(self) -> np.ndarray:
+        """Decoded float32 vector, preferring the binary column over the legacy JSON one."""
+        if self.vector_bin:
+            return unpack_vector(self.vector_bin)
+        return np.asarray(self.vector or [], dtype=np.float32)
+
+
+class VectorCollectionVersion(models.Model):
+    """Per-user counter bumped on every write to the user's chunk vectors; part of the cache fingerprints."""
 
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="vector_version",
+    )
+    version = models.PositiveBigIntegerField(default=0)
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import numpy as np
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+
+from .models import VectorizedChunk
+from .utils import EMBEDDING_DIM
+
+
+# Optional pgvector backend. The `embedding vector(256)` column and its HNSW index
+# are created by migration 0005 only when the extension is available, so the column
+# is not declared on the model; everything here goes through raw SQL and every
+# caller falls back to the NumPy path when the column is missing.
+
+TABLE = VectorizedChunk._meta.db_table
+_available: bool | None = None
+_iterative_scan: bool | None = None
+
+
+def pgvector_available(refresh: bool = False) -> bool:
+    global _available
+    if _available is None or refresh:
+        detected = _detect()
+        if detected is None:
+            return False  # database unreachable: do not remember the answer
+        _available = detected
+    return _available
+
+
+def _detect() -> bool | None:
+    if connection.vendor != "postgresql":
+        return False
+    try:
+        with connection.cursor() as cur:
+            cur.execute(
+                "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = 'embedding'",
+                [TABLE],
+            )
+            return cur.fetchone() is not None
+    except DatabaseError:
+        return None
+
+
+def _supports_iterative_scan(cur) -> bool:
+    # pgvector >= 0.8 can keep walking the HNSW graph until the filtered LIMIT is met
+    global _iterative_scan
+    if _iterative_scan is None:
+        cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        row = cur.fetchone()
+        try:
+            _iterative_scan = row is not None and tuple(int(p) for p in row[0].split(".")[:2]) >= (0, 8)
+        except ValueError:
+            _iterative_scan = False
+    return _iterative_scan
+
+
+def use_pgvector() -> bool:
+    backend = str(getattr(settings, "VECTOR_BACKEND", "auto")).lower()
+    if backend == "numpy":
+        return False
+    return pgvector_available()
+
+
+def to_literal(vec) -> str:
+    """pgvector text input format: '[x1,x2,...]'."""
+    return "[" + ",".join(f"{x:.7g}" for x in np.asarray(vec, dtype=np.float32).tolist()) + "]"
+
+
+def store_embeddings(ids, matrix) -> None:
+    """Mirror freshly written chunk vectors into the embedding column in one statement."""
+    if not len(ids) or not pgvector_available():
+        return
+    literals = [to_literal(vec) for vec in np.asarray(matrix, dtype=np.float32).reshape(-1, EMBEDDING_DIM)]
+    with connection.cursor() as cur:
+        cur.execute(
+            f"UPDATE {TABLE} AS t SET embedding = v.e::vector "
+            "FROM unnest(%s::bigint[], %s::text[]) AS v(id, e) WHERE t.id = v.id",
+            [[int(i) for i in ids], literals],
+        )
+
+
+def search(
+    user_id: int,
+    query_vec: np.ndarray,
+    top_k: int = 5,
+    source_type: str | None = None,
+    source_id: int | None = None,
+) -> list[tuple[int, float]] | None:
+    """
+    SQL-side cosine top-k via `ORDER BY embedding <=> q LIMIT k`.
+    Returns None when the backend is unavailable, the query fails or it returns fewer
+    than `top_k` rows, so callers can fall back to the NumPy path. The HNSW index is
+    shared by all users and the user filter is applied to the ef_search candidates it
+    yields, so on a shared table a small collection can come back short or empty;
+    iterative scans (pgvector >= 0.8) make that rare, the fallback keeps it correct.
+    """
+    if not np.any(query_vec):
+        return None
+    where = ["user_id = %s", "embedding IS NOT NULL"]
+    params: list = [int(user_id)]
+    if source_type is not None:
+        where.append("source_type = %s")
+        params.append(source_type)
+    if source_id is not None:
+        where.append("source_id = %s")
+        params.append(int(source_id))
+    q = to_literal(query_vec)
+    sql = (
+        f"SELECT id, 1 - (embedding <=> %s::vector) AS score FROM {TABLE} "
+        f"WHERE {' AND '.join(where)} ORDER BY embedding <=> %s::vector LIMIT %s"
+    )
+    try:
+        with transaction.atomic(), connection.cursor() as cur:
+            ef_search = getattr(settings, "VECTOR_PGVECTOR_EF_SEARCH", None)
+            if ef_search:
+                cur.execute("SET LOCAL hnsw.ef_search = %s", [int(ef_search)])
+            if _supports_iterative_scan(cur):
+                cur.execute("SET LOCAL hnsw.iterative_scan = strict_order")
+            cur.execute(sql, [q, *params, q, int(top_k)])
+            hits = [(int(row[0]), float(row[1])) for row in cur.fetchall()]
+    except DatabaseError:
+        return None
+    return hits if len(hits) >= top_k else None
@@ -1,122 +1,74 @@
 from __future__ import annotations
 
+from functools import lru_cache
 from typing import Iterable, List, Dict
+
+from django.conf import settings
+
 from .examples import EXAMPLES_BY_CHANNEL
+from .token_budget import allocate, count_tokens, prompt_token_budget, tokenizer_name
+
+# Prompt layouts (PROMPT_LAYOUT, or `layout=` per call):
+#   "classic": brand guidelines, retrieved context, channel examples, the request, then
+#              the output instructions
+#   "prefix":  everything that is the same across requests first - channel header,
+#              channel examples and output instructions, then the user's brand
+#              guidelines - and the per-request context and request last. The prompt
+#              then starts with a byte-identical prefix per (channel, guideline version),
+#              which the provider's prompt cache can reuse (OpenAI caches prefixes of
+#              1024+ tokens). The static blocks are rendered once per process.
+LAYOUTS = ("classic", "prefix")
 
+# Order in which sections get the prompt's token budget; what does not fit is
+# truncated or dropped, lowest priority first
+SECTION_PRIORITY = (
+    "rules",
+    "terminology",
+    "tone",
+    "style",
+    "similar_campaigns",
+    "website_context",
+    "web_results",
+    "linkedin_context",
+    "channel_examples",
+)
+_OMITTED = "(udeladt af pladshensyn)"
+# Share of the budget the "prefix" layout keeps free for the request and its context
+# when fitting the static prefix, so the prefix only changes with the request when the
+# request (with its web-search block) outgrows it
+PREFIX_REQUEST_SHARE = 0.25
 
-def _join_guidelines(items: Iterable[str]) -> str:
+
+def _join_guidelines(items: Iterable[str], omitted: bool = False) -> str:
     lines: List[str] = []
     for item in items:
         if not item:
             continue
         lines.append(f"- {item.strip()}")
-    return "\n".join(lines) if lines else "- (ingen)"
-
-
-def build_generation_messages(
-    *,
-    user_request: str,
-    content_type: str,
-    tone_guidelines: List[str],
-    terminology_guidelines: List[str],
-    style_guidelines: List[str],
-    content_rules: List[str],
-    similar_campaigns: List[str],
-    linkedin_context: List[str] | None = None,
-    trustpilot_context: List[str] | None = None,
-    website_context: List[str] | None = None,
-    web_results: List[Dict[str, str]] | None = None,
-    web_search_directives: Dict[str, object] | None = None,
-) -> list[dict[str, str]]:
-    """
-    Returns OpenAI chat messages with a dedicated system role and a user message
-    that contains brand guidelines, retrieved similar examples (RAG), and output
-    instructions, followed by the user's request.
-    - ALL brand guidelines are included verbatim (no RAG) and categorized.
-    - You are also provided with example of linkeding and facebook campaigns together with newsletters.
-    - Rag content is also provided from linkedin and historical newsletters
-    """
-
-    # Normalize/validate content type
-    allowed_types = {"linkedin", "facebook", "newsletter", "blog"}
-    ct = (content_type or "").strip().lower()
-    if ct not in allowed_types:
-        ct = "linkedin"
+    return "\n".join(lines) if lines else ("- " + _OMITTED if omitted else "- (ingen)")
 
-    system = (
-        "Du er en erfaren marketingtekstforfatter. Skriv overbevisende, brand-\n"
-        "konsistent indhold, der nøje følger de angivne brand-retningslinjer.\n"
-        "Prioritér klarhed, korthed og overbevisende formuleringer.\n"
-        "Opfind ikke fakta. Hvis information mangler, vælg sikre standarder,\n"
-        "der forbliver on-brand.\n"
-        "Du skal skelne mellem viden fra RAG/brand-retningslinjer (fakta) og\n"
-        "kanaleksempler (stil/struktur). Brug aldrig kanaleksempler som faktakilde."
-    )
-
-    brand_guidelines = (
-        "### Brand-retningslinjer\n\n"
-        "#### Tone\n" + _join_guidelines(tone_guidelines) + "\n\n"
-        "#### Terminologi\n" + _join_guidelines(terminology_guidelines) + "\n\n"
-        "#### Stil\n" + _join_guidelines(style_guidelines) + "\n\n"
-        "#### Indholdsregler\n" + _join_guidelines(content_rules)
-    )
 
-    # Optional context sections
-    opt_sections: List[str] = []
+def prompt_layout(layout: str | None = None) -> str:
+    name = str(layout or getattr(settings, "PROMPT_LAYOUT", "classic") or "").strip().lower()
+    return name if name in LAYOUTS else "classic"
 
-    if linkedin_context:
-        ln_lines: List[str] = ["### LinkedIn-kontekst (ordrette uddrag)"]
-        for i, txt in enumerate(linkedin_context[:3], start=1):
-            ln_lines.append(f"Uddrag {i}:\n" + txt.strip())
-        opt_sections.append("\n\n".join(ln_lines))
 
-    # Trustpilot context removed
+_SYSTEM = (
+    "Du er en erfaren marketingtekstforfatter. Skriv overbevisende, brand-\n"
+    "konsistent indhold, der nøje følger de angivne brand-retningslinjer.\n"
+    "Prioritér klarhed, korthed og overbevisende formuleringer.\n"
+    "Opfind ikke fakta. Hvis information mangler, vælg sikre standarder,\n"
+    "der forbliver on-brand.\n"
+    "Du skal skelne mellem viden fra RAG/brand-retningslinjer (fakta) og\n"
+    "kanaleksempler (stil/struktur). Brug aldrig kanaleksempler som faktakilde."
+)
 
-    if website_context:
-        wb_lines: List[str] = ["### Website/blog-uddrag (RAG)"]
-        for i, txt in enumerate(website_context[:5], start=1):
-            wb_lines.append(f"Uddrag {i}:\n" + txt.strip())
-        opt_sections.append("\n\n".join(wb_lines))
+_GUIDELINE_SECTIONS = ("tone", "terminology", "style", "rules")
 
-    if web_results:
-        wr_lines: List[str] = ["### Webresultater (eksterne kilder – faktatjek anbefales)"]
-        for i, item in enumerate(web_results[:3], start=1):
-            title = item.get("title", "")
-            url = item.get("url", "")
-            snippet = item.get("snippet", "")
-            wr_lines.append(f"Resultat {i}: {title}\n{url}\n{snippet}")
-        opt_sections.append("\n\n".join(wr_lines))
-
-    if web_search_directives:
-        d_company = str(web_search_directives.get("company") or "").strip()
-        d_links = web_search_directives.get("links") or []
-        if not isinstance(d_links, list):
-            d_links = []
-        links_block = "\n".join([f"- {str(u)}" for u in d_links if isinstance(u, str) and u]) if d_links else "(ingen)"
-        plan_lines: List[str] = [
-            "### Websøgeinstruktioner",
-            "- Prioritér officielle kilder: virksomhedens website og sociale profiler.",
-            "- Brug brugerens angivne links først.",
-            "- Supplér med faktuel baggrundsviden relevant for emnet.",
-            "- Indsaml kun verificerbar fakta, og medtag URL-kilder i svaret.",
-            "\nForeslåede søgeforespørgsler:",
-            f"- '{d_company} site:linkedin.com' og '{d_company} LinkedIn'" if d_company else "- 'site:linkedin.com' virksomhedsprofil",
-            f"- '{d_company} site:facebook.com'" if d_company else "- 'site:facebook.com' virksomhedsprofil",
-            f"- '{d_company} site:twitter.com OR site:x.com'" if d_company else "- 'site:x.com' virksomhedsprofil",
-            f"- 'site:{d_company.lower().replace(' ', '')}.dk' eller 'site:{d_company.lower().replace(' ', '')}.com'" if d_company else "- virksomhedens domæne med 'site:'",
-            "- Emnespecifikke fakta: definitioner, tal, og kilder med høj troværdighed.",
-            "\nBrugerangivne links (prioritér):\n" + links_block,
-        ]
-        opt_sections.append("\n".join(plan_lines))
-
-    examples_section_lines: List[str] = ["### Lignende tidligere kampagner (kun til inspiration)"]
-    if similar_campaigns:
-        for i, txt in enumerate(similar_campaigns[:5], start=1):
-            examples_section_lines.append(f"Eksempel {i}:\n" + txt.strip())
-    else:
-        examples_section_lines.append("(ingen nære match fundet)")
-    examples_section = "\n\n".join(examples_section_lines)
 
+@lru_cache(maxsize=None)
+def _channel_blocks(ct: str) -> tuple[str, tuple[str, ...], str]:
+    """(channel header, channel examples, output instructions) of a normalized content type."""
     # Channel-specific placeholders/examples
     display_type_map = {"linkedin": "LinkedIn", "facebook": "Facebook", "newsletter": "Nyhedsbrev", "blog": "Blog"}
     display_type = display_type_map.get(ct, ct.capitalize())
@@ -128,7 +80,6 @@ def build_generation_messages(
         selected = raw_examples[:2]
     else:
         selected = [(ex[:1200] + ("…" if len(ex) > 1200 else "")) for ex in raw_examples][:5]
-    channel_examples = "### Eksempler for valgt kanal (kun stil/tone, kopier ikke fakta)\n" + "\n\n".join(selected) if selected else ""
     if ct == "linkedin":
         channel_instructions = (
             "- Optimér til LinkedIn: let at skimme, kortfattet og professionelt.\n"
@@ -165,20 +116,248 @@ def build_generation_messages(
         "- De viste kanaleksempler er KUN til stil/struktur; kopier ikke fakta.\n"
         + channel_instructions
     )
+    return channel_header, tuple(selected), output_instructions
 
-    user_content = (
-        f"{brand_guidelines}\n\n"
-        + (("\n\n".join(opt_sections) + "\n\n") if opt_sections else "")
-        + f"{examples_section}\n\n"
-        + f"{channel_header}\n\n"
-        + f"{channel_examples}\n\n"
-        + f"### Brugerens forespørgsel\n{user_request.strip()}\n\n"
-        + f"{output_instructions}"
+
+def _channel_examples(examples: Iterable[str]) -> str:
+    examples = list(examples)
+    if not examples:
+        return ""
+    return "### Eksempler for valgt kanal (kun stil/tone, kopier ikke fakta)\n" + "\n\n".join(examples)
+
+
+def _brand_guidelines(guidelines: tuple[tuple[str, ...], ...], omitted: tuple[bool, ...]) -> str:
+    tone, terminology, style, rules = guidelines
+    return (
+        "### Brand-retningslinjer\n\n"
+        "#### Tone\n" + _join_guidelines(tone, omitted[0]) + "\n\n"
+        "#### Terminologi\n" + _join_guidelines(terminology, omitted[1]) + "\n\n"
+        "#### Stil\n" + _join_guidelines(style, omitted[2]) + "\n\n"
+        "#### Indholdsregler\n" + _join_guidelines(rules, omitted[3])
     )
 
+
+@lru_cache(maxsize=512)
+def _stable_prefix(
+    ct: str, examples: tuple[str, ...], guidelines: tuple[tuple[str, ...], ...], omitted: tuple[bool, ...]
+) -> str:
+    """Start of the "prefix" layout's user message; the guideline texts themselves are the version."""
+    channel_header, _, output_instructions = _channel_blocks(ct)
+    return (
+        f"{channel_header}\n\n"
+        + f"{_channel_examples(examples)}\n\n"
+        + f"{output_instructions}\n"
+        + _brand_guidelines(guidelines, omitted)
+    )
+
+
+@lru_cache(maxsize=512)
+def _cached_count(text: str, model: str) -> int:
+    return count_tokens(text, model)
+
+
+def build_generation_messages(**kwargs) -> list[dict[str, str]]:
+    """build_generation_prompt without the token report."""
+    return build_generation_prompt(**kwargs)[0]
+
+
+def build_generation_prompt(
+    *,
+    user_request: str,
+    content_type: str,
+    tone_guidelines: List[str],
+    terminology_guidelines: List[str],
+    style_guidelines: List[str],
+    content_rules: List[str],
+    similar_campaigns: List[str],
+    linkedin_context: List[str] | None = None,
+    trustpilot_context: List[str] | None = None,
+    website_context: List[str] | None = None,
+    web_results: List[Dict[str, str]] | None = None,
+    web_search_directives: Dict[str, object] | None = None,
+    model: str | None = None,
+    token_budget: int | None = None,
+    layout: str | None = None,
+) -> tuple[list[dict[str, str]], dict]:
+    """
+    Returns OpenAI chat messages with a dedicated system role and a user message
+    that contains brand guidelines, retrieved similar examples (RAG), and output
+    instructions, followed by the user's request, plus a token report.
+    - The prompt is kept within `token_budget` tokens (default: prompt_token_budget(model));
+      sections are filled in SECTION_PRIORITY order and the rest truncated or dropped.
+    - `layout` (default PROMPT_LAYOUT) orders the sections; see LAYOUTS. In the "prefix"
+      layout the guidelines and channel examples form a static prefix, budgeted before
+      the request with PREFIX_REQUEST_SHARE of the budget kept free, so the prefix does
+      not depend on the request unless the request outgrows that share.
+    - ALL brand guidelines are included verbatim (no RAG) and categorized.
+    - You are also provided with example of linkeding and facebook campaigns together with newsletters.
+    - Rag content is also provided from linkedin and historical newsletters
+    """
+
+    # Normalize/validate content type
+    allowed_types = {"linkedin", "facebook", "newsletter", "blog"}
+    ct = (content_type or "").strip().lower()
+    if ct not in allowed_types:
+        ct = "linkedin"
+
+    system = _SYSTEM
+    layout = prompt_layout(layout)
+
+    web_search_block = ""
+    if web_search_directives:
+        d_company = str(web_search_directives.get("company") or "").strip()
+        d_links = web_search_directives.get("links") or []
+        if not isinstance(d_links, list):
+            d_links = []
+        links_block = "\n".join([f"- {str(u)}" for u in d_links if isinstance(u, str) and u]) if d_links else "(ingen)"
+        plan_lines: List[str] = [
+            "### Websøgeinstruktioner",
+            "- Prioritér officielle kilder: virksomhedens website og sociale profiler.",
+            "- Brug brugerens angivne links først.",
+            "- Supplér med faktuel baggrundsviden relevant for emnet.",
+            "- Indsaml kun verificerbar fakta, og medtag URL-kilder i svaret.",
+            "\nForeslåede søgeforespørgsler:",
+            f"- '{d_company} site:linkedin.com' og '{d_company} LinkedIn'" if d_company else "- 'site:linkedin.com' virksomhedsprofil",
+            f"- '{d_company} site:facebook.com'" if d_company else "- 'site:facebook.com' virksomhedsprofil",
+            f"- '{d_company} site:twitter.com OR site:x.com'" if d_company else "- 'site:x.com' virksomhedsprofil",
+            f"- 'site:{d_company.lower().replace(' ', '')}.dk' eller 'site:{d_company.lower().replace(' ', '')}.com'" if d_company else "- virksomhedens domæne med 'site:'",
+            "- Emnespecifikke fakta: definitioner, tal, og kilder med høj troværdighed.",
+            "\nBrugerangivne links (prioritér):\n" + links_block,
+        ]
+        web_search_block = "\n".join(plan_lines)
+
+    channel_header, selected, output_instructions = _channel_blocks(ct)
+
+    # Budgeted content: each item is one guideline, retrieved chunk, web result or example
+    candidates: Dict[str, List[str]] = {
+        "rules": [x.strip() for x in content_rules if x and x.strip()],
+        "terminology": [x.strip() for x in terminology_guidelines if x and x.strip()],
+        "tone": [x.strip() for x in tone_guidelines if x and x.strip()],
+        "style": [x.strip() for x in style_guidelines if x and x.strip()],
+        "similar_campaigns": [txt.strip() for txt in (similar_campaigns or [])[:5]],
+        "website_context": [txt.strip() for txt in (website_context or [])[:5]],
+        "web_results": [
+            f"{item.get('title', '')}\n{item.get('url', '')}\n{item.get('snippet', '')}" for item in (web_results or [])[:3]
+        ],
+        "linkedin_context": [txt.strip() for txt in (linkedin_context or [])[:3]],
+        "channel_examples": list(selected),
+    }
+
+    def render(kept: Dict[str, List[str]]) -> str:
+        def omitted(name: str) -> bool:
+            return bool(candidates[name]) and not kept.get(name)
+
+        guidelines = tuple(tuple(kept.get(name, [])) for name in _GUIDELINE_SECTIONS)
+        guidelines_omitted = tuple(omitted(name) for name in _GUIDELINE_SECTIONS)
+
+        # Optional context sections
+        opt_sections: List[str] = []
+
+        if kept.get("linkedin_context"):
+            ln_lines: List[str] = ["### LinkedIn-kontekst (ordrette uddrag)"]
+            for i, txt in enumerate(kept["linkedin_context"], start=1):
+                ln_lines.append(f"Uddrag {i}:\n" + txt)
+            opt_sections.append("\n\n".join(ln_lines))
+
+        # Trustpilot context removed
+
+        if kept.get("website_context"):
+            wb_lines: List[str] = ["### Website/blog-uddrag (RAG)"]
+            for i, txt in enumerate(kept["website_context"], start=1):
+                wb_lines.append(f"Uddrag {i}:\n" + txt)
+            opt_sections.append("\n\n".join(wb_lines))
+
+        if kept.get("web_results"):
+            wr_lines: List[str] = ["### Webresultater (eksterne kilder – faktatjek anbefales)"]
+            for i, txt in enumerate(kept["web_results"], start=1):
+                wr_lines.append(f"Resultat {i}: {txt}")
+            opt_sections.append("\n\n".join(wr_lines))
+
+        if web_search_block:
+            opt_sections.append(web_search_block)
+
+        examples_section_lines: List[str] = ["### Lignende tidligere kampagner (kun til inspiration)"]
+        if kept.get("similar_campaigns"):
+            for i, txt in enumerate(kept["similar_campaigns"], start=1):
+                examples_section_lines.append(f"Eksempel {i}:\n" + txt)
+        else:
+            examples_section_lines.append(_OMITTED if omitted("similar_campaigns") else "(ingen nære match fundet)")
+        examples_section = "\n\n".join(examples_section_lines)
+
+        request_block = f"### Brugerens forespørgsel\n{user_request.strip()}"
+        if layout == "prefix":
+            return (
+                _stable_prefix(ct, tuple(kept.get("channel_examples") or ()), guidelines, guidelines_omitted) + "\n\n"
+                + (("\n\n".join(opt_sections) + "\n\n") if opt_sections else "")
+                + f"{examples_section}\n\n"
+                + request_block
+            )
+
+        return (
+            f"{_brand_guidelines(guidelines, guidelines_omitted)}\n\n"
+            + (("\n\n".join(opt_sections) + "\n\n") if opt_sections else "")
+            + f"{examples_section}\n\n"
+            + f"{channel_header}\n\n"
+            + f"{_channel_examples(kept.get('channel_examples') or [])}\n\n"
+            + f"{request_block}\n\n"
+            + f"{output_instructions}"
+        )
+
+    # Instructions, headers and the request itself are always sent; the rest of the
+    # budget is shared out by section priority
+    counting_model = model or "gpt-4o"
+    budget = token_budget if token_budget is not None else prompt_token_budget(model)
+    system_tokens = _cached_count(system, counting_model)
+    fixed = system_tokens + count_tokens(render({}), counting_model)
+    if layout == "prefix":
+        # The guidelines and channel examples are fitted first, against the static prefix
+        # with PREFIX_REQUEST_SHARE of the budget kept free: what is kept then depends only
+        # on (channel, guidelines, budget), unless the request and its web-search block need
+        # more than that share. The per-request sections share what is left after them
+        static = [name for name in SECTION_PRIORITY if name in _GUIDELINE_SECTIONS or name == "channel_examples"]
+        static_budget = None
+        if budget is not None:
+            guideline_omitted = tuple(bool(candidates[name]) for name in _GUIDELINE_SECTIONS)
+            prefix_fixed = system_tokens + _cached_count(
+                _stable_prefix(ct, (), tuple(() for _ in _GUIDELINE_SECTIONS), guideline_omitted), counting_model
+            )
+            reserve = int(budget * PREFIX_REQUEST_SHARE)
+            static_budget = max(min(budget - prefix_fixed - reserve, budget - fixed), 0)
+        kept, sections = allocate([(name, candidates[name]) for name in static], static_budget, model=counting_model)
+        request_fixed = system_tokens + count_tokens(render(kept), counting_model)
+        context_kept, context_sections = allocate(
+            [(name, candidates[name]) for name in SECTION_PRIORITY if name not in static],
+            None if budget is None else max(budget - request_fixed, 0),
+            model=counting_model,
+        )
+        kept.update(context_kept)
+        sections.update(context_sections)
+    else:
+        kept, sections = allocate(
+            [(name, candidates[name]) for name in SECTION_PRIORITY],
+            None if budget is None else max(budget - fixed, 0),
+            model=counting_model,
+        )
+    user_content = render(kept)
+    report = {
+        "budget": budget,
+        "fixed": fixed,
+        "total": system_tokens + count_tokens(user_content, counting_model),
+        "tokenizer": tokenizer_name(counting_model),
+        "layout": layout,
+        "sections": sections,
+    }
+    if layout == "prefix":
+        # Tokens the provider can serve from its prompt cache once this prefix was seen
+        prefix = _stable_prefix(
+            ct,
+            tuple(kept.get("channel_examples") or ()),
+            tuple(tuple(kept.get(name, [])) for name in _GUIDELINE_SECTIONS),
+            tuple(bool(candidates[name]) and not kept.get(name) for name in _GUIDELINE_SECTIONS),
+        )
+        report["prefix_tokens"] = system_tokens + _cached_count(prefix, counting_model)
+
     return [
         {"role": "system", "content": system},
         {"role": "user", "content": user_content},
-    ]
-
-
+    ], report
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+from django.conf import settings
+
+from .cache import CacheKey, CachedMatrix, VectorMatrixCache, _load, load_vectors
+from .utils import EMBEDDING_DIM, top_k_from_scores
+
+
+# Quantized in-memory search: rows are kept as compact codes, candidates are scored
+# on the codes and the best `rerank` of them re-scored with exact float32 vectors
+# loaded from the database.
+#
+# - "int8": per-row symmetric scalar quantization, 4x smaller than float32.
+# - "binary": ternary sign codes as two bit planes (x > 0, x < 0), 16x smaller.
+#   The hashed embeddings are sparse but *signed* (signed hashing trick), so a
+#   1-bit sign code would conflate empty slots with negative ones; the two planes
+#   keep the three states and the dot product becomes four AND + popcounts.
+
+QUANTIZATION_MODES = ("none", "int8", "binary")
+_BLOCK_ROWS = 65536  # int8 rows are widened to float32 in blocks of this size
+
+
+def quantization_mode() -> str:
+    mode = str(getattr(settings, "VECTOR_QUANTIZATION", "none")).lower()
+    return mode if mode in QUANTIZATION_MODES else "none"
+
+
+def rerank_depth() -> int:
+    return int(getattr(settings, "VECTOR_QUANT_RERANK", 200))
+
+
+def quantize_int8(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    scales = np.abs(matrix).max(axis=1) / 127.0 if matrix.shape[0] else np.empty(0, dtype=np.float32)
+    safe = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(matrix / safe[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def quantize_binary(matrix: np.ndarray) -> np.ndarray:
+    """(n, dim) -> (n, 2 * dim // 64) uint64: positive plane followed by negative plane."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    planes = np.concatenate([np.packbits(matrix > 0, axis=1), np.packbits(matrix < 0, axis=1)], axis=1)
+    return np.ascontiguousarray(planes).view(np.uint64)
+
+
+@dataclass
+class QuantizedMatrix:
+    """Quantized counterpart of CachedMatrix: codes plus row-aligned metadata, no float vectors."""
+
+    mode: str
+    codes: np.ndarray
+    scales: np.ndarray | None
+    ids: np.ndarray
+    source_types: np.ndarray
+    source_ids: np.ndarray
+    fingerprint: tuple[int, int, int]
+
+    @classmethod
+    def from_matrix(cls, entry: CachedMatrix, mode: str) -> "QuantizedMatrix":
+        if mode == "int8":
+            codes, scales = quantize_int8(entry.matrix)
+        else:
+            codes, scales = quantize_binary(entry.matrix), None
+        return cls(mode, codes, scales, entry.ids, entry.source_types, entry.source_ids, entry.fingerprint)
+
+    @property
+    def nbytes(self) -> int:
+        scales = self.scales.nbytes if self.scales is not None else 0
+        return int(self.codes.nbytes + scales + self.ids.nbytes + self.source_types.nbytes + self.source_ids.nbytes)
+
+    def __len__(self) -> int:
+        return int(self.ids.shape[0])
+
+    def approx_scores(self, query: np.ndarray, rows: np.ndarray | None = None) -> np.ndarray:
+        q = np.asarray(query, dtype=np.float32).reshape(-1)
+        codes = self.codes if rows is None else self.codes[rows]
+        if self.mode == "int8":
+            scales = self.scales if rows is None else self.scales[rows]
+            out = np.empty(codes.shape[0], dtype=np.float32)
+            for start in range(0, codes.shape[0], _BLOCK_ROWS):
+                block = codes[start:start + _BLOCK_ROWS].astype(np.float32)
+                out[start:start + _BLOCK_ROWS] = block @ q
+            return out * scales
+        words = codes.shape[1] // 2
+        qcode = quantize_binary(q[None, :])[0]
+        pos, neg = codes[:, :words], codes[:, words:]
+        qpos, qneg = qcode[:words], qcode[words:]
+        agree = np.bitwise_count(pos & qpos).sum(axis=1, dtype=np.int32) + np.bitwise_count(neg & qneg).sum(axis=1, dtype=np.int32)
+        clash = np.bitwise_count(pos & qneg).sum(axis=1, dtype=np.int32) + np.bitwise_count(neg & qpos).sum(axis=1, dtype=np.int32)
+        return (agree - clash).astype(np.float32)
+
+    def search(self, query: np.ndarray, top_k: int = 5, rerank: int | None = None, mask: np.ndarray | None = None, fetch=load_vectors) -> list[tuple[int, float]]:
+        """Approximate scores over the codes, then exact float32 re-scoring of the best `rerank` rows."""
+        rows = np.flatnonzero(mask) if mask is not None else None
+        ids = self.ids if rows is None else self.ids[rows]
+        if not ids.shape[0] or top_k <= 0:
+            return []
+        q = np.asarray(query, dtype=np.float32).reshape(-1)
+        depth = max(int(rerank or rerank_depth()), int(top_k))
+        candidates = [i for i, _ in top_k_from_scores(self.approx_scores(q, rows), ids, depth)]
+        exact = np.asarray(fetch(candidates), dtype=np.float32).reshape(-1, EMBEDDING_DIM) @ q
+        return top_k_from_scores(exact, np.asarray(candidates, dtype=np.int64), top_k)
+
+
+class QuantizedMatrixCache(VectorMatrixCache):
+    """VectorMatrixCache variant holding QuantizedMatrix entries (same LRU, byte budget and fingerprints)."""
+
+    def _build(self, key: CacheKey, fingerprint: tuple[int, int, int]) -> QuantizedMatrix:
+        mode = quantization_mode()
+        return QuantizedMatrix.from_matrix(_load(key, fingerprint), "int8" if mode == "none" else mode)
+
+    def get(self, user_id: int, source_type: str | None = None, source_id: int | None = None) -> QuantizedMatrix:
+        entry = super().get(user_id, source_type, source_id)
+        mode = quantization_mode()
+        if mode != "none" and entry.mode != mode:
+            # VECTOR_QUANTIZATION changed at runtime (benchmarks, tests): rebuild once
+            self.invalidate(int(user_id))
+            entry = super().get(user_id, source_type, source_id)
+        return entry
+
+
+quantized_cache = QuantizedMatrixCache()
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+from django.conf import settings
+
+from . import pgvector
+from .ann import ann_indexes, ann_min_chunks
+from .cache import collection_size, vector_cache
+from .pgvector import use_pgvector
+from .quantize import quantization_mode, quantized_cache
+from .segments import open_segment, segments_enabled
+from .utils import top_k_from_scores, top_k_similar
+
+
+def ann_enabled() -> bool:
+    return bool(getattr(settings, "VECTOR_ANN_ENABLED", True))
+
+
+def rank_collection(
+    user_id: int,
+    query_vec: np.ndarray,
+    top_k: int = 5,
+    source_type: str | None = None,
+    source_id: int | None = None,
+) -> list[tuple[int, float]]:
+    """
+    Top-k (chunk_id, score) for one of a user's collections.
+    Pushes the search into Postgres when pgvector is available; otherwise uses the
+    IVF index when the collection is large and the index is in sync with the
+    database, and a scan as the last resort: over the shared mmap segment when
+    VECTOR_SEGMENTS_ENABLED, over quantized codes with float32 re-ranking when
+    VECTOR_QUANTIZATION is set, else over this worker's cached float matrix.
+    """
+    if use_pgvector():
+        hits = pgvector.search(user_id, query_vec, top_k, source_type=source_type, source_id=source_id)
+        if hits is not None:
+            return hits
+    if source_type is not None and ann_enabled():
+        index = ann_indexes.get(user_id, source_type)
+        if index is not None and index.size >= ann_min_chunks() and index.size == collection_size(user_id, source_type):
+            return index.search(query_vec, top_k, source_id=source_id)
+    if segments_enabled():
+        return open_segment(user_id).search(query_vec, top_k, source_type=source_type, source_id=source_id)
+    if quantization_mode() != "none":
+        return quantized_cache.get(user_id, source_type, source_id).search(query_vec, top_k)
+    entry = vector_cache.get(user_id, source_type, source_id)
+    return top_k_similar(query_vec, entry.matrix, entry.ids, top_k=top_k)
+
+
+@dataclass(frozen=True)
+class Collection:
+    """One retrieval target for `retrieve`: a source_type (optionally one source_id) and its quota."""
+
+    name: str
+    source_type: str
+    source_id: int | None = None
+    quota: int = 5
+
+
+def _ann_hits(user_id: int, query_vec: np.ndarray, coll: Collection) -> list[tuple[int, float]] | None:
+    if not ann_enabled():
+        return None
+    index = ann_indexes.get(user_id, coll.source_type)
+    if index is None or index.size < ann_min_chunks() or index.size != collection_size(user_id, coll.source_type):
+        return None
+    return index.search(query_vec, coll.quota, source_id=coll.source_id)
+
+
+def _collection_mask(entry, coll: Collection) -> np.ndarray:
+    mask = entry.source_types == coll.source_type
+    if coll.source_id is not None:
+        mask &= entry.source_ids == coll.source_id
+    return mask
+
+
+def retrieve(user_id: int, query_vec: np.ndarray, collections: list[Collection]) -> dict[str, list[tuple[int, float]]]:
+    """
+    Per-collection top-k for several collections from one embedded query.
+    Collections served by pgvector or a large in-sync IVF index are searched there;
+    all the others share a single pass over the user's vectors: one fingerprint
+    query, then one matrix-vector product over the cached matrix with a row mask and
+    quota per collection (or one slice per collection of the mmap segment).
+    """
+    results: dict[str, list[tuple[int, float]]] = {}
+    pending: list[Collection] = []
+    for coll in collections:
+        hits = None
+        if coll.quota <= 0:
+            hits = []
+        elif use_pgvector():
+            hits = pgvector.search(user_id, query_vec, coll.quota, source_type=coll.source_type, source_id=coll.source_id)
+        if hits is None:
+            hits = _ann_hits(user_id, query_vec, coll)
+        if hits is None:
+            pending.append(coll)
+        else:
+            results[coll.name] = hits
+    if pending and segments_enabled():
+        segment = open_segment(user_id)
+        for coll in pending:
+            results[coll.name] = segment.search(query_vec, coll.quota, source_type=coll.source_type, source_id=coll.source_id)
+    elif pending and quantization_mode() != "none":
+        codes = quantized_cache.get(user_id)
+        for coll in pending:
+            results[coll.name] = codes.search(query_vec, coll.quota, mask=_collection_mask(codes, coll))
+    elif pending:
+        entry = vector_cache.get(user_id)
+        scores = entry.matrix @ np.asarray(query_vec, dtype=np.float32)
+        for coll in pending:
+            mask = _collection_mask(entry, coll)
+            results[coll.name] = top_k_from_scores(scores[mask], entry.ids[mask], coll.quota)
+    return {coll.name: results[coll.name] for coll in collections}
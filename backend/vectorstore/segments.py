@@ -0,0 +1,339 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .ann import _locked, _remove_stale_files
+from .utils import EMBEDDING_DIM, top_k_from_scores
+
+
+# Memory-mapped vector segments shared by every worker process, LSM style.
+# Each user has one immutable base segment, sorted by (source_type, id) so a source
+# type is a contiguous row range, plus a small delta (new chunks and tombstones)
+# that is rewritten on each write and folded into a new base by compaction.
+# Workers np.load(mmap_mode="r") the base, so its pages live once in the OS cache.
+#
+# On-disk layout under VECTOR_SEGMENT_DIR/<user_id>/:
+#   manifest.json               {"generation": g, "delta": d, "ranges": {type: [a, b]}, ...}
+#   base-<g>-<name>.npy         vectors (n, dim) float32, ids, source_ids
+#   delta-<g>-<d>-<name>.npy    chunks added since the last compaction + deleted ids
+
+BASE_ARRAYS = ("vectors", "ids", "source_ids")
+DELTA_ARRAYS = ("delta_vectors", "delta_ids", "delta_source_ids", "delta_source_types", "deleted")
+
+
+def segment_root() -> Path:
+    return Path(getattr(settings, "VECTOR_SEGMENT_DIR", Path(settings.BASE_DIR) / "var" / "vector_segments"))
+
+
+def segments_enabled() -> bool:
+    return bool(getattr(settings, "VECTOR_SEGMENTS_ENABLED", False))
+
+
+def delta_max_rows() -> int:
+    return int(getattr(settings, "VECTOR_SEGMENT_DELTA_MAX_ROWS", 5000))
+
+
+def _segment_dir(user_id: int) -> Path:
+    return segment_root() / str(int(user_id))
+
+
+def _empty_delta() -> dict[str, np.ndarray]:
+    return {
+        "delta_vectors": np.empty((0, EMBEDDING_DIM), dtype=np.float32),
+        "delta_ids": np.empty(0, dtype=np.int64),
+        "delta_source_ids": np.empty(0, dtype=np.int64),
+        "delta_source_types": np.empty(0, dtype="<U16"),
+        "deleted": np.empty(0, dtype=np.int64),
+    }
+
+
+class Segment:
+    """One user's base segment (memory-mapped) plus its in-memory delta and tombstones."""
+
+    def __init__(self, arrays: dict[str, np.ndarray], ranges: dict[str, tuple[int, int]], generation: int = 0, delta: int = 0):
+        self.arrays = arrays
+        self.ranges = ranges
+        self.generation = generation
+        self.delta = delta
+        self._deleted = np.asarray(arrays["deleted"], dtype=np.int64)
+        live_base = arrays["ids"] if not self._deleted.shape[0] else arrays["ids"][~np.isin(arrays["ids"], self._deleted)]
+        live_delta = arrays["delta_ids"]
+        if self._deleted.shape[0]:
+            live_delta = live_delta[~np.isin(live_delta, self._deleted)]
+        self.size = int(live_base.shape[0] + live_delta.shape[0])
+        max_id = max(int(live_base.max()) if live_base.shape[0] else 0, int(live_delta.max()) if live_delta.shape[0] else 0)
+        # cache._fingerprint without the collection version: segments live on disk and
+        # are rebuilt by collection_changed when vectors are rewritten in place
+        self.fingerprint = (self.size, max_id)
+
+    @classmethod
+    def build(cls, ids, source_types, source_ids, matrix) -> "Segment":
+        source_types = np.asarray(source_types, dtype="<U16")
+        ids = np.asarray(ids, dtype=np.int64)
+        order = np.lexsort((ids, source_types))
+        source_types = source_types[order]
+        ranges = {}
+        for name in np.unique(source_types).tolist():
+            ranges[name] = (
+                int(np.searchsorted(source_types, name, side="left")),
+                int(np.searchsorted(source_types, name, side="right")),
+            )
+        arrays = {
+            "vectors": np.ascontiguousarray(np.asarray(matrix, dtype=np.float32)[order]),
+            "ids": ids[order],
+            "source_ids": np.asarray(source_ids, dtype=np.int64)[order],
+            **_empty_delta(),
+        }
+        return cls(arrays, ranges)
+
+    @property
+    def delta_rows(self) -> int:
+        return int(self.arrays["delta_ids"].shape[0] + self._deleted.shape[0])
+
+    def compacted(self) -> "Segment":
+        """Fold the delta and tombstones into a fresh base."""
+        a = self.arrays
+        base_types = np.empty(a["ids"].shape[0], dtype="<U16")
+        for name, (start, end) in self.ranges.items():
+            base_types[start:end] = name
+        ids = np.concatenate([a["ids"], a["delta_ids"]])
+        keep = ~np.isin(ids, self._deleted)
+        return Segment.build(
+            ids[keep],
+            np.concatenate([base_types, a["delta_source_types"]])[keep],
+            np.concatenate([a["source_ids"], a["delta_source_ids"]])[keep],
+            np.concatenate([a["vectors"], a["delta_vectors"]])[keep],
+        )
+
+    def with_added(self, ids, source_type: str, source_ids, matrix) -> "Segment":
+        ids = np.asarray(ids, dtype=np.int64)
+        fresh = ~np.isin(ids, self.arrays["ids"]) & ~np.isin(ids, self.arrays["delta_ids"])
+        n = int(fresh.sum())
+        arrays = dict(self.arrays)
+        arrays["delta_vectors"] = np.concatenate([
+            self.arrays["delta_vectors"],
+            np.asarray(matrix, dtype=np.float32).reshape(-1, EMBEDDING_DIM)[fresh],
+        ])
+        arrays["delta_ids"] = np.concatenate([self.arrays["delta_ids"], ids[fresh]])
+        arrays["delta_source_ids"] = np.concatenate([
+            self.arrays["delta_source_ids"], np.asarray(source_ids, dtype=np.int64)[fresh]
+        ])
+        arrays["delta_source_types"] = np.concatenate([
+            self.arrays["delta_source_types"], np.full(n, source_type, dtype="<U16")
+        ])
+        return Segment(arrays, self.ranges, self.generation, self.delta + 1)
+
+    def with_removed(self, ids) -> "Segment":
+        arrays = dict(self.arrays)
+        arrays["deleted"] = np.union1d(self._deleted, np.asarray(ids, dtype=np.int64))
+        return Segment(arrays, self.ranges, self.generation, self.delta + 1)
+
+    def live_ids(self, source_type: str) -> np.ndarray:
+        start, end = self.ranges.get(source_type, (0, 0))
+        delta = self.arrays["delta_ids"][self.arrays["delta_source_types"] == source_type]
+        return np.concatenate([self.arrays["ids"][start:end], delta])
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int = 5,
+        source_type: str | None = None,
+        source_id: int | None = None,
+    ) -> list[tuple[int, float]]:
+        """Exact top-k, scoring only the base rows of `source_type` (a contiguous slice) and the delta."""
+        q = np.asarray(query, dtype=np.float32).reshape(-1)
+        a = self.arrays
+        if source_type is None:
+            start, end = 0, a["ids"].shape[0]
+            in_delta = np.ones(a["delta_ids"].shape[0], dtype=bool)
+        else:
+            start, end = self.ranges.get(source_type, (0, 0))
+            in_delta = a["delta_source_types"] == source_type
+        scores = np.concatenate([a["vectors"][start:end] @ q, a["delta_vectors"][in_delta] @ q])
+        ids = np.concatenate([a["ids"][start:end], a["delta_ids"][in_delta]])
+        keep = None
+        if self._deleted.shape[0]:
+            keep = ~np.isin(ids, self._deleted)
+        if source_id is not None:
+            same = np.concatenate([a["source_ids"][start:end], a["delta_source_ids"][in_delta]]) == source_id
+            keep = same if keep is None else keep & same
+        if keep is not None:
+            scores, ids = scores[keep], ids[keep]
+        return top_k_from_scores(scores, ids, top_k)
+
+    # ---- persistence ----
+
+    def save(self, directory: Path, new_base: bool) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        if new_base:
+            self.generation += 1
+            self.delta = 0
+            for name in BASE_ARRAYS:
+                np.save(directory / f"base-{self.generation}-{name}.npy", self.arrays[name])
+        for name in DELTA_ARRAYS:
+            np.save(directory / f"delta-{self.generation}-{self.delta}-{name}.npy", self.arrays[name])
+        manifest = {
+            "generation": self.generation,
+            "delta": self.delta,
+            "ranges": self.ranges,
+            "size": self.size,
+        }
+        tmp = directory / "manifest.json.tmp"
+        tmp.write_text(json.dumps(manifest))
+        os.replace(tmp, directory / "manifest.json")
+        _remove_stale_files(directory, self.generation, self.delta)
+
+    @classmethod
+    def load(cls, directory: Path) -> "Segment | None":
+        try:
+            manifest = json.loads((directory / "manifest.json").read_text())
+            g, d = int(manifest["generation"]), int(manifest["delta"])
+            arrays = {name: np.load(directory / f"base-{g}-{name}.npy", mmap_mode="r") for name in BASE_ARRAYS}
+            arrays.update({name: np.load(directory / f"delta-{g}-{d}-{name}.npy") for name in DELTA_ARRAYS})
+            ranges = {name: (int(a), int(b)) for name, (a, b) in manifest["ranges"].items()}
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(arrays, ranges, g, d)
+
+
+class SegmentRegistry:
+    """Per-process view of the on-disk segments, reloaded when the manifest changes."""
+
+    def __init__(self) -> None:
+        self._segments: dict[int, tuple[int, Segment]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Segment | None:
+        directory = _segment_dir(user_id)
+        try:
+            mtime = (directory / "manifest.json").stat().st_mtime_ns
+        except OSError:
+            self.forget(user_id)
+            return None
+        with self._lock:
+            cached = self._segments.get(int(user_id))
+            if cached and cached[0] == mtime:
+                return cached[1]
+        segment = Segment.load(directory)
+        if segment is not None:
+            with self._lock:
+                self._segments[int(user_id)] = (mtime, segment)
+        return segment
+
+    def forget(self, user_id: int) -> None:
+        with self._lock:
+            self._segments.pop(int(user_id), None)
+
+
+segments = SegmentRegistry()
+
+
+def build_segment(user_id: int) -> Segment:
+    """Write a fresh base segment for a user from the database."""
+    from .cache import _fingerprint, _load
+
+    key = (int(user_id), None, None)
+    entry = _load(key, _fingerprint(key))
+    directory = _segment_dir(user_id)
+    with _locked(directory):
+        segment = Segment.build(entry.ids, entry.source_types, entry.source_ids, entry.matrix)
+        previous = Segment.load(directory)
+        segment.generation = previous.generation if previous else 0
+        segment.save(directory, new_base=True)
+    segments.forget(user_id)
+    return segment
+
+
+def compact_segment(user_id: int) -> Segment | None:
+    """Merge the delta into a new base; no database access."""
+    directory = _segment_dir(user_id)
+    if not (directory / "manifest.json").exists():
+        return None
+    with _locked(directory):
+        current = Segment.load(directory)
+        if current is None:
+            return None
+        if not current.delta_rows:
+            return current
+        segment = current.compacted()
+        segment.generation = current.generation
+        segment.save(directory, new_base=True)
+    segments.forget(user_id)
+    return segment
+
+
+def open_segment(user_id: int) -> Segment:
+    """The user's segment, (re)built from the database when missing or out of step with it."""
+    from .cache import _fingerprint
+
+    segment = segments.get(user_id)
+    if segment is None or segment.fingerprint != _fingerprint((int(user_id), None, None))[:2]:
+        segment = build_segment(user_id)
+    return segment
+
+
+_compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vector-compact")
+_compaction_pending: set[int] = set()
+_compaction_lock = threading.Lock()
+
+
+def schedule_compaction(user_id: int) -> None:
+    """Compact in the background; at most one queued compaction per user and process."""
+    with _compaction_lock:
+        if user_id in _compaction_pending:
+            return
+        _compaction_pending.add(user_id)
+
+    def run() -> None:
+        try:
+            compact_segment(user_id)
+        finally:
+            with _compaction_lock:
+                _compaction_pending.discard(user_id)
+
+    _compactor.submit(run)
+
+
+def _update(user_id: int, change) -> None:
+    directory = _segment_dir(user_id)
+    if not (directory / "manifest.json").exists():
+        return
+    with _locked(directory):
+        segment = Segment.load(directory)
+        if segment is None:
+            return
+        segment = change(segment)
+        segment.save(directory, new_base=False)
+    segments.forget(user_id)
+    if segment.delta_rows > delta_max_rows():
+        schedule_compaction(user_id)
+
+
+def segment_chunks_added(user_id: int, source_type: str, ids, source_ids, matrix) -> None:
+    """Write hook: append new chunks to an existing segment's delta."""
+    if len(ids):
+        _update(user_id, lambda segment: segment.with_added(ids, source_type, source_ids, matrix))
+
+
+def segment_chunks_removed(user_id: int, ids) -> None:
+    """Write hook: tombstone deleted chunk ids."""
+    if len(ids):
+        _update(user_id, lambda segment: segment.with_removed(ids))
+
+
+def segment_source_dropped(user_id: int, source_type: str) -> None:
+    """Write hook: tombstone every chunk of one source type."""
+    _update(user_id, lambda segment: segment.with_removed(segment.live_ids(source_type)))
+
+
+def segment_changed(user_id: int) -> None:
+    """Write hook: vectors were rewritten in place, rebuild from the database."""
+    if (_segment_dir(user_id) / "manifest.json").exists():
+        build_segment(user_id)
@@ -0,0 +1,794 @@
+import asyncio
+import json
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import pgvector, retrieval, segments, utils
+from .ann import ANN_BUILD_JOB, IVFIndex, ann_indexes
+from .cache import CachedMatrix, VectorMatrixCache, bump_version, collection_version
+from .ingest import ingest_chunks, sync_chunks
+from .llm_cache import MemoryLLMCache, SQLiteLLMCache, cache_mode, cached_call, llm_cache_key
+from .models import VectorizedChunk
+from .prompt_template import _OMITTED, build_generation_prompt
+from .quantize import QuantizedMatrix, quantize_binary
+from .retrieval import rank_collection
+from .segments import Segment
+from .token_budget import allocate, count_tokens, prompt_token_budget, truncate_to_tokens
+from .utils import CircuitBreaker, EMBEDDING_DIM, generate_with_fallback, hedge_delay, hedged, embed_texts, pack_vector, top_k_from_scores, top_k_similar
+
+
+def _user(name: str = "alice"):
+    return get_user_model().objects.create_user(username=name, password="pw")
+
+
+class VectorMatrixCacheTests(TestCase):
+    def setUp(self):
+        self.user = _user()
+        self.cache = VectorMatrixCache()
+        ingest_chunks(self.user.id, "upload", 1, ["first chunk about shoes", "second chunk about socks"])
+
+    def test_second_read_is_a_hit(self):
+        first = self.cache.get(self.user.id, "upload")
+        second = self.cache.get(self.user.id, "upload")
+        self.assertIs(first, second)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(len(first), 2)
+
+    def test_inserts_by_another_process_are_seen(self):
+        self.cache.get(self.user.id, "upload")
+        # Written without going through this cache instance, as another worker would
+        VectorizedChunk.objects.create(
+            user=self.user, source_type="upload", source_id=1, text="third", vector_bin=pack_vector(embed_texts(["third"])[0])
+        )
+        self.assertEqual(len(self.cache.get(self.user.id, "upload")), 3)
+
+    def test_in_place_rewrites_are_seen_through_the_version(self):
+        entry = self.cache.get(self.user.id, "upload")
+        chunk = VectorizedChunk.objects.filter(user=self.user).order_by("id").first()
+        replacement = embed_texts(["something else entirely"])[0]
+        chunk.vector_bin = pack_vector(replacement)
+        VectorizedChunk.objects.bulk_update([chunk], ["vector_bin"])
+        # Count and max(id) are unchanged: only the version bump marks the entry stale
+        self.assertIs(self.cache.get(self.user.id, "upload"), entry)
+        bump_version(self.user.id)
+        fresh = self.cache.get(self.user.id, "upload")
+        self.assertIsNot(fresh, entry)
+        np.testing.assert_allclose(fresh.matrix[list(fresh.ids).index(chunk.id)], replacement)
+
+    def test_write_hooks_bump_the_version(self):
+        before = collection_version(self.user.id)
+        ingest_chunks(self.user.id, "upload", 2, ["another chunk"])
+        self.assertGreater(collection_version(self.user.id), before)
+
+    def test_entries_are_per_user(self):
+        other = _user("bob")
+        ingest_chunks(other.id, "upload", 1, ["bob's chunk"])
+        self.assertEqual(len(self.cache.get(other.id, "upload")), 1)
+        self.assertEqual(len(self.cache.get(self.user.id, "upload")), 2)
+
+    def test_evicts_least_recently_used_over_the_byte_budget(self):
+        other = _user("bob")
+        ingest_chunks(other.id, "upload", 1, ["bob's chunk", "and another"])
+        size = self.cache.get(self.user.id, "upload").nbytes
+        cache = VectorMatrixCache(max_bytes=size + 1)
+        cache.get(self.user.id, "upload")
+        cache.get(other.id, "upload")
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertEqual(cache.evictions, 1)
+
+
+class TopKTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        matrix = rng.normal(size=(500, 256)).astype(np.float32)
+        self.matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.ids = np.arange(1000, 1500, dtype=np.int64)
+        self.queries = self.matrix[:3] + 0.1
+
+    def _reference(self, query, k):
+        scores = self.matrix @ query
+        order = np.argsort(-scores, kind="stable")[:k]
+        return [(int(self.ids[i]), float(scores[i])) for i in order]
+
+    def test_matches_a_full_sort(self):
+        for query in self.queries:
+            got = top_k_similar(query, self.matrix, self.ids, top_k=10)
+            want = self._reference(query, 10)
+            self.assertEqual([i for i, _ in got], [i for i, _ in want])
+            np.testing.assert_allclose([s for _, s in got], [s for _, s in want], rtol=1e-6)
+
+    def test_batch_equals_single_queries(self):
+        batch = top_k_similar(self.queries, self.matrix, self.ids, top_k=7)
+        for got, query in zip(batch, self.queries):
+            single = top_k_similar(query, self.matrix, self.ids, top_k=7)
+            self.assertEqual([i for i, _ in got], [i for i, _ in single])
+            np.testing.assert_allclose([s for _, s in got], [s for _, s in single], rtol=1e-5)
+
+    def test_k_larger_than_the_collection_returns_everything_sorted(self):
+        got = top_k_similar(self.queries[0], self.matrix[:4], self.ids[:4], top_k=10)
+        self.assertEqual(len(got), 4)
+        self.assertEqual([s for _, s in got], sorted((s for _, s in got), reverse=True))
+
+    def test_empty_inputs(self):
+        self.assertEqual(top_k_similar(self.queries[0], self.matrix[:0], self.ids[:0], top_k=5), [])
+        self.assertEqual(top_k_similar(self.queries, self.matrix[:0], self.ids[:0], top_k=5), [[], [], []])
+        self.assertEqual(top_k_similar(self.queries[0], self.matrix, self.ids, top_k=0), [])
+        self.assertEqual(top_k_from_scores(np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)), [])
+
+    def test_ties_keep_the_full_score_set(self):
+        scores = np.array([0.5, 0.9, 0.5, 0.5, 0.1, 0.9], dtype=np.float32)
+        ids = np.arange(6)
+        got = top_k_from_scores(scores, ids, top_k=4)
+        self.assertEqual([s for _, s in got], [0.8999999761581421, 0.8999999761581421, 0.5, 0.5])
+        self.assertEqual({i for i, _ in got[:2]}, {1, 5})
+        self.assertTrue({i for i, _ in got[2:]} <= {0, 2, 3})
+        self.assertEqual(len({i for i, _ in got}), 4)
+
+
+def _clustered(n: int, clusters: int = 40, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, EMBEDDING_DIM))
+    points = centers[rng.integers(0, clusters, size=n)] + 0.3 * rng.normal(size=(n, EMBEDDING_DIM))
+    return (points / np.linalg.norm(points, axis=1, keepdims=True)).astype(np.float32)
+
+
+class IVFIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.matrix = _clustered(4000)
+        self.ids = np.arange(1, 4001, dtype=np.int64)
+        self.source_ids = self.ids % 7
+        self.index = IVFIndex.build(self.ids, self.source_ids, self.matrix)
+        self.queries = _clustered(50, seed=1)
+
+    def _recall(self, index, k: int = 10, **kwargs) -> float:
+        found = 0
+        for q in self.queries:
+            exact = {i for i, _ in top_k_similar(q, self.matrix, self.ids, top_k=k)}
+            found += len(exact & {i for i, _ in index.search(q, top_k=k, **kwargs)})
+        return found / (k * len(self.queries))
+
+    def test_probing_every_list_is_exact(self):
+        self.assertEqual(self._recall(self.index, nprobe=self.index.nlist), 1.0)
+
+    def test_default_nprobe_recall(self):
+        self.assertGreaterEqual(self._recall(self.index), 0.9)
+
+    def test_scores_match_the_exact_scores(self):
+        q = self.queries[0]
+        exact = dict(top_k_similar(q, self.matrix, self.ids, top_k=4000))
+        for chunk_id, score in self.index.search(q, top_k=10):
+            self.assertAlmostEqual(score, exact[chunk_id], places=5)
+
+    def test_delta_adds_and_tombstones(self):
+        extra = self.queries[:1]
+        index = self.index.with_added(np.array([9999]), np.array([3]), extra).with_removed(np.array([9999, 1]))
+        self.assertEqual(index.size, 3999)
+        self.assertNotIn(9999, [i for i, _ in index.search(extra[0], top_k=5)])
+        added = self.index.with_added(np.array([9999]), np.array([3]), extra)
+        self.assertEqual(added.search(extra[0], top_k=1)[0][0], 9999)
+
+    def test_source_filter(self):
+        hits = self.index.search(self.queries[0], top_k=20, source_id=3)
+        self.assertTrue(hits)
+        self.assertTrue(all(chunk_id % 7 == 3 for chunk_id, _ in hits))
+
+    def test_short_filtered_search_probes_every_list(self):
+        # A source whose few chunks sit far from the query's nearest lists
+        q = self.queries[0]
+        far = np.argsort(self.matrix @ q)[:12]
+        source_ids = np.zeros(4000, dtype=np.int64)
+        source_ids[far] = 99
+        index = IVFIndex.build(self.ids, source_ids, self.matrix)
+        hits = index.search(q, top_k=10, nprobe=1, source_id=99)
+        expected = top_k_similar(q, self.matrix[far], self.ids[far], top_k=10)
+        self.assertEqual([i for i, _ in hits], [i for i, _ in expected])
+        self.assertEqual(len(index.search(q, top_k=20, nprobe=1, source_id=99)), 12)
+
+    def test_save_and_load_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.index.with_added(np.array([9999]), np.array([3]), self.queries[:1]).save(Path(tmp), new_base=True)
+            loaded = IVFIndex.load(Path(tmp))
+            self.assertEqual(loaded.size, 4001)
+            self.assertEqual(loaded.search(self.queries[0], top_k=1)[0][0], 9999)
+
+
+class PgvectorSearchTests(TestCase):
+    def _search(self, rows, version="0.8.0", top_k=3):
+        cursor = mock.MagicMock()
+        cursor.fetchone.return_value = (version,)
+        cursor.fetchall.return_value = rows
+        connection = mock.MagicMock()
+        connection.cursor.return_value.__enter__.return_value = cursor
+        with mock.patch.object(pgvector, "connection", connection), mock.patch.object(pgvector, "_iterative_scan", None):
+            return pgvector.search(1, embed_texts(["shoes"])[0], top_k), cursor
+
+    def test_full_result(self):
+        hits, _ = self._search([(1, 0.9), (2, 0.8), (3, 0.7)])
+        self.assertEqual(hits, [(1, 0.9), (2, 0.8), (3, 0.7)])
+
+    def test_short_result_falls_back(self):
+        self.assertIsNone(self._search([(1, 0.9)])[0])
+        self.assertIsNone(self._search([])[0])
+
+    def test_iterative_scan_only_on_supporting_versions(self):
+        _, cursor = self._search([(1, 0.9), (2, 0.8), (3, 0.7)], version="0.8.0")
+        statements = [c.args[0] for c in cursor.execute.call_args_list]
+        self.assertIn("SET LOCAL hnsw.iterative_scan = strict_order", statements)
+        _, cursor = self._search([(1, 0.9), (2, 0.8), (3, 0.7)], version="0.7.4")
+        statements = [c.args[0] for c in cursor.execute.call_args_list]
+        self.assertNotIn("SET LOCAL hnsw.iterative_scan = strict_order", statements)
+
+    def test_rank_collection_uses_numpy_when_pgvector_comes_back_short(self):
+        user = _user()
+        ids = ingest_chunks(user.id, "upload", 1, ["red shoes", "blue socks", "green hats"]).ids
+        query = embed_texts(["red shoes"])[0]
+        with mock.patch.object(retrieval, "use_pgvector", return_value=True), mock.patch.object(
+            pgvector, "search", return_value=None
+        ) as search:
+            hits = rank_collection(user.id, query, 2, source_type="upload")
+        search.assert_called_once()
+        self.assertEqual(len(hits), 2)
+        self.assertEqual(hits[0][0], ids[0])
+
+
+class SegmentTests(SimpleTestCase):
+    def setUp(self):
+        self.matrix = _clustered(600, seed=2)
+        self.ids = np.arange(1, 601, dtype=np.int64)
+        self.types = np.where(self.ids % 3 == 0, "website", "upload")
+        self.source_ids = self.ids % 5
+        self.segment = Segment.build(self.ids, self.types, self.source_ids, self.matrix)
+        self.query = _clustered(1, seed=3)[0]
+
+    def _exact(self, mask, k=10):
+        return top_k_similar(self.query, self.matrix[mask], self.ids[mask], top_k=k)
+
+    def test_search_matches_the_exact_scan_per_source_type(self):
+        for source_type in ("upload", "website"):
+            got = self.segment.search(self.query, 10, source_type=source_type)
+            want = self._exact(self.types == source_type)
+            self.assertEqual([i for i, _ in got], [i for i, _ in want])
+        got = self.segment.search(self.query, 10, source_type="upload", source_id=2)
+        self.assertEqual([i for i, _ in got], [i for i, _ in self._exact((self.types == "upload") & (self.source_ids == 2))])
+
+    def test_delta_and_compaction_agree(self):
+        extra = _clustered(5, seed=4)
+        segment = self.segment.with_added(np.arange(1000, 1005), "website", np.zeros(5), extra).with_removed(self.ids[:50])
+        self.assertEqual(segment.size, 600 + 5 - 50)
+        before = segment.search(self.query, 20, source_type="website")
+        compacted = segment.compacted()
+        self.assertEqual(compacted.size, segment.size)
+        self.assertEqual(compacted.delta_rows, 0)
+        self.assertEqual([i for i, _ in compacted.search(self.query, 20, source_type="website")], [i for i, _ in before])
+        self.assertFalse(set(self.ids[:50].tolist()) & {i for i, _ in segment.search(self.query, 600)})
+
+    def test_save_and_load_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.segment.with_removed(self.ids[:1]).save(Path(tmp), new_base=True)
+            loaded = Segment.load(Path(tmp))
+            self.assertEqual(loaded.size, 599)
+            self.assertEqual(loaded.fingerprint, (599, 600))
+            self.assertEqual(loaded.search(self.query, 10), self.segment.with_removed(self.ids[:1]).search(self.query, 10))
+
+
+class SegmentWriteHookTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        override = override_settings(VECTOR_SEGMENTS_ENABLED=True, VECTOR_SEGMENT_DIR=Path(self.tmp.name))
+        override.enable()
+        self.addCleanup(override.disable)
+        segments.segments._segments.clear()
+        self.user = _user()
+
+    def test_hooks_keep_the_segment_in_step_with_the_database(self):
+        ingest_chunks(self.user.id, "upload", 1, ["red shoes", "blue socks"])
+        built = segments.open_segment(self.user.id)
+        self.assertEqual(built.size, 2)
+        ingest_chunks(self.user.id, "upload", 2, ["green hats"])
+        sync_chunks(self.user.id, "upload", 1, ["red shoes"])
+        segment = segments.open_segment(self.user.id)
+        # Patched through the delta, not rebuilt: still the first base generation
+        self.assertEqual(segment.generation, built.generation)
+        self.assertEqual(segment.size, VectorizedChunk.objects.filter(user=self.user).count())
+        found = {i for i, _ in segment.search(embed_texts(["blue socks"])[0], 5)}
+        self.assertEqual(found, set(VectorizedChunk.objects.filter(user=self.user).values_list("id", flat=True)))
+
+
+class AnnWriteHookTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        override = override_settings(VECTOR_INDEX_DIR=Path(self.tmp.name), VECTOR_ANN_MIN_CHUNKS=40, BACKGROUND_JOBS_ENABLED=True)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = _user()
+
+    def _ingest(self, source_id: int, n: int) -> None:
+        ingest_chunks(self.user.id, "upload", source_id, [f"campaign {source_id} number {i} about shoes" for i in range(n)])
+
+    def _build_jobs(self):
+        from api.models import Job
+
+        return Job.objects.filter(user=self.user, kind=ANN_BUILD_JOB)
+
+    def _run_jobs(self) -> None:
+        from api.jobs import claim_next, run_job
+
+        while (job := claim_next("test")) is not None:
+            self.assertEqual(run_job(job).status, "succeeded", job.error)
+
+    def test_builds_are_queued_not_run_on_write(self):
+        self._ingest(1, 30)
+        self.assertFalse(self._build_jobs().exists())
+        self._ingest(2, 15)
+        self._ingest(3, 1)
+        self.assertIsNone(ann_indexes.get(self.user.id, "upload"))
+        self.assertEqual(self._build_jobs().count(), 1)  # one queued build per collection
+
+        self._run_jobs()
+        index = ann_indexes.get(self.user.id, "upload")
+        self.assertEqual((index.size, index.delta), (46, 0))
+
+        # Small writes patch the delta; a large one also queues a rebuild
+        self._ingest(4, 5)
+        self.assertEqual(ann_indexes.get(self.user.id, "upload").size, 51)
+        self.assertFalse(self._build_jobs().filter(status="queued").exists())
+        self._ingest(5, 10)
+        index = ann_indexes.get(self.user.id, "upload")
+        self.assertEqual((index.size, index.generation), (61, 1))
+        self.assertEqual(self._build_jobs().filter(status="queued").count(), 1)
+        self._run_jobs()
+        index = ann_indexes.get(self.user.id, "upload")
+        self.assertEqual((index.size, index.generation, index.delta), (61, 2, 0))
+
+    @override_settings(BACKGROUND_JOBS_ENABLED=False)
+    def test_without_jobs_the_write_path_never_builds(self):
+        self._ingest(1, 60)
+        self.assertIsNone(ann_indexes.get(self.user.id, "upload"))
+        self.assertFalse(self._build_jobs().exists())
+
+
+class QuantizedSearchTests(SimpleTestCase):
+    def setUp(self):
+        texts = [f"campaign {i} about {word} and {other}" for i, (word, other) in enumerate(
+            (w, o) for w in ("shoes", "socks", "hats", "coats", "bags") for o in ("summer", "winter", "sale", "launch")
+        )]
+        self.matrix = embed_texts(texts)  # sparse and signed (signed hashing trick)
+        self.ids = np.arange(10, 10 + len(texts), dtype=np.int64)
+        self.query = embed_texts(["shoes for the winter sale"])[0]
+        self.fetch = lambda ids: self.matrix[np.searchsorted(self.ids, ids)]
+
+    def _quantized(self, mode):
+        entry = CachedMatrix(self.matrix, self.ids, np.full(len(self.ids), "upload"), self.ids, (len(self.ids), 0, 0))
+        return QuantizedMatrix.from_matrix(entry, mode)
+
+    def test_binary_codes_keep_the_sign(self):
+        ternary = np.sign(self.matrix)
+        codes = self._quantized("binary")
+        np.testing.assert_array_equal(codes.approx_scores(self.query), ternary @ np.sign(self.query))
+        # A row pointing away from the query scores below an empty one, unlike 1-bit codes
+        opposite = QuantizedMatrix("binary", quantize_binary(np.stack([-self.query, np.zeros_like(self.query)])), None,
+                                   np.array([1, 2]), np.array(["upload"] * 2), np.array([1, 2]), (2, 2, 0))
+        low, empty = opposite.approx_scores(self.query)
+        self.assertLess(low, empty)
+
+    def test_int8_scores_approximate_the_float_scores(self):
+        np.testing.assert_allclose(self._quantized("int8").approx_scores(self.query), self.matrix @ self.query, atol=0.02)
+
+    def test_reranked_results_are_exact(self):
+        want = top_k_similar(self.query, self.matrix, self.ids, top_k=5)
+        for mode in ("int8", "binary"):
+            got = self._quantized(mode).search(self.query, 5, rerank=len(self.ids), fetch=self.fetch)
+            # Several texts tie on score, so compare the scores rather than the id order
+            np.testing.assert_allclose([s for _, s in got], [s for _, s in want], rtol=1e-6)
+            self.assertEqual(len({i for i, _ in got}), 5)
+
+    def test_shallow_rerank_still_reports_float_scores(self):
+        exact = dict(top_k_similar(self.query, self.matrix, self.ids, top_k=len(self.ids)))
+        for chunk_id, score in self._quantized("binary").search(self.query, 3, rerank=6, fetch=self.fetch):
+            self.assertAlmostEqual(score, exact[chunk_id], places=6)
+
+
+class IngestTests(TestCase):
+    def setUp(self):
+        self.user = _user()
+
+    def test_bulk_ingest_in_batches(self):
+        chunks = [f"chunk number {i}" for i in range(7)] + ["", "   "]
+        result = ingest_chunks(self.user.id, "upload", 4, chunks, batch_size=3)
+        self.assertEqual(result.rows, 7)
+        stored = list(VectorizedChunk.objects.filter(user=self.user).order_by("id").values_list("id", "text"))
+        self.assertEqual([text for _, text in stored], chunks[:7])
+        self.assertEqual([chunk_id for chunk_id, _ in stored], result.ids)
+        summary = result.summary()
+        self.assertEqual(summary["rows"], 7)
+        self.assertGreaterEqual(summary["rows_per_sec"], 0.0)
+
+    def test_sync_only_embeds_changed_chunks(self):
+        ingest_chunks(self.user.id, "website", 1, ["kept", "dropped"])
+        synced = sync_chunks(self.user.id, "website", 1, ["kept", "added"])
+        self.assertEqual((synced.kept, len(synced.created_ids), len(synced.deleted_ids)), (1, 1, 1))
+        self.assertEqual(synced.summary()["rows"], 1)
+        self.assertFalse(sync_chunks(self.user.id, "website", 1, ["kept", "added"]).changed)
+
+    def test_ingest_text_reports_throughput(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        resp = client.post(
+            "/api/vectorstore/ingest/",
+            {"source_type": "upload", "source_id": 1, "text": "One sentence. Another sentence."},
+            format="json",
+        )
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.data["ingest"]["rows"], len(resp.data["created_ids"]))
+        self.assertIn("rows_per_sec", resp.data["ingest"])
+
+
+class GenerateViewTests(TestCase):
+    def setUp(self):
+        self.user = _user("writer")
+        self.client_api = APIClient()
+        self.client_api.force_authenticate(self.user)
+
+    def _generate(self, **body):
+        resp = self.client_api.post("/api/vectorstore/generate/", {"prompt": "Write a spring teaser", **body}, format="json")
+        self.assertEqual(resp.status_code, 200, resp.content)
+        return resp.json()
+
+    @override_settings(OPENAI_API_KEY=None)
+    def test_reply_without_key_reports_prompt_tokens(self):
+        data = self._generate()
+        self.assertIn("[Request] Write a spring teaser", data["reply"])
+        self.assertEqual(data["prompt_tokens"]["layout"], "classic")
+        self.assertLessEqual(data["prompt_tokens"]["fixed"], data["prompt_tokens"]["total"])
+
+    @override_settings(OPENAI_API_KEY="sk-test")
+    def test_llm_exception_still_reports_prompt_tokens(self):
+        with mock.patch("vectorstore.views.generate_with_fallback", side_effect=RuntimeError("provider down")):
+            data = self._generate()
+        self.assertEqual(data["error"], "provider down")
+        self.assertIn("Write a spring teaser", data["reply"])
+        self.assertEqual(set(data["prompt_tokens"]), {"budget", "fixed", "total", "tokenizer", "layout", "sections"})
+
+    @override_settings(OPENAI_API_KEY=None)
+    async def test_stream_sends_context_then_reply(self):
+        token = str(RefreshToken.for_user(self.user).access_token)
+        resp = await self.async_client.post(
+            "/api/vectorstore/generate/stream/",
+            json.dumps({"prompt": "Write a spring teaser"}),
+            content_type="application/json",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        self.assertEqual(resp["Content-Type"], "text/event-stream")
+        body = b"".join([chunk async for chunk in resp.streaming_content]).decode()
+        events = [block.split("\n")[0].removeprefix("event: ") for block in body.strip().split("\n\n")]
+        self.assertEqual(events, ["context", "delta", "done"])
+        self.assertIn('"prompt_tokens"', body.split("\n\n")[0])
+
+
+class LLMCacheTests(SimpleTestCase):
+    PAYLOAD = {
+        "model": "gpt-4o",
+        "input": [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Spring teaser"}],
+        "temperature": 0.7,
+        "max_output_tokens": 512,
+    }
+
+    def test_key_isolates_every_request_field(self):
+        key = llm_cache_key("responses", self.PAYLOAD)
+        variants = [
+            ("chat", self.PAYLOAD),
+            ("responses", {**self.PAYLOAD, "model": "gpt-4o-mini"}),
+            ("responses", {**self.PAYLOAD, "temperature": 0.2}),
+            ("responses", {**self.PAYLOAD, "max_output_tokens": 256}),
+            ("responses", {**self.PAYLOAD, "reasoning": {"effort": "high"}}),
+            ("responses", {**self.PAYLOAD, "input": [*self.PAYLOAD["input"][:1], {"role": "user", "content": "Summer teaser"}]}),
+        ]
+        keys = {llm_cache_key(kind, payload) for kind, payload in variants}
+        self.assertEqual(len(keys), len(variants))
+        self.assertNotIn(key, keys)
+
+    def test_key_ignores_stream_flag_and_key_order(self):
+        key = llm_cache_key("responses", self.PAYLOAD)
+        self.assertEqual(llm_cache_key("responses", {**self.PAYLOAD, "stream": True}), key)
+        self.assertEqual(llm_cache_key("responses", dict(reversed(list(self.PAYLOAD.items())))), key)
+
+    @override_settings(LLM_CACHE_DEFAULT_MODE="prefer")
+    def test_cache_mode(self):
+        self.assertEqual((cache_mode("BYPASS"), cache_mode(None), cache_mode("nonsense")), ("bypass", "prefer", "prefer"))
+
+    @override_settings(LLM_CACHE_BACKEND="memory", LLM_CACHE_MAX_ENTRIES=16)
+    def test_prefer_reads_bypass_refreshes_and_failures_are_not_stored(self):
+        replies = iter([
+            {"ok": True, "text": "first"},
+            {"ok": True, "text": "second"},
+            {"ok": False, "text": "", "error": "rate limited"},
+            {"ok": True, "text": "retried"},
+        ])
+        call = mock.Mock(side_effect=lambda: dict(next(replies)))
+        payload = {**self.PAYLOAD, "input": "prefer/bypass " + str(id(self))}
+
+        first = cached_call("responses", payload, "prefer", call)
+        again = cached_call("responses", payload, "prefer", call)
+        self.assertEqual((first["text"], first["cached"]), ("first", False))
+        self.assertEqual((again["text"], again["cached"]), ("first", True))
+        self.assertEqual(call.call_count, 1)
+
+        refreshed = cached_call("responses", payload, "bypass", call)
+        self.assertEqual((refreshed["text"], refreshed["cached"]), ("second", False))
+        self.assertEqual(cached_call("responses", payload, "prefer", call)["text"], "second")
+
+        other = {**payload, "model": "gpt-4o-mini"}
+        failed = cached_call("responses", other, "prefer", call)
+        self.assertFalse(failed["ok"])
+        self.assertEqual(call.call_count, 3)
+        # The failure was not cached, so the model is called again
+        self.assertEqual(cached_call("responses", other, "prefer", call)["text"], "retried")
+
+    @override_settings(LLM_CACHE_BACKEND="")
+    def test_disabled_backend_always_calls(self):
+        call = mock.Mock(return_value={"ok": True, "text": "x"})
+        cached_call("responses", self.PAYLOAD, "prefer", call)
+        cached_call("responses", self.PAYLOAD, "prefer", call)
+        self.assertEqual(call.call_count, 2)
+
+    def test_memory_backend_evicts_and_expires(self):
+        cache = MemoryLLMCache(max_entries=2)
+        cache.set("a", {"ok": True}, ttl=60)
+        cache.set("b", {"ok": True}, ttl=60)
+        cache.get("a")
+        cache.set("c", {"ok": True}, ttl=60)
+        self.assertEqual([k for k in "abc" if cache.get(k)], ["a", "c"])
+        cache.set("d", {"ok": True}, ttl=-1)
+        self.assertIsNone(cache.get("d"))
+
+    def test_sqlite_backend_is_shared_through_the_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "llm.sqlite3"
+            SQLiteLLMCache(path).set("k", {"ok": True, "text": "hi"}, ttl=60)
+            SQLiteLLMCache(path).set("old", {"ok": True}, ttl=-1)
+            reader = SQLiteLLMCache(path)
+            self.assertEqual(reader.get("k"), {"ok": True, "text": "hi"})
+            self.assertIsNone(reader.get("old"))
+            self.assertIsNone(reader.get("missing"))
+
+
+def _reply(result: dict, after: float = 0.0, calls: list | None = None):
+    async def call() -> dict:
+        if calls is not None:
+            calls.append(result.get("model"))
+        await asyncio.sleep(after)
+        return result
+
+    return call
+
+
+class HedgedFallbackTests(SimpleTestCase):
+    OK_PRIMARY = {"ok": True, "text": "primary", "model": "gpt-4o"}
+    OK_FALLBACK = {"ok": True, "text": "fallback", "model": "gpt-4o-mini"}
+
+    @override_settings(LLM_HEDGE_DELAY=None)
+    def test_hedging_is_off_by_default(self):
+        self.assertIsNone(hedge_delay("gpt-4o"))
+
+    @override_settings(LLM_HEDGE_DELAY=2)
+    def test_reasoning_models_are_never_hedged(self):
+        self.assertEqual(hedge_delay("gpt-4o"), 2.0)
+        self.assertIsNone(hedge_delay("o4-mini"))
+        with override_settings(LLM_HEDGE_DELAY=-1):
+            self.assertIsNone(hedge_delay("gpt-4o"))
+
+    def test_slow_healthy_primary_is_not_hedged_without_delay(self):
+        calls = []
+        result = asyncio.run(hedged(_reply(self.OK_PRIMARY, 0.05, calls), _reply(self.OK_FALLBACK, 0, calls), None))
+        self.assertEqual((result["text"], calls), ("primary", ["gpt-4o"]))
+
+    def test_failed_primary_falls_back(self):
+        calls = []
+        failed = {"ok": False, "error": "503", "model": "gpt-4o"}
+        result = asyncio.run(hedged(_reply(failed, 0, calls), _reply(self.OK_FALLBACK, 0, calls), None))
+        self.assertEqual((result["text"], calls), ("fallback", ["gpt-4o", "gpt-4o-mini"]))
+
+    def test_delay_hedges_a_slow_primary(self):
+        result = asyncio.run(hedged(_reply(self.OK_PRIMARY, 1.0), _reply(self.OK_FALLBACK), 0.01))
+        self.assertEqual(result["text"], "fallback")
+        # A primary that answers within the delay wins alone
+        calls = []
+        result = asyncio.run(hedged(_reply(self.OK_PRIMARY, 0, calls), _reply(self.OK_FALLBACK, 0, calls), 0.5))
+        self.assertEqual((result["text"], calls), ("primary", ["gpt-4o"]))
+
+    def test_both_failing_reports_the_primary_error(self):
+        result = asyncio.run(hedged(_reply({"ok": False, "error": "primary down"}), _reply({"ok": False, "error": "fallback down"}), None))
+        self.assertEqual(result["error"], "primary down")
+
+    @override_settings(LLM_HEDGE_DELAY=None)
+    def test_result_names_the_model_that_answered(self):
+        responses = mock.AsyncMock(return_value={"ok": False, "text": "", "raw": {"status_code": 500}, "error": "boom"})
+        chat = mock.AsyncMock(return_value={"ok": True, "text": "from chat", "raw": {}, "error": None})
+        with mock.patch.object(utils, "acall_openai_responses", responses), mock.patch.object(utils, "acall_openai_chat_completions", chat):
+            result = generate_with_fallback(model="o4-mini", fallback_model="gpt-4o", system_text="s", user_text="u")
+        self.assertEqual((result["text"], result["model"], result["endpoint"]), ("from chat", "gpt-4o", "chat"))
+
+        responses.return_value = {"ok": True, "text": "from responses", "raw": {}, "error": None}
+        chat.reset_mock()
+        with mock.patch.object(utils, "acall_openai_responses", responses), mock.patch.object(utils, "acall_openai_chat_completions", chat):
+            result = generate_with_fallback(model="o4-mini", fallback_model="gpt-4o", system_text="s", user_text="u")
+        self.assertEqual((result["model"], result["endpoint"]), ("o4-mini", "responses"))
+        chat.assert_not_called()
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_consecutive_failures_and_probes_after_cooldown(self):
+        clock = [100.0]
+        breaker = CircuitBreaker(failures=3, cooldown=30)
+        with mock.patch.object(utils.time, "monotonic", side_effect=lambda: clock[0]):
+            breaker.record(False)
+            breaker.record(False)
+            breaker.record(True)  # a success resets the count
+            breaker.record(False)
+            breaker.record(False)
+            self.assertTrue(breaker.allow())
+            breaker.record(False)
+            self.assertTrue(breaker.is_open)
+            self.assertFalse(breaker.allow())
+
+            clock[0] += 30
+            self.assertTrue(breaker.allow())  # half-open: one probe
+            self.assertFalse(breaker.allow())
+            breaker.record(False)
+            clock[0] += 29
+            self.assertFalse(breaker.allow())
+
+            clock[0] += 1
+            self.assertTrue(breaker.allow())
+            breaker.record(True)
+            self.assertFalse(breaker.is_open)
+            self.assertTrue(breaker.allow())
+
+
+class TokenBudgetTests(SimpleTestCase):
+    TEXT = "Forårskampagnen giver tyve procent rabat på alle sko, og levering er gratis hele ugen. " * 20
+
+    def test_truncate_to_tokens(self):
+        self.assertEqual(truncate_to_tokens("short text", 50), "short text")
+        self.assertEqual(truncate_to_tokens(self.TEXT, 0), "")
+        for limit in (5, 40, 120):
+            cut = truncate_to_tokens(self.TEXT, limit)
+            self.assertLessEqual(count_tokens(cut), limit)
+            self.assertTrue(cut.endswith("…"))
+            self.assertTrue(self.TEXT.startswith(cut[:-1]))
+
+    def test_allocate_fills_by_priority(self):
+        long = self.TEXT
+        kept, report = allocate(
+            [("rules", ["Never promise delivery dates."]), ("similar", [long, long]), ("examples", ["Example post"])],
+            budget=count_tokens("Never promise delivery dates.") + 5 + 100,
+        )
+        self.assertEqual(kept["rules"], ["Never promise delivery dates."])
+        self.assertEqual(len(kept["similar"]), 1)
+        self.assertTrue(kept["similar"][0].endswith("…"))
+        self.assertEqual(kept["examples"], [])
+        self.assertEqual(report["similar"], {"tokens": report["similar"]["tokens"], "items": 1, "dropped": 1, "truncated": 1})
+        self.assertEqual(report["examples"]["dropped"], 1)
+        self.assertLessEqual(sum(r["tokens"] for r in report.values()), count_tokens("Never promise delivery dates.") + 105)
+
+    def test_allocate_unbounded_keeps_everything(self):
+        kept, report = allocate([("a", ["x", "y"]), ("b", [self.TEXT])], None)
+        self.assertEqual(kept, {"a": ["x", "y"], "b": [self.TEXT]})
+        self.assertEqual(sum(r["dropped"] + r["truncated"] for r in report.values()), 0)
+
+    @override_settings(PROMPT_TOKEN_BUDGET=12000, PROMPT_TOKEN_BUDGETS={"gpt-4o": 9000, "gpt-4o-mini": 4000})
+    def test_prompt_token_budget(self):
+        self.assertEqual(prompt_token_budget("gpt-4o-mini-2024-07-18"), 4000)
+        self.assertEqual(prompt_token_budget("gpt-4o"), 9000)
+        self.assertEqual(prompt_token_budget("o4-mini"), 12000)
+        with override_settings(PROMPT_TOKEN_BUDGET=0, PROMPT_TOKEN_BUDGETS={}):
+            self.assertIsNone(prompt_token_budget("gpt-4o"))
+
+    def _prompt(self, budget: int, **kwargs):
+        return build_generation_prompt(
+            user_request="Skriv et LinkedIn-opslag om forårsudsalget",
+            content_type="linkedin",
+            tone_guidelines=["Venlig og direkte."],
+            terminology_guidelines=["Sig medlemmer, ikke kunder."],
+            style_guidelines=["Korte sætninger."],
+            content_rules=["Lov aldrig leveringsdatoer."],
+            similar_campaigns=[self.TEXT] * 5,
+            website_context=[self.TEXT] * 5,
+            web_results=[{"title": "Nyhed", "url": "https://example.com", "snippet": self.TEXT}],
+            token_budget=budget,
+            **kwargs,
+        )
+
+    def test_prompt_stays_within_budget(self):
+        _, unbounded = self._prompt(10**6)
+        self.assertEqual(sum(s["dropped"] + s["truncated"] for s in unbounded["sections"].values()), 0)
+        budget = unbounded["fixed"] + 400
+        messages, report = self._prompt(budget, layout="classic")
+        self.assertLessEqual(report["total"], budget)
+        self.assertLess(report["total"], unbounded["total"])
+        user = messages[1]["content"]
+        # Guidelines come first and are never cut while lower sections are
+        for guideline in ("Venlig og direkte.", "Sig medlemmer, ikke kunder.", "Korte sætninger.", "Lov aldrig leveringsdatoer."):
+            self.assertIn(guideline, user)
+        self.assertEqual(report["sections"]["rules"]["dropped"], 0)
+        self.assertGreater(sum(s["dropped"] for s in report["sections"].values()), 0)
+        self.assertIn("Skriv et LinkedIn-opslag om forårsudsalget", user)
+
+    def test_dropped_sections_are_marked(self):
+        messages, report = self._prompt(self._prompt(10**6)[1]["fixed"] + 40, layout="classic")
+        self.assertEqual(report["sections"]["similar_campaigns"]["items"], 0)
+        self.assertIn(_OMITTED, messages[1]["content"])
+
+
+class PrefixLayoutTests(SimpleTestCase):
+    GUIDELINE = "Vi skriver varmt, konkret og uden buzzwords, og vi nævner altid medlemsfordele først. " * 30
+
+    def _prompt(self, request: str, budget: int, **kwargs):
+        return build_generation_prompt(
+            user_request=request,
+            content_type="newsletter",
+            tone_guidelines=[self.GUIDELINE],
+            terminology_guidelines=[self.GUIDELINE],
+            style_guidelines=[self.GUIDELINE],
+            content_rules=[self.GUIDELINE],
+            similar_campaigns=[self.GUIDELINE] * 3,
+            token_budget=budget,
+            layout="prefix",
+            **kwargs,
+        )
+
+    def test_prefix_does_not_depend_on_the_request(self):
+        _, full = self._prompt("Kort", 10**6)
+        # Tight enough that the guidelines themselves are cut
+        budget = full["prefix_tokens"] - 300
+        short_msgs, short = self._prompt("Kort", budget)
+        long_msgs, long = self._prompt(
+            "Skriv et langt nyhedsbrev om forårsudsalget. " * 40,
+            budget,
+            web_results=[{"title": "Nyhed", "url": "https://example.com", "snippet": self.GUIDELINE}],
+            web_search_directives={"company": "Eksempel A/S", "links": ["https://example.com"]},
+        )
+        self.assertGreater(sum(short["sections"][name]["truncated"] + short["sections"][name]["dropped"] for name in ("rules", "terminology", "tone", "style")), 0)
+        self.assertEqual(short["prefix_tokens"], long["prefix_tokens"])
+        self.assertEqual((short_msgs[0], short["sections"]["tone"]), (long_msgs[0], long["sections"]["tone"]))
+        short_user, long_user = short_msgs[1]["content"], long_msgs[1]["content"]
+        prefix_end = short_user.index("\n\n", short_user.index("#### Indholdsregler"))
+        self.assertEqual(long_user[:prefix_end], short_user[:prefix_end])
+        self.assertLessEqual(short["total"], budget)
+
+    def test_total_stays_within_budget(self):
+        long_request = "Skriv et langt nyhedsbrev om forårsudsalget. " * 40
+        directives = {"company": "Eksempel A/S", "links": ["https://example.com"]}
+        for budget in (3000, 1500):
+            for request, kwargs in (("Kort", {}), (long_request, {"web_search_directives": directives})):
+                with self.subTest(budget=budget, request=request[:10]):
+                    _, report = self._prompt(request, budget, **kwargs)
+                    self.assertLessEqual(report["total"], budget)
+                    self.assertIn("channel_examples", report["sections"])
+
+    def test_channel_examples_are_budgeted(self):
+        _, full = self._prompt("Kort", 10**6)
+        self.assertEqual(full["sections"]["channel_examples"]["dropped"], 0)
+        self.assertGreater(full["sections"]["channel_examples"]["items"], 0)
+        _, tight = self._prompt("Kort", 3000)
+        examples = tight["sections"]["channel_examples"]
+        self.assertGreater(examples["dropped"] + examples["truncated"], 0)
+
+    def test_context_gets_what_the_request_leaves(self):
+        _, full = self._prompt("Kort", 10**6)
+        budget = full["total"] - 200
+        _, short = self._prompt("Kort", budget)
+        _, long = self._prompt("Skriv et langt nyhedsbrev om forårsudsalget. " * 20, budget)
+        self.assertEqual(short["sections"]["rules"], long["sections"]["rules"])
+        self.assertGreater(short["sections"]["similar_campaigns"]["tokens"], long["sections"]["similar_campaigns"]["tokens"])
+        self.assertLessEqual(short["total"], budget)
+        self.assertLessEqual(long["total"], budget)
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import math
+import re
+from functools import lru_cache
+
+from django.conf import settings
+
+try:  # optional: exact BPE counts; without it a calibrated estimate is used
+    import tiktoken
+except ImportError:  # pragma: no cover
+    tiktoken = None
+
+
+# Token counting and budgeting for prompt assembly (prompt_template). Counts come
+# from tiktoken when it is installed and its encoding loads, otherwise from a local
+# estimate: about one token per 4 characters of a word (at least one per word) and one
+# per punctuation mark, which tracks cl100k/o200k counts of Danish and English
+# marketing copy within ~10-15%.
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception:
+            return None
+    except Exception:  # encodings are fetched on first use; offline hosts estimate
+        return None
+
+
+def tokenizer_name(model: str = "gpt-4o") -> str:
+    return "tiktoken" if _encoding(model) is not None else "estimate"
+
+
+def estimate_tokens(text: str) -> int:
+    return sum(max(1, math.ceil(len(p) / 4)) if p[0].isalnum() or p[0] == "_" else 1 for p in _PIECES.findall(text))
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    if not text:
+        return 0
+    enc = _encoding(model)
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "gpt-4o") -> str:
+    """`text` cut to at most `max_tokens` tokens (at a word boundary when estimating), with an ellipsis."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    enc = _encoding(model)
+    if enc is not None:
+        return enc.decode(enc.encode(text, disallowed_special=())[: max(max_tokens - 1, 0)]).rstrip() + "…"
+    # Longest prefix within budget, by bisection over the character length
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens - 1:
+            lo = mid
+        else:
+            hi = mid - 1
+    cut = text[:lo]
+    space = cut.rfind(" ")
+    if space > lo // 2:
+        cut = cut[:space]
+    return cut.rstrip() + "…"
+
+
+def prompt_token_budget(model: str | None) -> int | None:
+    """Input token budget for `model`: the longest matching PROMPT_TOKEN_BUDGETS prefix, else PROMPT_TOKEN_BUDGET (0 = unbounded)."""
+    name = (model or "").strip().lower()
+    budgets = getattr(settings, "PROMPT_TOKEN_BUDGETS", {}) or {}
+    matches = [prefix for prefix in budgets if name.startswith(prefix.lower())]
+    budget = budgets[max(matches, key=len)] if matches else getattr(settings, "PROMPT_TOKEN_BUDGET", 12000)
+    return int(budget) if budget and int(budget) > 0 else None
+
+
+def allocate(
+    sections: list[tuple[str, list[str]]],
+    budget: int | None,
+    *,
+    overhead: int = 5,
+    min_partial: int = 48,
+    model: str = "gpt-4o",
+) -> tuple[dict[str, list[str]], dict[str, dict]]:
+    """
+    Fit the items of `sections` (highest priority first) into `budget` tokens. Items are
+    taken in order while they fit (each costs its tokens plus `overhead` for its label
+    and separators); an item that does not fit is truncated when at least
+    `min_partial` tokens remain, otherwise dropped. Returns the kept items per section
+    and a report {section: {tokens, items, dropped, truncated}}.
+    """
+    remaining = budget
+    kept: dict[str, list[str]] = {}
+    report: dict[str, dict] = {}
+    for name, items in sections:
+        out: list[str] = []
+        stats = {"tokens": 0, "items": 0, "dropped": 0, "truncated": 0}
+        for item in items:
+            cost = count_tokens(item, model) + overhead
+            if remaining is None or cost <= remaining:
+                out.append(item)
+            elif remaining - overhead >= min_partial:
+                item = truncate_to_tokens(item, remaining - overhead, model)
+                cost = count_tokens(item, model) + overhead
+                out.append(item)
+                stats["truncated"] += 1
+            else:
+                stats["dropped"] += 1
+                continue
+            stats["tokens"] += cost
+            if remaining is not None:
+                remaining -= cost
+        stats["items"] = len(out)
+        kept[name] = out
+        report[name] = stats
+    return kept, report
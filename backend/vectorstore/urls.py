@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import ingest_text, search, chat, generate
+from .views import ingest_text, search, chat, generate, generate_stream, cache_stats
 
 
 urlpatterns = [
@@ -7,6 +7,8 @@ urlpatterns = [
     path("search/", search, name="vectorstore_search"),
     path("chat/", chat, name="vectorstore_chat"),
     path("generate/", generate, name="vectorstore_generate"),
+    path("generate/stream/", generate_stream, name="vectorstore_generate_stream"),
+    path("cache/stats/", cache_stats, name="vectorstore_cache_stats"),
 ]
 
 
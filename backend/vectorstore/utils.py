@@ -1,13 +1,22 @@
 from __future__ import annotations
 
+import asyncio
+import functools
+import hashlib
 import re
+import threading
+import time
+from functools import lru_cache
 from typing import Iterable, List, Optional
 import os
-import requests
 from django.conf import settings
 
+import httpx
 import numpy as np
 
+from .http_client import get_session
+from .llm_cache import cache_lookup, cache_mode, cache_store, cached_call
+
 
 def simple_tokenize(text: str) -> list[str]:
     return re.findall(r"\b\w+\b", text.lower())
@@ -31,18 +40,70 @@ def sentence_split(text: str, max_chars: int = 512) -> list[str]:
     return [p for p in parts if p]
 
 
-def text_to_vector(text: str, vocab: dict[str, int] | None = None) -> list[float]:
-    # Very simple bag-of-words hashed embedding (fixed-dim) to avoid external deps
-    dim = 256
-    vec = np.zeros(dim, dtype=np.float32)
-    for tok in simple_tokenize(text):
-        h = hash(tok) % dim
-        vec[h] += 1.0
+# Hashed bag-of-words embedding (fixed-dim) to avoid external deps.
+# Bump EMBEDDING_VERSION whenever the output of embed_texts changes so stored
+# chunks can be detected (VectorizedChunk.embedding_version) and re-embedded.
+# Version 0 is the legacy per-process salted builtin hash().
+EMBEDDING_DIM = 256
+EMBEDDING_VERSION = 1
+_EMBEDDING_HASH_KEY = b"marketingapp/text_to_vector/v1"
+
+
+def current_embedding_version() -> int:
+    return EMBEDDING_VERSION
+
+
+@lru_cache(maxsize=200_000)
+def _token_slot(token: str) -> tuple[int, float]:
+    # Keyed 64-bit blake2b is stable across processes and restarts (unlike hash()).
+    # Low bits pick the bucket, the top bit the sign (signed hashing trick).
+    h = int.from_bytes(
+        hashlib.blake2b(token.encode("utf-8"), digest_size=8, key=_EMBEDDING_HASH_KEY).digest(),
+        "little",
+    )
+    return h % EMBEDDING_DIM, (-1.0 if h >> 63 else 1.0)
+
+
+def embed_texts(texts: Iterable[str], bigrams: bool = False) -> np.ndarray:
+    """
+    Vectorize a batch of texts into one (n, EMBEDDING_DIM) float32 matrix of
+    L2-normalized rows. With bigrams=True adjacent token pairs are hashed too
+    (query and stored vectors must use the same setting).
+    """
+    texts = list(texts)
+    rows: list[int] = []
+    cols: list[int] = []
+    vals: list[float] = []
+    for i, text in enumerate(texts):
+        tokens = simple_tokenize(text or "")
+        if bigrams:
+            tokens = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        for tok in tokens:
+            col, sign = _token_slot(tok)
+            rows.append(i)
+            cols.append(col)
+            vals.append(sign)
+    matrix = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+    if rows:
+        np.add.at(matrix, (np.asarray(rows), np.asarray(cols)), np.asarray(vals, dtype=np.float32))
     # l2 normalize
-    norm = np.linalg.norm(vec)
-    if norm > 0:
-        vec /= norm
-    return vec.astype(float).tolist()
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def text_to_vector(text: str, vocab: dict[str, int] | None = None) -> list[float]:
+    return embed_texts([text])[0].astype(float).tolist()
+
+
+def pack_vector(vec) -> bytes:
+    """Serialize a vector as raw little-endian float32 bytes for VectorizedChunk.vector_bin."""
+    return np.asarray(vec, dtype="<f4").tobytes()
+
+
+def unpack_vector(buf) -> np.ndarray:
+    """Zero-copy view of raw little-endian float32 bytes (bytes or memoryview)."""
+    return np.frombuffer(buf, dtype="<f4")
 
 
 def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
@@ -52,14 +113,57 @@ def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
     return float(np.dot(a, b) / denom)
 
 
+def top_k_similar(queries: np.ndarray, matrix: np.ndarray, ids: np.ndarray, top_k: int = 5) -> list:
+    """
+    Score every row of an (N, dim) matrix of L2-normalized vectors against one query
+    (dim,) or a batch of queries (Q, dim) with a single matrix product, and select the
+    best rows with argpartition instead of a full sort.
+    Returns [(id, score), ...] in descending score order; a list of such lists for a batch.
+    """
+    q = np.asarray(queries, dtype=np.float32)
+    single = q.ndim == 1
+    q = np.atleast_2d(q)
+    n = int(matrix.shape[0]) if matrix is not None else 0
+    k = min(int(top_k), n)
+    if k <= 0:
+        return [] if single else [[] for _ in range(q.shape[0])]
+
+    scores = q @ matrix.T  # (Q, N); dot == cosine on normalized vectors
+    if k < n:
+        part = np.argpartition(scores, n - k, axis=1)[:, n - k:]
+    else:
+        part = np.broadcast_to(np.arange(n), (q.shape[0], n))
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    top_idx = np.take_along_axis(part, order, axis=1)
+    top_scores = np.take_along_axis(part_scores, order, axis=1)
+
+    id_arr = np.asarray(ids)
+    results = [
+        list(zip(id_arr[row_idx].tolist(), row_scores.astype(float).tolist()))
+        for row_idx, row_scores in zip(top_idx, top_scores)
+    ]
+    return results[0] if single else results
+
+
+def top_k_from_scores(scores: np.ndarray, ids: np.ndarray, top_k: int = 5) -> list[tuple[int, float]]:
+    """Best `top_k` (id, score) pairs of an already computed 1-D score vector, descending."""
+    n = int(scores.shape[0])
+    k = min(int(top_k), n)
+    if k <= 0:
+        return []
+    part = np.argpartition(scores, n - k)[n - k:] if k < n else np.arange(n)
+    part = part[np.argsort(-scores[part], kind="stable")]
+    return list(zip(np.asarray(ids)[part].tolist(), scores[part].astype(float).tolist()))
+
+
 def rank_by_similarity(query: str, vectors: list[tuple[int, list[float]]], texts: list[str], top_k: int = 5) -> list[int]:
+    if not vectors:
+        return []
+    ids = np.fromiter((idx for idx, _ in vectors), dtype=np.int64, count=len(vectors))
+    matrix = np.asarray([vec for _, vec in vectors], dtype=np.float32)
     q = np.array(text_to_vector(query), dtype=np.float32)
-    sims: list[tuple[int, float]] = []
-    for idx, vec in vectors:
-        v = np.array(vec, dtype=np.float32)
-        sims.append((idx, cosine_similarity(q, v)))
-    sims.sort(key=lambda x: x[1], reverse=True)
-    return [idx for idx, _ in sims[:top_k]]
+    return [idx for idx, _ in top_k_similar(q, matrix, ids, top_k=top_k)]
 
 
 
@@ -72,7 +176,7 @@ def fetch_web_results(query: str, max_results: int = 3, timeout: int = 12) -> li
     if not api_key or not query:
         return []
     try:
-        resp = requests.post(
+        resp = get_session().post(
             "https://google.serper.dev/search",
             headers={"X-API-KEY": api_key, "Content-Type": "application/json"},
             json={"q": query, "num": max_results},
@@ -103,6 +207,27 @@ def _get_openai_api_key() -> str | None:
         return None
 
 
+def openai_base_url() -> str:
+    # Overridable so the app can be pointed at a proxy or a local fake server
+    return str(getattr(settings, "OPENAI_BASE_URL", "https://api.openai.com/v1")).rstrip("/")
+
+
+def responses_payload(*, model: str, system_text: str, user_text: str, max_output_tokens: int = 512, temperature: float = 0.7, reasoning_effort: str | None = None) -> dict:
+    """Request body for the Responses API, shared by the blocking and streaming calls."""
+    payload: dict = {
+        "model": model,
+        "input": [
+            {"role": "system", "content": system_text},
+            {"role": "user", "content": user_text},
+        ],
+        "max_output_tokens": int(max_output_tokens),
+        "temperature": float(temperature),
+    }
+    if model.lower().startswith("o"):
+        payload["reasoning"] = {"effort": (reasoning_effort or "medium")}
+    return payload
+
+
 def normalize_model_name(requested: str | None) -> str:
     """
     Normalize model names to current recommended defaults.
@@ -165,32 +290,31 @@ def _extract_text_from_responses_payload(data: dict) -> str:
     return ""
 
 
-def call_openai_responses(*, model: str, system_text: str, user_text: str, max_output_tokens: int = 512, temperature: float = 0.7, reasoning_effort: str | None = None, timeout: int = 30) -> dict:
+def call_openai_responses(*, model: str, system_text: str, user_text: str, max_output_tokens: int = 512, temperature: float = 0.7, reasoning_effort: str | None = None, timeout: int = 30, cache: str | None = None) -> dict:
     """
     Call OpenAI Responses API for both reasoning and non-reasoning models with a unified payload.
-    Returns a dict with keys: { ok: bool, text: str, raw: dict, error: str|None }
+    Returns a dict with keys: { ok: bool, text: str, raw: dict, error: str|None, cached: bool }
+    `cache` is the llm_cache mode ("prefer" | "bypass", default LLM_CACHE_DEFAULT_MODE).
     """
     api_key = _get_openai_api_key()
     if not api_key:
         return {"ok": False, "text": "", "raw": {}, "error": "Missing OPENAI_API_KEY"}
 
-    is_reasoning = model.lower().startswith("o")
-    url = "https://api.openai.com/v1/responses"
+    url = f"{openai_base_url()}/responses"
+    payload = responses_payload(
+        model=model,
+        system_text=system_text,
+        user_text=user_text,
+        max_output_tokens=max_output_tokens,
+        temperature=temperature,
+        reasoning_effort=reasoning_effort,
+    )
+    return cached_call("responses", payload, cache, lambda: _post_responses(api_key, url, payload, timeout))
 
-    payload: dict = {
-        "model": model,
-        "input": [
-            {"role": "system", "content": system_text},
-            {"role": "user", "content": user_text},
-        ],
-        "max_output_tokens": int(max_output_tokens),
-        "temperature": float(temperature),
-    }
-    if is_reasoning:
-        payload["reasoning"] = {"effort": (reasoning_effort or "medium")}
 
+def _post_responses(api_key: str, url: str, payload: dict, timeout: int) -> dict:
     try:
-        resp = requests.post(
+        resp = get_session().post(
             url,
             headers={
                 "Authorization": f"Bearer {api_key}",
@@ -201,8 +325,12 @@ def call_openai_responses(*, model: str, system_text: str, user_text: str, max_o
         )
     except Exception as e:
         return {"ok": False, "text": "", "raw": {}, "error": str(e)}
+    return _responses_result(resp)
+
 
-    if not resp.ok:
+def _responses_result(resp) -> dict:
+    """Result dict of a Responses API reply (a requests or httpx response)."""
+    if resp.status_code >= 400:
         return {"ok": False, "text": "", "raw": {"status_code": resp.status_code, "body": resp.text}, "error": resp.text}
 
     data = {}
@@ -217,29 +345,38 @@ def call_openai_responses(*, model: str, system_text: str, user_text: str, max_o
     return {"ok": True, "text": out_text, "raw": data, "error": None}
 
 
-def call_openai_chat_completions(*, model: str, messages: list[dict], max_tokens: int = 512, temperature: float = 0.7, timeout: int = 30) -> dict:
+def call_openai_chat_completions(*, model: str, messages: list[dict], max_tokens: int = 512, temperature: float = 0.7, timeout: int = 30, cache: str | None = None) -> dict:
     """Fallback to legacy Chat Completions for non-reasoning models."""
     api_key = _get_openai_api_key()
     if not api_key:
         return {"ok": False, "text": "", "raw": {}, "error": "Missing OPENAI_API_KEY"}
+    payload = chat_completions_payload(model=model, messages=messages, max_tokens=max_tokens, temperature=temperature)
+    return cached_call("chat", payload, cache, lambda: _post_chat_completions(api_key, payload, timeout))
+
+
+def chat_completions_payload(*, model: str, messages: list[dict], max_tokens: int = 512, temperature: float = 0.7) -> dict:
+    return {"model": model, "messages": messages, "max_tokens": max_tokens, "temperature": temperature}
+
+
+def _post_chat_completions(api_key: str, payload: dict, timeout: int) -> dict:
     try:
-        resp = requests.post(
-            "https://api.openai.com/v1/chat/completions",
+        resp = get_session().post(
+            f"{openai_base_url()}/chat/completions",
             headers={
                 "Authorization": f"Bearer {api_key}",
                 "Content-Type": "application/json",
             },
-            json={
-                "model": model,
-                "messages": messages,
-                "max_tokens": max_tokens,
-                "temperature": temperature,
-            },
+            json=payload,
             timeout=timeout,
         )
     except Exception as e:
         return {"ok": False, "text": "", "raw": {}, "error": str(e)}
-    if not resp.ok:
+    return _chat_result(resp)
+
+
+def _chat_result(resp) -> dict:
+    """Result dict of a Chat Completions reply (a requests or httpx response)."""
+    if resp.status_code >= 400:
         return {"ok": False, "text": "", "raw": {"status_code": resp.status_code, "body": resp.text}, "error": resp.text}
     try:
         data = resp.json()
@@ -258,3 +395,268 @@ def call_openai_chat_completions(*, model: str, messages: list[dict], max_tokens
         return {"ok": False, "text": "", "raw": data, "error": "No text in Chat Completions response"}
     return {"ok": True, "text": text, "raw": data, "error": None}
 
+
+def prompt_cache_usage(raw) -> dict | None:
+    """
+    Provider prompt-cache usage of a reply body (Responses `usage.input_tokens_details`
+    or Chat Completions `usage.prompt_tokens_details`): {input_tokens, cached_tokens, hit},
+    or None when the reply carries no usage.
+    """
+    usage = raw.get("usage") if isinstance(raw, dict) else None
+    if not isinstance(usage, dict):
+        return None
+    if "input_tokens" in usage:
+        total, details = usage.get("input_tokens"), usage.get("input_tokens_details")
+    else:
+        total, details = usage.get("prompt_tokens"), usage.get("prompt_tokens_details")
+    cached = (details or {}).get("cached_tokens") if isinstance(details, dict) else None
+    try:
+        total, cached = int(total or 0), int(cached or 0)
+    except (TypeError, ValueError):
+        return None
+    return {"input_tokens": total, "cached_tokens": cached, "hit": cached > 0}
+
+
+
+# --------------- Async OpenAI client (hedged fallback) ---------------
+#
+# One event loop thread per process owns a pooled httpx.AsyncClient, the per-model
+# concurrency limits and the circuit breakers, so sync views and async code share them.
+# generate_with_fallback() starts the Responses call and, once it failed, the Chat
+# Completions fallback. Hedging is opt-in: with LLM_HEDGE_DELAY set, the fallback is
+# also started when the Responses call has not succeeded after that many seconds, the
+# first successful reply wins and the other request is cancelled (worst case latency
+# max(delay, first failure) + one timeout instead of two, at the price of paying for
+# both calls and possibly a reply from the fallback model). Reasoning models are never
+# hedged. The result names the model and endpoint that answered.
+# A model whose calls keep failing upstream (timeouts, 429, 5xx) is skipped for
+# LLM_BREAKER_COOLDOWN seconds after LLM_BREAKER_FAILURES consecutive failures.
+
+
+class CircuitBreaker:
+    def __init__(self, failures: int, cooldown: float):
+        self.failures = max(int(failures), 1)
+        self.cooldown = float(cooldown)
+        self._count = 0
+        self._opened_at: float | None = None
+
+    def allow(self) -> bool:
+        if self._opened_at is None:
+            return True
+        if time.monotonic() - self._opened_at >= self.cooldown:
+            # Half-open: let one probe through; a failure re-opens for another cooldown
+            self._opened_at = time.monotonic()
+            return True
+        return False
+
+    def record(self, ok: bool) -> None:
+        if ok:
+            self._count, self._opened_at = 0, None
+            return
+        self._count += 1
+        if self._count >= self.failures:
+            self._opened_at = time.monotonic()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+
+class _AsyncLLMRuntime:
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.client: httpx.AsyncClient | None = None
+        self.semaphores: dict[str, asyncio.Semaphore] = {}
+        self.breakers: dict[str, CircuitBreaker] = {}
+        threading.Thread(target=self.loop.run_forever, name="llm-client", daemon=True).start()
+
+    def get_client(self) -> httpx.AsyncClient:
+        if self.client is None:
+            max_connections = int(getattr(settings, "LLM_POOL_MAX_CONNECTIONS", 32))
+            self.client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            )
+        return self.client
+
+    def semaphore(self, model: str) -> asyncio.Semaphore:
+        if model not in self.semaphores:
+            self.semaphores[model] = asyncio.Semaphore(max(int(getattr(settings, "LLM_MODEL_CONCURRENCY", 8)), 1))
+        return self.semaphores[model]
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        if model not in self.breakers:
+            self.breakers[model] = CircuitBreaker(
+                getattr(settings, "LLM_BREAKER_FAILURES", 5), getattr(settings, "LLM_BREAKER_COOLDOWN", 30.0)
+            )
+        return self.breakers[model]
+
+    def run(self, coro):
+        """Run `coro` on the runtime loop from any thread and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+
+_runtime_lock = threading.Lock()
+_runtime: _AsyncLLMRuntime | None = None
+_runtime_pid: int | None = None
+
+
+def llm_runtime() -> _AsyncLLMRuntime:
+    global _runtime, _runtime_pid
+    pid = os.getpid()
+    if _runtime is None or _runtime_pid != pid:
+        with _runtime_lock:
+            if _runtime is None or _runtime_pid != pid:
+                _runtime, _runtime_pid = _AsyncLLMRuntime(), pid
+    return _runtime
+
+
+def _on_runtime(fn):
+    """Make a coroutine function awaitable from any event loop by running it on the runtime loop."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        runtime = llm_runtime()
+        try:
+            current = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+        if current is runtime.loop:
+            return await fn(*args, **kwargs)
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(fn(*args, **kwargs), runtime.loop))
+
+    return wrapper
+
+
+def _upstream_failure(result: dict) -> bool:
+    status = (result.get("raw") or {}).get("status_code")
+    return status is None or status == 429 or status >= 500
+
+
+async def _apost(url: str, model: str, payload: dict, timeout: float, to_result) -> dict:
+    """POST on the runtime loop, within the model's concurrency limit and circuit breaker."""
+    api_key = _get_openai_api_key()
+    if not api_key:
+        return {"ok": False, "text": "", "raw": {}, "error": "Missing OPENAI_API_KEY"}
+    runtime = llm_runtime()
+    breaker = runtime.breaker(model)
+    if not breaker.allow():
+        return {"ok": False, "text": "", "raw": {}, "error": f"Circuit open for {model} after repeated upstream errors"}
+    async with runtime.semaphore(model):
+        try:
+            resp = await runtime.get_client().post(
+                url,
+                headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+                json=payload,
+                timeout=timeout,
+            )
+        except httpx.HTTPError as e:
+            breaker.record(False)
+            return {"ok": False, "text": "", "raw": {}, "error": str(e) or type(e).__name__}
+    result = to_result(resp)
+    # Client errors (bad request, unknown model) say nothing about upstream health
+    breaker.record(result.get("ok") or not _upstream_failure(result))
+    return result
+
+
+async def _acached(kind: str, payload: dict, cache: str | None, call) -> dict:
+    key, hit = await asyncio.to_thread(cache_lookup, kind, payload, cache_mode(cache))
+    if hit is not None:
+        return hit
+    result = await call()
+    result["cached"] = False
+    await asyncio.to_thread(cache_store, key, result)
+    return result
+
+
+@_on_runtime
+async def acall_openai_responses(*, model: str, system_text: str, user_text: str, max_output_tokens: int = 512, temperature: float = 0.7, reasoning_effort: str | None = None, timeout: float = 30, cache: str | None = None) -> dict:
+    """Async call_openai_responses (same result dict), executed on the llm_runtime() loop."""
+    payload = responses_payload(
+        model=model,
+        system_text=system_text,
+        user_text=user_text,
+        max_output_tokens=max_output_tokens,
+        temperature=temperature,
+        reasoning_effort=reasoning_effort,
+    )
+    url = f"{openai_base_url()}/responses"
+    return await _acached("responses", payload, cache, lambda: _apost(url, model, payload, timeout, _responses_result))
+
+
+@_on_runtime
+async def acall_openai_chat_completions(*, model: str, messages: list[dict], max_tokens: int = 512, temperature: float = 0.7, timeout: float = 30, cache: str | None = None) -> dict:
+    """Async call_openai_chat_completions (same result dict), executed on the llm_runtime() loop."""
+    payload = chat_completions_payload(model=model, messages=messages, max_tokens=max_tokens, temperature=temperature)
+    url = f"{openai_base_url()}/chat/completions"
+    return await _acached("chat", payload, cache, lambda: _apost(url, model, payload, timeout, _chat_result))
+
+
+def hedge_delay(model: str | None = None) -> float | None:
+    """Seconds before the fallback is fired alongside `model`; None = only after it failed."""
+    value = getattr(settings, "LLM_HEDGE_DELAY", None)
+    if value is None or float(value) < 0:
+        return None
+    if model and model.lower().startswith("o"):
+        return None  # reasoning models are slow by design, not unhealthy
+    return float(value)
+
+
+async def hedged(primary, fallback, delay: float | None) -> dict:
+    """Await primary(); start fallback() after `delay` (or once primary failed); first ok result wins."""
+    first = asyncio.ensure_future(primary())
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done and first.result().get("ok"):
+        return first.result()
+    second = asyncio.ensure_future(fallback())
+    pending = {first, second}
+    failed: dict = {}
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            result = task.result()
+            if result.get("ok"):
+                for other in pending:
+                    other.cancel()
+                return result
+            failed[task] = result
+    # Both failed: report the primary's error
+    return failed[first]
+
+
+@_on_runtime
+async def agenerate_with_fallback(*, model: str, fallback_model: str, system_text: str, user_text: str, max_output_tokens: int = 512, temperature: float = 0.7, reasoning_effort: str | None = None, timeout: float = 35, cache: str | None = None) -> dict:
+    async def primary() -> dict:
+        result = await acall_openai_responses(
+            model=model,
+            system_text=system_text,
+            user_text=user_text,
+            max_output_tokens=max_output_tokens,
+            temperature=temperature,
+            reasoning_effort=reasoning_effort,
+            timeout=timeout,
+            cache=cache,
+        )
+        return {**result, "model": model, "endpoint": "responses"}
+
+    async def fallback() -> dict:
+        result = await acall_openai_chat_completions(
+            model=fallback_model,
+            messages=[
+                {"role": "system", "content": system_text},
+                {"role": "user", "content": user_text},
+            ],
+            max_tokens=max_output_tokens,
+            temperature=temperature,
+            timeout=timeout,
+            cache=cache,
+        )
+        return {**result, "model": fallback_model, "endpoint": "chat"}
+
+    return await hedged(primary, fallback, hedge_delay(model))
+
+
+def generate_with_fallback(**kwargs) -> dict:
+    """
+    Responses API with a Chat Completions fallback (see agenerate_with_fallback), from
+    sync code. The result dict also carries `model` and `endpoint` of the reply used.
+    """
+    return llm_runtime().run(agenerate_with_fallback(**kwargs))
@@ -1,17 +1,34 @@
+import base64
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import User
+from django.http import HttpRequest, HttpResponse, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.request import Request
 
 from .models import VectorizedChunk
-from .utils import text_to_vector, sentence_split, rank_by_similarity, fetch_web_results, call_openai_responses, call_openai_chat_completions, normalize_model_name
+from .cache import vector_cache
+from .retrieval import Collection, rank_collection, retrieve
+from .ingest import ingest_chunks, split_chunks
+from .llm_cache import cache_mode
+from .llm_stream import sse_event, stream_openai_chat_completions, stream_openai_responses
+from .utils import text_to_vector, fetch_web_results, generate_with_fallback, normalize_model_name, prompt_cache_usage
 from django.conf import settings
+import numpy as np
 import requests
 from api.models import BrandGuideline
 # Trustpilot support removed
 from api.models import WebsiteScrape
-from .prompt_template import build_generation_messages
+from .prompt_template import build_generation_prompt
 from api.models import LinkedInScrape
 
 
@@ -29,180 +46,291 @@ def ingest_text(request: Request) -> Response:
     if source_type not in {"guideline", "upload"} or not isinstance(source_id, int) or not text:
         return Response({"error": "Invalid payload"}, status=400)
 
-    chunks = sentence_split(text)
-    created = []
-    for chunk in chunks:
-        vec = text_to_vector(chunk)
-        obj = VectorizedChunk.objects.create(
-            user=request.user,
-            source_type=source_type,
-            source_id=source_id,
-            text=chunk,
-            vector=vec,
-        )
-        created.append(obj.id)
-    return Response({"created_ids": created}, status=201)
+    result = ingest_chunks(request.user.id, source_type, source_id, split_chunks([text]))
+    return Response({"created_ids": result.ids, "ingest": result.summary()}, status=201)
+
+
+SEARCH_MAX_TOP_K = 100
+SEARCH_MAX_WINDOW = 1000  # offset + top_k; deeper pages are not worth ranking for
+
+
+def _encode_cursor(query: str, offset: int, min_score: float | None) -> str:
+    payload = {"q": hashlib.sha1(query.encode("utf-8")).hexdigest()[:12], "o": offset, "m": min_score}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, query: str) -> tuple[int, float | None] | None:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if payload["q"] != hashlib.sha1(query.encode("utf-8")).hexdigest()[:12]:
+            return None
+        return int(payload["o"]), (None if payload.get("m") is None else float(payload["m"]))
+    except (ValueError, KeyError, TypeError):
+        return None
 
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def search(request: Request) -> Response:
     """
-    Simple vector search. Body JSON: { "query": "...", "top_k": 5 }
-    Returns: list of { id, text, source_type, source_id, score }
+    Vector search. Body JSON:
+    { "query": "...", "top_k": 5, "offset": 0, "cursor": "...", "min_score": 0.2 }
+    Returns results in rank order: list of { id, text, source_type, source_id, score },
+    plus `next_cursor` (pass it back with the same query to get the next page).
     """
     data = request.data or {}
     query = data.get("query")
-    top_k = int(data.get("top_k") or 5)
-    use_web = bool(data.get("use_web"))
-    web_company = (data.get("web_company") or "").strip()
-    user_links = data.get("user_links") or []
-    if not isinstance(user_links, list):
-        user_links = []
-    model = (data.get("model") or "gpt-3.5-turbo").strip()
     if not query:
         return Response({"error": "Missing query"}, status=400)
+    try:
+        top_k = min(max(int(data.get("top_k") or 5), 1), SEARCH_MAX_TOP_K)
+        offset = max(int(data.get("offset") or 0), 0)
+        min_score = None if data.get("min_score") in (None, "") else float(data.get("min_score"))
+    except (TypeError, ValueError):
+        return Response({"error": "top_k, offset and min_score must be numbers"}, status=400)
+    if data.get("cursor"):
+        decoded = _decode_cursor(str(data.get("cursor")), query)
+        if decoded is None:
+            return Response({"error": "Invalid cursor"}, status=400)
+        offset, min_score = decoded
+    if offset >= SEARCH_MAX_WINDOW:
+        return Response({"results": [], "offset": offset, "next_cursor": None})
+    window = min(offset + top_k, SEARCH_MAX_WINDOW)
+
+    q = np.asarray(text_to_vector(query), dtype=np.float32)
+    # Ask for one extra hit so we know whether another page exists
+    ranked = rank_collection(request.user.id, q, top_k=window + 1)
+    if min_score is not None:
+        # ranked is sorted by score, so the threshold is a prefix cut
+        ranked = [(idx, score) for idx, score in ranked if score >= min_score]
+    page = ranked[offset:window]
+    has_more = len(ranked) > window and window < SEARCH_MAX_WINDOW
+
+    # Only the page's rows are loaded, and never their vectors
+    rows = VectorizedChunk.objects.only("id", "text", "source_type", "source_id").in_bulk([idx for idx, _ in page])
+    results = [
+        {
+            "id": idx,
+            "text": rows[idx].text,
+            "source_type": rows[idx].source_type,
+            "source_id": rows[idx].source_id,
+            "score": round(float(score), 6),
+        }
+        for idx, score in page
+        if idx in rows
+    ]
+    return Response({
+        "results": results,
+        "offset": offset,
+        "next_cursor": _encode_cursor(query, window, min_score) if has_more else None,
+    })
 
-    chunks = list(VectorizedChunk.objects.filter(user=request.user).values("id", "vector", "text", "source_type", "source_id"))
-    if not chunks:
-        return Response({"results": []})
 
-    vectors = [(c["id"], c["vector"]) for c in chunks]
-    idxs = rank_by_similarity(query, vectors, [c["text"] for c in chunks], top_k=top_k)
-    id_set = set(idxs)
-    # Keep original ordering by similarity
-    ordered = [c for c in chunks if c["id"] in id_set]
-    return Response({"results": ordered})
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def cache_stats(request: Request) -> Response:
+    """Hit/miss counters and memory usage of this worker's vector matrix cache."""
+    return Response(vector_cache.stats())
 
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def chat(request: Request) -> Response:
     """
-    Minimal chat endpoint. Body: { prompt }
+    Minimal chat endpoint. Body: { prompt, cache: "prefer"|"bypass" }
     Uses OpenAI if OPENAI_API_KEY present; otherwise returns an echo.
     """
     data = request.data or {}
     prompt = (data.get("prompt") or "").strip()
     if not prompt:
         return Response({"error": "Missing prompt"}, status=400)
+    mode = cache_mode(data.get("cache"))
 
     api_key = getattr(settings, "OPENAI_API_KEY", None)
     if api_key:
         try:
-            # Minimal two-message exchange through Responses API, using default model
+            # Minimal two-message exchange through Responses API, using default model,
+            # with Chat Completions as the fallback for resiliency
             model = normalize_model_name("gpt-4o")
-            result = call_openai_responses(
+            result = generate_with_fallback(
                 model=model,
+                fallback_model=model,
                 system_text="You are a concise helpful assistant.",
                 user_text=prompt,
                 max_output_tokens=128,
                 temperature=0.7,
+                cache=mode,
             )
             if not result.get("ok"):
-                # Fallback to Chat Completions for resiliency
-                cc = call_openai_chat_completions(
-                    model=normalize_model_name("gpt-4o"),
-                    messages=[
-                        {"role": "system", "content": "You are a concise helpful assistant."},
-                        {"role": "user", "content": prompt},
-                    ],
-                    max_tokens=128,
-                    temperature=0.7,
-                )
-                if cc.get("ok"):
-                    return Response({"reply": cc.get("text") or ""})
-                return Response({"reply": f"LLM error, echoing: {prompt}", "error": (result.get("error") or cc.get("error") or "unknown")})
-            return Response({"reply": result.get("text") or ""})
+                return Response({"reply": f"LLM error, echoing: {prompt}", "error": (result.get("error") or "unknown")})
+            return Response({
+                "reply": result.get("text") or "",
+                "selected_model": result.get("model"),
+                "endpoint": result.get("endpoint"),
+                "llm_cache": {"mode": mode, "hit": bool(result.get("cached"))},
+            })
         except Exception as e:
             return Response({"reply": f"LLM error, echoing: {prompt}", "error": str(e)})
 
     return Response({"reply": f"Echo: {prompt}"})
 
 
-@api_view(["POST"])
-@permission_classes([IsAuthenticated])
-def generate(request: Request) -> Response:
-    """
-    Enriched generation endpoint using prompt template with:
-    - ALL brand guidelines (no RAG)
-    - RAG (vector) search ONLY over uploaded campaigns for similar examples
-    Body: { "prompt": "...", "top_k": 5 }
-    """
-    data = request.data or {}
+@dataclass
+class GenerationContext:
+    """Everything the generate endpoints send to the model and echo back for auditing."""
+
+    prompt: str
+    content_type: str
+    model: str
+    reasoning_effort: str
+    cache_mode: str
+    messages: list[dict]
+    prompt_tokens: dict
+    tone: list[str]
+    terminology: list[str]
+    style: list[str]
+    rules: list[str]
+    rag_uploads: list[str]
+    rag_websites: list[str]
+    rag_uploads_examples: list[dict]
+    rag_websites_examples: list[dict]
+    web_results: list[dict]
+    used_assistants_web_flag: bool
+    assistant_model_label: str | None
+    steps_raw: list[dict]
+    used_linkedin: bool
+    linkedin_context_preview: str
+    used_trustpilot: bool
+    trustpilot_context_preview: str
+    brand_guidelines_out: dict
+    latest_ws: WebsiteScrape | None
+
+    @property
+    def used_channel_examples(self) -> dict:
+        count = 2 if (self.content_type or "") == "blog" else min(5, len(self.rag_uploads_examples) + len(self.rag_websites_examples))
+        return {"channel": self.content_type or "linkedin", "count": count}
+
+    def llm_cache(self, hit: bool) -> dict:
+        return {"mode": self.cache_mode, "hit": bool(hit)}
+
+    def prompt_cache(self, usage: dict | None) -> dict | None:
+        """Provider prompt-cache usage of the reply, with the prompt's cacheable prefix size."""
+        if usage is None:
+            return None
+        return {**usage, "layout": self.prompt_tokens.get("layout"), "prefix_tokens": self.prompt_tokens.get("prefix_tokens")}
+
+    def audit(self) -> dict:
+        """Fields echoed back with every model reply so the frontend can inspect exactly what was used."""
+        return {
+            "rag_uploads_examples": self.rag_uploads_examples,
+            "rag_websites_examples": self.rag_websites_examples,
+            "web_results": self.web_results,
+            "used_assistants_web": self.used_assistants_web_flag,
+            "assistant_steps": self.steps_raw,
+            "assistant_model": self.assistant_model_label,
+            "used_linkedin": self.used_linkedin,
+            "linkedin_context_preview": self.linkedin_context_preview,
+            "used_trustpilot": self.used_trustpilot,
+            "trustpilot_context_preview": self.trustpilot_context_preview,
+            "used_channel_examples": self.used_channel_examples,
+            "brand_guidelines": self.brand_guidelines_out,
+            "prompt_messages": self.messages,
+            "prompt_tokens": self.prompt_tokens,
+        }
+
+    def synthetic_reply(self) -> str:
+        """Reply without an API key: the constructed template context, minimally."""
+        combined_similar = (self.rag_uploads + self.rag_websites)
+        return "\n\n".join([
+            "[Tone] " + " | ".join(self.tone) if self.tone else "",
+            "[Terminology] " + " | ".join(self.terminology) if self.terminology else "",
+            "[Style] " + " | ".join(self.style) if self.style else "",
+            "[Rules] " + " | ".join(self.rules) if self.rules else "",
+            "[Similar] " + " | ".join(combined_similar) if combined_similar else "",
+            "[Request] " + self.prompt,
+        ]).strip()
+
+
+def _generation_options(data) -> dict | None:
+    """Request options shared by generate and generate_stream; None when the prompt is missing."""
     prompt = (data.get("prompt") or "").strip()
-    content_type = (data.get("content_type") or "").strip().lower()
-    top_k = int(data.get("top_k") or 5)
-    # Options for model, web usage, and directed web search
-    use_web = bool(data.get("use_web"))
-    model = (data.get("model") or "gpt-4o").strip()
-    reasoning_effort = (data.get("reasoning_effort") or "").strip().lower()
-    web_company = (data.get("web_company") or "").strip()
-    user_links = data.get("user_links") or []
-    if not isinstance(user_links, list):
-        user_links = []
     if not prompt:
-        return Response({"error": "Missing prompt"}, status=400)
+        return None
+    user_links = data.get("user_links") or []
+    return {
+        "prompt": prompt,
+        "content_type": (data.get("content_type") or "").strip().lower(),
+        "top_k": int(data.get("top_k") or 5),
+        # Options for model, web usage, and directed web search
+        "use_web": bool(data.get("use_web")),
+        "model": (data.get("model") or "gpt-4o").strip(),
+        "reasoning_effort": (data.get("reasoning_effort") or "").strip().lower(),
+        "web_company": (data.get("web_company") or "").strip(),
+        "user_links": user_links if isinstance(user_links, list) else [],
+        # LLM result cache: "prefer" answers identical requests from the cache, "bypass" regenerates
+        "cache": cache_mode(data.get("cache")),
+    }
+
 
+def build_generation_context(
+    user,
+    *,
+    prompt: str,
+    content_type: str,
+    top_k: int,
+    use_web: bool,
+    model: str,
+    reasoning_effort: str,
+    web_company: str,
+    user_links: list,
+    cache: str,
+) -> GenerationContext:
+    """
+    Prompt template input for a generation:
+    - ALL brand guidelines (no RAG)
+    - RAG (vector) search over uploaded campaigns and the latest website scrape
+    """
     # Load all brand guidelines for the user and categorize
-    qs = BrandGuideline.objects.filter(user=request.user)
+    qs = BrandGuideline.objects.filter(user=user)
     tone = [bg.content for bg in qs.filter(guideline_type="tone")]
     terminology = [bg.content for bg in qs.filter(guideline_type="terminology")]
     style = [bg.content for bg in qs.filter(guideline_type="style")]
     rules = [bg.content for bg in qs.filter(guideline_type="rules")]
 
-    # RAG over uploads and websites separately
-    uploads_chunks = list(
-        VectorizedChunk.objects.filter(user=request.user, source_type="upload").values(
-            "id", "vector", "text", "source_id"
-        )
+    # RAG over uploads and the most recent website scrape (avoids mixing old sites),
+    # from one embedding and one pass over the user's vectors
+    q = np.asarray(text_to_vector(prompt), dtype=np.float32)
+    latest_ws = WebsiteScrape.objects.filter(user=user).order_by("-created_at").first()
+    hits = retrieve(user.id, q, [
+        Collection("upload", "upload", quota=top_k),
+        Collection("website", "website", source_id=latest_ws.id if latest_ws else None, quota=top_k),
+    ])
+    chunk_map = VectorizedChunk.objects.only("id", "text", "source_id").in_bulk(
+        [idx for coll_hits in hits.values() for idx, _ in coll_hits]
     )
-    # Prefer the most recent website scrape's chunks to avoid mixing old sites
-    latest_ws = WebsiteScrape.objects.filter(user=request.user).order_by("-created_at").first()
-    website_chunks_qs = VectorizedChunk.objects.filter(user=request.user, source_type="website")
-    if latest_ws:
-        website_chunks_qs = website_chunks_qs.filter(source_id=latest_ws.id)
-    websites_chunks = list(website_chunks_qs.values("id", "vector", "text", "source_id"))
-
-    rag_uploads: list[str] = []
-    rag_uploads_examples: list[dict] = []
-    if uploads_chunks:
-        u_vectors = [(c["id"], c["vector"]) for c in uploads_chunks]
-        u_texts = [c["text"] for c in uploads_chunks]
-        u_idxs = rank_by_similarity(prompt, u_vectors, u_texts, top_k=top_k)
-        u_map = {c["id"]: c for c in uploads_chunks}
-        for idx in u_idxs:
-            ch = u_map.get(idx)
-            if ch:
-                rag_uploads.append(ch["text"])
-                rag_uploads_examples.append({
-                    "chunk_id": ch["id"],
-                    "source_type": "upload",
-                    "source_id": ch["source_id"],
-                    "text": ch["text"],
-                })
 
-    rag_websites: list[str] = []
-    rag_websites_examples: list[dict] = []
-    if websites_chunks:
-        w_vectors = [(c["id"], c["vector"]) for c in websites_chunks]
-        w_texts = [c["text"] for c in websites_chunks]
-        w_idxs = rank_by_similarity(prompt, w_vectors, w_texts, top_k=top_k)
-        w_map = {c["id"]: c for c in websites_chunks}
-        for idx in w_idxs:
-            ch = w_map.get(idx)
+    def _examples(name: str) -> tuple[list[str], list[dict]]:
+        texts: list[str] = []
+        examples: list[dict] = []
+        for idx, _ in hits[name]:
+            ch = chunk_map.get(idx)
             if ch:
-                rag_websites.append(ch["text"])
-                rag_websites_examples.append({
-                    "chunk_id": ch["id"],
-                    "source_type": "website",
-                    "source_id": ch["source_id"],
-                    "text": ch["text"],
+                texts.append(ch.text)
+                examples.append({
+                    "chunk_id": ch.id,
+                    "source_type": name,
+                    "source_id": ch.source_id,
+                    "text": ch.text,
                 })
+        return texts, examples
+
+    rag_uploads, rag_uploads_examples = _examples("upload")
+    rag_websites, rag_websites_examples = _examples("website")
 
     # Include latest LinkedIn/Trustpilot content (if any) as additional example context
     linkedin_texts = list(
-        LinkedInScrape.objects.filter(user=request.user)
+        LinkedInScrape.objects.filter(user=user)
         .order_by("-created_at")
         .values_list("content", flat=True)[:1]
     )
@@ -242,7 +370,8 @@ def generate(request: Request) -> Response:
             },
         ]
 
-    messages = build_generation_messages(
+    # Sections are fitted into the model's prompt token budget (rules first, channel examples last)
+    messages, prompt_tokens = build_generation_prompt(
         user_request=prompt,
         content_type=content_type,
         tone_guidelines=tone,
@@ -255,6 +384,7 @@ def generate(request: Request) -> Response:
         website_context=rag_websites,
         web_results=web_results,
         web_search_directives=web_search_directives,
+        model=normalize_model_name(model),
     )
 
     # Prepare audit payload so the frontend can inspect exactly what was used
@@ -265,117 +395,213 @@ def generate(request: Request) -> Response:
         "rules": rules,
     }
 
+    return GenerationContext(
+        prompt=prompt,
+        content_type=content_type,
+        model=model,
+        reasoning_effort=reasoning_effort,
+        cache_mode=cache,
+        messages=messages,
+        prompt_tokens=prompt_tokens,
+        tone=tone,
+        terminology=terminology,
+        style=style,
+        rules=rules,
+        rag_uploads=rag_uploads,
+        rag_websites=rag_websites,
+        rag_uploads_examples=rag_uploads_examples,
+        rag_websites_examples=rag_websites_examples,
+        web_results=web_results,
+        used_assistants_web_flag=used_assistants_web_flag,
+        assistant_model_label=assistant_model_label,
+        steps_raw=steps_raw,
+        used_linkedin=used_linkedin,
+        linkedin_context_preview=linkedin_context_preview,
+        used_trustpilot=used_trustpilot,
+        trustpilot_context_preview=trustpilot_context_preview,
+        brand_guidelines_out=brand_guidelines_out,
+        latest_ws=latest_ws,
+    )
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def generate(request: Request) -> Response:
+    """
+    Enriched generation endpoint using prompt template with:
+    - ALL brand guidelines (no RAG)
+    - RAG (vector) search ONLY over uploaded campaigns for similar examples
+    Body: { "prompt": "...", "top_k": 5, "cache": "prefer"|"bypass" }
+    """
+    options = _generation_options(request.data or {})
+    if options is None:
+        return Response({"error": "Missing prompt"}, status=400)
+    ctx = build_generation_context(request.user, **options)
+
     api_key = getattr(settings, "OPENAI_API_KEY", None)
     if api_key:
         try:
             # Unify on Responses API for all models
-            selected_model = normalize_model_name(model)
-            system_text = messages[0]["content"] if messages else ""
-            user_text = messages[1]["content"] if len(messages) > 1 else prompt
+            selected_model = normalize_model_name(ctx.model)
+            system_text = ctx.messages[0]["content"] if ctx.messages else ""
+            user_text = ctx.messages[1]["content"] if len(ctx.messages) > 1 else ctx.prompt
 
-            result = call_openai_responses(
+            # Fallback to Chat Completions when the Responses call fails (and, with
+            # LLM_HEDGE_DELAY set, when a non-reasoning model is still running after it)
+            fallback_model = selected_model if not selected_model.lower().startswith("o") else "gpt-4o"
+            result = generate_with_fallback(
                 model=selected_model,
+                fallback_model=fallback_model,
                 system_text=system_text,
                 user_text=user_text,
                 max_output_tokens=512,
                 temperature=0.7,
-                reasoning_effort=(reasoning_effort or None),
+                reasoning_effort=(ctx.reasoning_effort or None),
                 timeout=35,
+                cache=ctx.cache_mode,
             )
-            if not result.get("ok"):
-                # Fallback to Chat Completions for non-reasoning models
-                fallback_model = selected_model if not selected_model.lower().startswith("o") else "gpt-4o"
-                cc = call_openai_chat_completions(
-                    model=fallback_model,
-                    messages=[
-                        {"role": "system", "content": system_text},
-                        {"role": "user", "content": user_text},
-                    ],
-                    max_tokens=512,
-                    temperature=0.7,
-                    timeout=35,
-                )
-                if cc.get("ok"):
-                    return Response({
-                        "reply": cc.get("text") or "",
-                        "rag_uploads_examples": rag_uploads_examples,
-                        "rag_websites_examples": rag_websites_examples,
-                        "web_results": web_results,
-                        "used_assistants_web": used_assistants_web_flag,
-                        "assistant_steps": steps_raw,
-                        "assistant_model": assistant_model_label,
-                        "used_linkedin": used_linkedin,
-                        "linkedin_context_preview": linkedin_context_preview,
-                        "used_trustpilot": used_trustpilot,
-                        "trustpilot_context_preview": trustpilot_context_preview,
-                        "used_channel_examples": {"channel": content_type or "linkedin", "count": 2 if (content_type or "") == "blog" else min(5,  len(rag_uploads_examples) + len(rag_websites_examples))},
-                        "brand_guidelines": brand_guidelines_out,
-                        "prompt_messages": messages,
-                        "selected_model": fallback_model,
-                    })
-                # Fall-through to error response below if both fail
-
             return Response({
-                "reply": (result.get("text") or "") if result.get("ok") else f"LLM error, echoing: {prompt}",
+                "reply": (result.get("text") or "") if result.get("ok") else f"LLM error, echoing: {ctx.prompt}",
                 "error": None if result.get("ok") else (result.get("error") or "unknown"),
-                "rag_uploads_examples": rag_uploads_examples,
-                "rag_websites_examples": rag_websites_examples,
-                "web_results": web_results,
-                "used_assistants_web": used_assistants_web_flag,
-                "assistant_steps": steps_raw,
-                "assistant_model": assistant_model_label,
-                "used_linkedin": used_linkedin,
-                "linkedin_context_preview": linkedin_context_preview,
-                "used_trustpilot": used_trustpilot,
-                "trustpilot_context_preview": trustpilot_context_preview,
-                "used_channel_examples": {"channel": content_type or "linkedin", "count": 2 if (content_type or "") == "blog" else min(5,  len(rag_uploads_examples) + len(rag_websites_examples))},
-                "brand_guidelines": brand_guidelines_out,
-                "prompt_messages": messages,
-                "selected_model": selected_model,
+                **ctx.audit(),
+                # The model and endpoint that produced the reply (the fallback's when it answered)
+                "selected_model": result.get("model") or selected_model,
+                "endpoint": result.get("endpoint"),
+                "llm_cache": ctx.llm_cache(result.get("cached")),
+                # None for llm_cache hits: no provider call was made
+                "prompt_cache": None if result.get("cached") else ctx.prompt_cache(prompt_cache_usage(result.get("raw"))),
             })
         except Exception as e:
             return Response({
-                "reply": f"LLM error, echoing: {prompt}",
+                "reply": f"LLM error, echoing: {ctx.prompt}",
                 "error": str(e),
-                "rag_uploads_examples": rag_uploads_examples,
-                "rag_websites_examples": rag_websites_examples,
-                "web_results": web_results,
+                "rag_uploads_examples": ctx.rag_uploads_examples,
+                "rag_websites_examples": ctx.rag_websites_examples,
+                "web_results": ctx.web_results,
                 "used_assistants_web": False,
-                "used_linkedin": used_linkedin,
-                "linkedin_context_preview": linkedin_context_preview,
-                "used_trustpilot": used_trustpilot,
-                "trustpilot_context_preview": trustpilot_context_preview,
-                "brand_guidelines": brand_guidelines_out,
-                "prompt_messages": messages,
+                "used_linkedin": ctx.used_linkedin,
+                "linkedin_context_preview": ctx.linkedin_context_preview,
+                "used_trustpilot": ctx.used_trustpilot,
+                "trustpilot_context_preview": ctx.trustpilot_context_preview,
+                "brand_guidelines": ctx.brand_guidelines_out,
+                "prompt_messages": ctx.messages,
+                "prompt_tokens": ctx.prompt_tokens,
             })
 
-    # Fallback echo uses the constructed template context minimally
-    combined_similar = (rag_uploads + rag_websites)
-    synthetic = "\n\n".join([
-        "[Tone] " + " | ".join(tone) if tone else "",
-        "[Terminology] " + " | ".join(terminology) if terminology else "",
-        "[Style] " + " | ".join(style) if style else "",
-        "[Rules] " + " | ".join(rules) if rules else "",
-        "[Similar] " + " | ".join(combined_similar) if combined_similar else "",
-        "[Request] " + prompt,
-    ])
     return Response({
-        "reply": synthetic.strip(),
-        "rag_uploads_examples": rag_uploads_examples,
-        "rag_websites_examples": rag_websites_examples,
-        "web_results": web_results,
+        # Fallback echo uses the constructed template context minimally
+        "reply": ctx.synthetic_reply(),
+        "rag_uploads_examples": ctx.rag_uploads_examples,
+        "rag_websites_examples": ctx.rag_websites_examples,
+        "web_results": ctx.web_results,
         "website_scrape_used": ({
-            "id": latest_ws.id,
-            "url": latest_ws.url,
-            "created_at": latest_ws.created_at.isoformat(),
-        } if latest_ws else None),
-        "used_linkedin": used_linkedin,
-        "linkedin_context_preview": linkedin_context_preview,
-        "used_trustpilot": used_trustpilot,
-        "trustpilot_context_preview": trustpilot_context_preview,
-        "used_channel_examples": {"channel": content_type or "linkedin", "count": 2 if (content_type or "") == "blog" else 0},
-        "brand_guidelines": brand_guidelines_out,
-        "prompt_messages": messages,
+            "id": ctx.latest_ws.id,
+            "url": ctx.latest_ws.url,
+            "created_at": ctx.latest_ws.created_at.isoformat(),
+        } if ctx.latest_ws else None),
+        "used_linkedin": ctx.used_linkedin,
+        "linkedin_context_preview": ctx.linkedin_context_preview,
+        "used_trustpilot": ctx.used_trustpilot,
+        "trustpilot_context_preview": ctx.trustpilot_context_preview,
+        "used_channel_examples": {"channel": ctx.content_type or "linkedin", "count": 2 if (ctx.content_type or "") == "blog" else 0},
+        "brand_guidelines": ctx.brand_guidelines_out,
+        "prompt_messages": ctx.messages,
+        "prompt_tokens": ctx.prompt_tokens,
     })
 
 
+
+
+def _jwt_user(request: HttpRequest):
+    # generate_stream is a plain async Django view (DRF views are sync), so it runs
+    # the API's JWT authentication itself
+    try:
+        authenticated = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return authenticated[0] if authenticated else None
+
+
+async def _generation_events(ctx: GenerationContext) -> AsyncIterator[bytes]:
+    yield sse_event("context", ctx.audit())
+    if not getattr(settings, "OPENAI_API_KEY", None):
+        reply = ctx.synthetic_reply()
+        yield sse_event("delta", {"text": reply})
+        yield sse_event("done", {"reply": reply, "selected_model": None})
+        return
+
+    selected_model = normalize_model_name(ctx.model)
+    system_text = ctx.messages[0]["content"] if ctx.messages else ""
+    user_text = ctx.messages[1]["content"] if len(ctx.messages) > 1 else ctx.prompt
+    # Fallback to Chat Completions for non-reasoning models, as in generate
+    fallback_model = selected_model if not selected_model.lower().startswith("o") else "gpt-4o"
+    attempts = [
+        (selected_model, "responses", lambda: stream_openai_responses(
+            model=selected_model,
+            system_text=system_text,
+            user_text=user_text,
+            max_output_tokens=512,
+            temperature=0.7,
+            reasoning_effort=(ctx.reasoning_effort or None),
+            cache=ctx.cache_mode,
+        )),
+        (fallback_model, "chat", lambda: stream_openai_chat_completions(
+            model=fallback_model,
+            messages=[
+                {"role": "system", "content": system_text},
+                {"role": "user", "content": user_text},
+            ],
+            max_tokens=512,
+            temperature=0.7,
+            cache=ctx.cache_mode,
+        )),
+    ]
+    error = None
+    for model_name, endpoint, start in attempts:
+        sent = False
+        async for event in start():
+            if event["type"] == "delta":
+                sent = True
+                yield sse_event("delta", {"text": event["text"]})
+            elif event["type"] == "done":
+                yield sse_event("done", {
+                    "reply": event["text"],
+                    "selected_model": model_name,
+                    "endpoint": endpoint,
+                    "llm_cache": ctx.llm_cache(event.get("cached")),
+                    "prompt_cache": ctx.prompt_cache(event.get("usage")),
+                })
+                return
+            else:
+                error = event["error"]
+        if sent:
+            break  # tokens already reached the client; a fallback would repeat them
+    yield sse_event("error", {"error": error or "unknown", "reply": f"LLM error, echoing: {ctx.prompt}"})
+
+
+@csrf_exempt
+async def generate_stream(request: HttpRequest) -> HttpResponse:
+    """
+    Streaming variant of generate (same body) as Server-Sent Events:
+    `context` with the retrieval/audit payload first, then `delta` {text} as tokens
+    arrive, and finally `done` {reply, selected_model, endpoint, llm_cache, prompt_cache} or `error` {error, reply}.
+    The view is async, so under ASGI (core/asgi.py) an open stream holds no thread.
+    """
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    user = await sync_to_async(_jwt_user)(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+    options = _generation_options(data) if isinstance(data, dict) else None
+    if options is None:
+        return JsonResponse({"error": "Missing prompt"}, status=400)
+    ctx = await sync_to_async(build_generation_context)(user, **options)
+
+    response = StreamingHttpResponse(_generation_events(ctx), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx: pass events through unbuffered
+    return response